@@ -0,0 +1,233 @@
+'''
+Серверные игровые сессии: история ходов, память и персонажи игры хранятся в game_sessions,
+и на ходу клиент шлёт только id игры и действие — размер запроса не растёт с длиной игры.
+Копия лежит в story-ai и ai-story — копии должны совпадать; engine разделяет их сессии
+(у функций разный формат истории).
+    session = start('story-ai', game_id, settings, history)          # полное состояние от клиента
+    session = load('story-ai', game_id, version=client_version)      # ход: None — клиент шлёт состояние заново
+    version = append(session, [{'user': action, 'ai': story}])
+Горячий кеш — последние сессии экземпляра в памяти. Клиент возвращает версию из прошлого ответа:
+совпала с кешем — база не нужна, иначе (ход ушёл на другой экземпляр) сессия читается из базы.
+Сессия принадлежит пользователю, который её создал (request_owner): чужой или анонимный запрос
+к ней получает SessionForbidden, и в базе сессия ищется и меняется только вместе с владельцем.
+Без DATABASE_URL сессии живут только в памяти — для локального запуска и бенчмарков
+'''
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+from timing import connect_db, span
+
+HOT_TTL = 1800  # 30 минут
+HOT_LIMIT = 200
+
+_hot: 'OrderedDict[Tuple[str, str], Tuple[float, Dict[str, Any]]]' = OrderedDict()
+_lock = threading.Lock()
+
+
+class SessionForbidden(Exception):
+    pass
+
+
+def is_enabled() -> bool:
+    return bool(os.environ.get('DATABASE_URL'))
+
+
+def _remember(session: Dict[str, Any]):
+    key = (session['engine'], session['game_id'])
+    with _lock:
+        _hot[key] = (time.time(), session)
+        _hot.move_to_end(key)
+        while len(_hot) > HOT_LIMIT:
+            _hot.popitem(last=False)
+
+
+def _forget(engine: str, game_id: str):
+    with _lock:
+        _hot.pop((engine, game_id), None)
+
+
+def _from_hot(engine: str, game_id: str) -> Optional[Dict[str, Any]]:
+    key = (engine, game_id)
+    with _lock:
+        entry = _hot.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry[0] >= HOT_TTL:
+            del _hot[key]
+            return None
+        _hot.move_to_end(key)
+        return entry[1]
+
+
+def authenticate(event: Dict[str, Any]) -> Tuple[Optional[str], bool]:
+    '''
+    Пользователь запроса и признак того, что он подтверждён токеном. С JWT_SECRET — только из
+    проверенного X-Auth-Token (X-User-Id должен с ним совпадать; X-User-Id без токена — SessionForbidden,
+    иначе любой выдал бы себя за другого). Без JWT_SECRET (локальный запуск) — из X-User-Id,
+    неподтверждённый. None — анонимный запрос
+    '''
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    user_id = str(headers['x-user-id']) if headers.get('x-user-id') else None
+    token = headers.get('x-auth-token')
+    secret = os.environ.get('JWT_SECRET')
+    if secret and not token:
+        if user_id:
+            raise SessionForbidden('Auth token required')
+        return None, False
+    if token and secret:
+        import jwt
+        try:
+            payload = jwt.decode(token, secret, algorithms=['HS256'])
+        except jwt.InvalidTokenError:
+            raise SessionForbidden('Invalid auth token')
+        verified = str(payload.get('user_id'))
+        if user_id and user_id != verified:
+            raise SessionForbidden('X-User-Id does not match auth token')
+        return verified, True
+    return user_id, False
+
+
+def request_owner(event: Dict[str, Any]) -> Optional[str]:
+    '''Владелец для сессий — см. authenticate'''
+    return authenticate(event)[0]
+
+
+def _check_owner(session: Dict[str, Any], owner: Optional[str]):
+    '''Сессию видит только её владелец; анонимная сессия — только анонимные запросы'''
+    if (session.get('owner') or None) != (str(owner) if owner else None):
+        raise SessionForbidden('Game session belongs to another user')
+
+
+def start(engine: str, game_id: Any, settings: Dict[str, Any], history: List[Dict[str, Any]],
+          memory: Optional[Dict[str, Any]] = None, characters: Optional[List[Dict[str, Any]]] = None,
+          owner: Optional[str] = None) -> Dict[str, Any]:
+    '''
+    Создаёт сессию или заменяет её состоянием клиента (первый ход, сессия потерялась, клиент старой версии).
+    Чужую сессию с тем же id не заменяет — SessionForbidden
+    '''
+    session = {
+        'engine': engine,
+        'game_id': str(game_id),
+        'owner': str(owner) if owner else None,
+        'settings': settings,
+        'history': list(history),
+        'memory': memory or {},
+        'characters': characters or [],
+        'version': 1
+    }
+    if is_enabled():
+        conn = connect_db(os.environ.get('DATABASE_URL'))
+        cur = conn.cursor()
+        try:
+            with span('session'):
+                cur.execute(
+                    """INSERT INTO game_sessions (engine, game_id, owner, settings, history, memory, characters)
+                       VALUES (%s, %s, %s, %s, %s, %s, %s)
+                       ON CONFLICT (engine, game_id) DO UPDATE SET
+                           settings = EXCLUDED.settings, history = EXCLUDED.history,
+                           memory = EXCLUDED.memory, characters = EXCLUDED.characters,
+                           version = game_sessions.version + 1, updated_at = CURRENT_TIMESTAMP
+                       WHERE game_sessions.owner IS NOT DISTINCT FROM EXCLUDED.owner
+                       RETURNING version""",
+                    (engine, session['game_id'], session['owner'], json.dumps(settings, ensure_ascii=False),
+                     json.dumps(session['history'], ensure_ascii=False), json.dumps(session['memory'], ensure_ascii=False),
+                     json.dumps(session['characters'], ensure_ascii=False))
+                )
+                row = cur.fetchone()
+            conn.commit()
+            if row is None:
+                # Конфликт по id, но строка другого владельца — UPDATE не сработал
+                raise SessionForbidden('Game session belongs to another user')
+            session['version'] = row[0]
+        finally:
+            cur.close()
+            conn.close()
+    else:
+        previous = _from_hot(engine, session['game_id'])
+        if previous:
+            _check_owner(previous, owner)
+            session['version'] = previous['version'] + 1
+    _remember(session)
+    return session
+
+
+def load(engine: str, game_id: Any, version: Any = None, owner: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    '''Сессия для хода; None — такой нет, клиенту нужно прислать состояние целиком; чужая — SessionForbidden'''
+    game_id = str(game_id)
+    session = _from_hot(engine, game_id)
+    if session is not None and (not is_enabled() or (version is not None and str(version) == str(session['version']))):
+        _check_owner(session, owner)
+        return session
+    if not is_enabled():
+        return None
+    conn = connect_db(os.environ.get('DATABASE_URL'))
+    cur = conn.cursor()
+    try:
+        with span('session'):
+            cur.execute(
+                """SELECT owner, settings, history, memory, characters, version
+                   FROM game_sessions WHERE engine = %s AND game_id = %s""",
+                (engine, game_id)
+            )
+            row = cur.fetchone()
+    finally:
+        cur.close()
+        conn.close()
+    if row is None:
+        _forget(engine, game_id)
+        return None
+    session = {
+        'engine': engine, 'game_id': game_id, 'owner': row[0], 'settings': row[1], 'history': row[2],
+        'memory': row[3], 'characters': row[4], 'version': row[5]
+    }
+    _remember(session)
+    _check_owner(session, owner)
+    return session
+
+
+def append(session: Dict[str, Any], entries: List[Dict[str, Any]], memory: Optional[Dict[str, Any]] = None,
+           characters: Optional[List[Dict[str, Any]]] = None) -> int:
+    '''
+    Дописывает ход. В базу уходят только новые записи (history || ...), а не вся история;
+    если между чтением и записью сессию поменял другой экземпляр, кеш сбрасывается
+    и следующий ход перечитает её из базы. Возвращает новую версию для клиента
+    '''
+    session['history'] = session['history'] + entries
+    if memory is not None:
+        session['memory'] = memory
+    if characters is not None:
+        session['characters'] = characters
+    if not is_enabled():
+        session['version'] += 1
+        _remember(session)
+        return session['version']
+
+    conn = connect_db(os.environ.get('DATABASE_URL'))
+    cur = conn.cursor()
+    try:
+        with span('session'):
+            cur.execute(
+                """UPDATE game_sessions
+                   SET history = history || %s::jsonb, memory = %s, characters = %s,
+                       version = version + 1, updated_at = CURRENT_TIMESTAMP
+                   WHERE engine = %s AND game_id = %s AND owner IS NOT DISTINCT FROM %s
+                   RETURNING version""",
+                (json.dumps(entries, ensure_ascii=False), json.dumps(session['memory'], ensure_ascii=False),
+                 json.dumps(session['characters'], ensure_ascii=False), session['engine'], session['game_id'],
+                 session['owner'])
+            )
+            row = cur.fetchone()
+        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+    if row is None or row[0] != session['version'] + 1:
+        _forget(session['engine'], session['game_id'])
+        return row[0] if row else session['version']
+    session['version'] = row[0]
+    _remember(session)
+    return session['version']
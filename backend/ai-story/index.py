@@ -1,19 +1,30 @@
 '''
 Business: AI story generation with character extraction using DeepSeek
-Args: event with httpMethod, body containing user action and game settings
-Returns: HTTP response with AI story continuation and extracted NPCs
+Args: event with httpMethod, body containing user action and game settings; once the game session
+      is stored server-side, just gameId, action (agentPrompt) and sessionVersion from the previous response;
+      universeId on the first turn of a game started from a canon universe preset;
+      queryStringParameters action=refill-openings (POST, X-Refill-Token) tops up the opening-scene pool
+Returns: HTTP response with AI story continuation, extracted NPCs and sessionVersion when gameId is set
 '''
 
 import json
 import os
-import re
 import hashlib
+import threading
 import time
-from typing import Dict, Any, List
-from openai import OpenAI
-import httpx
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+from keyword_matcher import LemmaMatcher
+from npc_extractor import NpcExtractor
+import npc_registry
+import game_sessions
+import opening_pool
+import metrics
+from response import json_response, preflight
+from timing import instrument, note, span, timed
 
 DEEPSEEK_API_KEY = os.environ.get('DEEPSEEK_API_KEY', '')
+DEEPSEEK_BASE_URL = os.environ.get('DEEPSEEK_BASE_URL', 'https://api.deepseek.com')
 
 # Кеш
 CACHE: Dict[str, tuple] = {}
@@ -35,31 +46,75 @@ def save_to_cache(key: str, value: Dict):
     CACHE[key] = (time.time(), value)
     if len(CACHE) > 50:
         current_time = time.time()
-        expired_keys = [k for k, (t, _) in CACHE.items() if current_time - t >= CACHE_TTL]
+        # Кеш пишет и фоновое пополнение пула сцен — обходим копию
+        expired_keys = [k for k, (t, _) in list(CACHE.items()) if current_time - t >= CACHE_TTL]
         for k in expired_keys:
-            del CACHE[k]
+            CACHE.pop(k, None)
+    metrics.set_gauge('cache_entries', len(CACHE), function='ai-story')
 
+# Пополнение пула первых сцен идёт в фоне, по одной вселенной за раз
+REFILL_POOL = ThreadPoolExecutor(max_workers=1)
+_refill_queued = set()
+_refill_lock = threading.Lock()
+
+def generate_opening(action: str, settings: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    '''Первая сцена для пула; фоллбэк (API недоступен) в пул не попадает'''
+    result = generate_story_continuation(action, settings, [])
+    return result if 'decisionAnalysis' in result else None
+
+def refill_openings(universe_id: Any = None):
+    try:
+        added = opening_pool.refill(generate_opening, universe_id)
+        metrics.inc('opening_pool_generated_total', added, function='ai-story')
+    except Exception as e:
+        print(f"Opening pool refill failed: {type(e).__name__} - {e}")
+    finally:
+        with _refill_lock:
+            _refill_queued.discard(universe_id)
+
+def schedule_refill(universe_id: Any):
+    '''Ставит пополнение в очередь, если для этой вселенной оно ещё не ждёт'''
+    with _refill_lock:
+        if universe_id in _refill_queued:
+            return
+        _refill_queued.add(universe_id)
+    REFILL_POOL.submit(refill_openings, universe_id)
+
+def take_opening(universe_id: Any, settings: Dict[str, Any], action: str) -> Optional[Dict[str, Any]]:
+    '''Готовая сцена из пула для первого хода; пул пополняется в фоне и после попадания, и после промаха'''
+    try:
+        opening = opening_pool.take(universe_id, settings, action)
+    except Exception as e:
+        print(f"Opening pool take failed: {type(e).__name__} - {e}")
+        return None
+    note(opening_pool='hit' if opening else 'miss')
+    metrics.inc('opening_pool_requests_total', function='ai-story', outcome='hit' if opening else 'miss')
+    schedule_refill(int(universe_id))
+    return opening
+
+@instrument('ai-story')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'POST')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
+        return preflight('GET, POST, OPTIONS', 'Content-Type, X-User-Id, X-Auth-Token')
+    
+    if method == 'GET':
+        return list_game_npcs(event)
     
     if method != 'POST':
-        return {
-            'statusCode': 405,
-            'headers': {'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
+        return json_response(405, {'error': 'Method not allowed'})
+    
+    # Отдельный запуск пополнения пула — только планировщику: генерации тратят бюджет LLM,
+    # поэтому без OPENING_POOL_REFILL_TOKEN эндпоинт закрыт
+    if (event.get('queryStringParameters') or {}).get('action') == 'refill-openings':
+        token = os.environ.get('OPENING_POOL_REFILL_TOKEN')
+        headers = event.get('headers') or {}
+        if not token or headers.get('X-Refill-Token', headers.get('x-refill-token')) != token:
+            return json_response(403, {'error': 'Invalid refill token'})
+        if not opening_pool.is_enabled():
+            return json_response(200, {'added': 0})
+        return json_response(200, {'added': opening_pool.refill(generate_opening)})
     
     body_data = json.loads(event.get('body', '{}'))
     
@@ -67,43 +122,177 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     game_settings: Dict = body_data.get('settings', {})
     history: List[Dict] = body_data.get('history', [])
     
-    ai_response = generate_story_continuation(user_action, game_settings, history)
+    game_id = body_data.get('gameId')
+    
+    # Новая игра по пресету канонической вселенной — первая сцена может быть уже готова
+    opening = None
+    universe_id = body_data.get('universeId')
+    if str(universe_id or '').isdigit() and not history and 'settings' in body_data and opening_pool.is_enabled():
+        opening = take_opening(universe_id, game_settings, user_action)
+        if opening:
+            game_settings = {
+                **game_settings,
+                'setting': game_settings.get('setting') or opening['setting'],
+                'name': game_settings.get('name') or opening['name']
+            }
+    
+    session = None
+    if game_id:
+        try:
+            owner = game_sessions.request_owner(event)
+            if 'history' in body_data or 'settings' in body_data:
+                # Полное состояние от клиента — оно же становится сессией
+                settings_only = {k: v for k, v in game_settings.items() if k != 'storyMemory'}
+                session = game_sessions.start('ai-story', game_id, settings_only, history,
+                                              memory=game_settings.get('storyMemory'), owner=owner)
+            else:
+                session = game_sessions.load('ai-story', game_id, body_data.get('sessionVersion'), owner)
+        except game_sessions.SessionForbidden as e:
+            return json_response(403, {'error': str(e)})
+        if 'history' not in body_data and 'settings' not in body_data:
+            if session is None:
+                return json_response(409, {
+                    'error': 'Game session not found, resend settings and history',
+                    'code': 'session_required'
+                })
+            history = session['history']
+            game_settings = {**session['settings'], 'storyMemory': session['memory']}
+    
+    if opening:
+        ai_response = {
+            'text': opening['text'],
+            'characters': opening['characters'],
+            'episode': 1,
+            'decisionAnalysis': analyze_player_decision(user_action, history)
+        }
+    else:
+        # Подсказка агента идёт в промпт, но не в историю — как у клиента, который хранит только слова игрока
+        ai_response = generate_story_continuation(user_action + body_data.get('agentPrompt', ''), game_settings, history)
+    
+    characters = ai_response['characters']
+    if game_id and npc_registry.is_enabled():
+        # С реестром отдаём только новых и изменившихся NPC, весь каст — GET ?gameId=
+        try:
+            characters = npc_registry.upsert_npcs(int(game_id), len(history) // 2 + 1, characters)
+        except Exception as e:
+            print(f"NPC registry upsert failed: {type(e).__name__} - {e}")
+    
+    data = {
+        'text': ai_response['text'],
+        'characters': characters,
+        'episode': ai_response['episode'],
+        'decisionAnalysis': ai_response.get('decisionAnalysis', {})
+    }
+    if opening and not body_data['settings'].get('setting'):
+        # Сеттинг пресета — клиенту, чтобы при повторной отправке состояния игра осталась в том же мире
+        data['presetSetting'] = opening['setting']
+    if session is not None:
+        cast = merge_characters(session['characters'], characters)
+        memory = update_story_memory(session['memory'], user_action, data['decisionAnalysis'],
+                                     ai_response['text'], len(history) // 2 + 1, cast)
+        data['sessionVersion'] = game_sessions.append(session, [
+            {'type': 'user', 'content': user_action},
+            {'type': 'ai', 'content': ai_response['text']}
+        ], memory=memory, characters=cast)
+    
+    return json_response(200, data)
+
+def merge_characters(known: List[Dict], delta: List[Dict]) -> List[Dict]:
+    """
+    Каст сессии: дельта NPC вливается по имени или previousName — так же, как у клиента
+    """
+    merged = [dict(c) for c in known]
+    for c in delta:
+        idx = next((i for i, p in enumerate(merged)
+                    if p.get('name') == c.get('name') or (c.get('previousName') and p.get('name') == c['previousName'])), -1)
+        entry = {'name': c.get('name'), 'role': c.get('role'), 'description': c.get('description')}
+        if idx == -1:
+            merged.append(entry)
+        else:
+            merged[idx].update(entry)
+    return merged
+
+# Вес отношения за одно важное решение в адрес персонажа — как считает клиент
+RELATION_WEIGHTS = {'romantic': 20, 'friendly': 10, 'aggressive': -15}
+
+def update_story_memory(memory: Dict, action: str, decision: Dict, ai_text: str, turn: int, characters: List[Dict]) -> Dict:
+    """
+    Память игры на сервере — вместо storyMemory, который клиент пересчитывал по всей истории:
+    последние 5 важных решений с последствиями и счёт отношений с каждым персонажем
+    """
+    key_moments = list(memory.get('keyMoments', []))
+    relationships = dict(memory.get('characterRelationships', {}))
+    for char in characters:
+        if char.get('name'):
+            relationships.setdefault(char['name'], 0)
+    
+    if decision.get('isMajorChoice'):
+        tone = decision.get('emotionalTone', 'neutral')
+        key_moments.append({
+            'turn': turn,
+            'playerAction': action,
+            'consequence': ai_text[:200],
+            'emotionalWeight': 100 if tone == 'romantic' else -50 if tone == 'aggressive' else 0
+        })
+        lowered = action.lower()
+        for name in relationships:
+            if name.lower() in lowered:
+                relationships[name] += RELATION_WEIGHTS.get(tone, 0)
     
     return {
-        'statusCode': 200,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*'
-        },
-        'isBase64Encoded': False,
-        'body': json.dumps({
-            'text': ai_response['text'],
-            'characters': ai_response['characters'],
-            'episode': ai_response['episode'],
-            'decisionAnalysis': ai_response.get('decisionAnalysis', {})
-        }, ensure_ascii=False)
+        'keyMoments': key_moments[-5:],
+        'characterRelationships': relationships,
+        'worldChanges': memory.get('worldChanges', [])
     }
 
-def analyze_player_decision(action: str, history: List[Dict]) -> Dict[str, Any]:
+def list_game_npcs(event: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Анализирует слова игрока и определяет ключевые решения/тон
+    Возвращает весь реестр NPC игры
     """
-    action_lower = action.lower()
-    
-    emotional_tone = 'neutral'
-    if any(word in action_lower for word in ['атакую', 'убью', 'нападаю', 'бью', 'уничтожу']):
-        emotional_tone = 'aggressive'
-    elif any(word in action_lower for word in ['помогаю', 'спасаю', 'поддержу', 'друг', 'согласен']):
-        emotional_tone = 'friendly'
-    elif any(word in action_lower for word in ['осторожно', 'прячусь', 'жду', 'проверю', 'подозреваю']):
-        emotional_tone = 'cautious'
-    elif any(word in action_lower for word in ['целую', 'обнимаю', 'люблю', 'признаюсь', 'флиртую', 'нравишься']):
-        emotional_tone = 'romantic'
-    
-    is_major_choice = any(word in action_lower for word in [
+    params = event.get('queryStringParameters') or {}
+    game_id = params.get('gameId', '')
+    
+    if not game_id.isdigit():
+        return json_response(400, {'error': 'gameId is required'})
+    
+    if not npc_registry.is_enabled():
+        return json_response(503, {'error': 'NPC registry is not configured'})
+    
+    # Каст виден только владельцу игры — как и сессия, по которой шли ходы
+    try:
+        session = game_sessions.load('ai-story', game_id, None, game_sessions.request_owner(event))
+    except game_sessions.SessionForbidden as e:
+        return json_response(403, {'error': str(e)})
+    if session is None:
+        return json_response(404, {'error': 'Game session not found'})
+    
+    return json_response(200, {'characters': npc_registry.list_npcs(int(game_id))})
+
+# Тоны проверяются в этом порядке — первый совпавший побеждает
+TONE_ORDER = ['aggressive', 'friendly', 'cautious', 'romantic']
+
+DECISION_LEXICONS = {
+    'aggressive': ['атакую', 'убью', 'нападаю', 'бью', 'уничтожу'],
+    'friendly': ['помогаю', 'спасаю', 'поддержу', 'друг', 'согласен'],
+    'cautious': ['осторожно', 'прячусь', 'жду', 'проверю', 'подозреваю'],
+    'romantic': ['целую', 'обнимаю', 'люблю', 'признаюсь', 'флиртую', 'нравишься'],
+    'major_choice': [
         'решаю', 'выбираю', 'приезжаю', 'уезжаю', 'соглашаюсь', 'отказываюсь',
         'убиваю', 'спасаю', 'предаю', 'доверяю', 'люблю', 'ненавижу'
-    ])
+    ]
+}
+
+# Слова игрока сравниваются по основе: «нападаю» ловит и «нападаем», «спасаю» — «спасать»
+DECISION_MATCHER = LemmaMatcher(DECISION_LEXICONS)
+
+def analyze_player_decision(action: str, history: List[Dict]) -> Dict[str, Any]:
+    """
+    Анализирует слова игрока и определяет ключевые решения/тон
+    """
+    hits = DECISION_MATCHER.scan(action)
+    
+    emotional_tone = next((tone for tone in TONE_ORDER if hits.any(tone)), 'neutral')
+    is_major_choice = hits.any('major_choice')
     
     return {
         'emotionalTone': emotional_tone,
@@ -208,40 +397,64 @@ def generate_story_continuation(action: str, settings: Dict, history: List[Dict]
             messages.append({'role': 'user', 'content': action + memory_context})
     
     # Проверяем кеш
-    cache_key = get_cache_key(json.dumps(messages, ensure_ascii=False))
-    cached = get_from_cache(cache_key)
+    with span('cache'):
+        cache_key = get_cache_key(json.dumps(messages, ensure_ascii=False))
+        cached = get_from_cache(cache_key)
+    note(cache='hit' if cached else 'miss', history_turns=len(history))
     if cached:
         return cached
     
+    # openai и httpx тянут сотни модулей — грузим только когда нужен реальный запрос
+    from openai import OpenAI
+    import httpx
+    
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            print(f"DeepSeek API attempt {attempt + 1}/{max_retries}")
+            note(attempts=attempt + 1)
             
             timeout_config = httpx.Timeout(connect=10.0, read=45.0, write=10.0, pool=5.0)
             http_client = httpx.Client(timeout=timeout_config)
             
             client = OpenAI(
                 api_key=DEEPSEEK_API_KEY,
-                base_url="https://api.deepseek.com",
+                base_url=DEEPSEEK_BASE_URL,
                 http_client=http_client,
                 timeout=45.0,
                 max_retries=0
             )
             
-            response = client.chat.completions.create(
-                model="deepseek-chat",
-                messages=messages,
-                max_tokens=2000,
-                temperature=0.7,
-                stream=False
-            )
+            # Персонажей извлекаем по мере прихода чанков, а не после генерации
+            extractor = NpcExtractor()
+            parts = []
+            with span('deepseek'):
+                stream = client.chat.completions.create(
+                    model="deepseek-chat",
+                    messages=messages,
+                    max_tokens=2000,
+                    temperature=0.7,
+                    stream=True,
+                    # openai==1.12.0 не знает stream_options — передаём полем тела запроса
+                    extra_body={'stream_options': {'include_usage': True}}
+                )
+                for chunk in stream:
+                    # Расход токенов приходит последним чанком с пустым choices; в openai==1.12.0
+                    # у чанка нет поля usage, и оно остаётся словарём
+                    usage = getattr(chunk, 'usage', None)
+                    if usage:
+                        note(tokens=usage['total_tokens'] if isinstance(usage, dict) else usage.total_tokens)
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        parts.append(delta)
+                        extractor.feed(delta)
+            extractor.close()
             
-            ai_text = response.choices[0].message.content
-            print(f"DeepSeek API success, response length: {len(ai_text)}")
+            ai_text = ''.join(parts)
+            note(upstream_status=200, response_chars=len(ai_text))
             
-            # Извлекаем персонажей из текста
-            characters = extract_characters(ai_text)
+            characters = extractor.result()
             
             result = {
                 'text': ai_text,
@@ -259,14 +472,17 @@ def generate_story_continuation(action: str, settings: Dict, history: List[Dict]
             error_name = type(e).__name__
             error_msg = str(e)
             print(f"DeepSeek API attempt {attempt + 1} failed: {error_name} - {error_msg}")
+            note(upstream_status=getattr(e, 'status_code', None), upstream_error=error_name)
             
             if attempt < max_retries - 1:
                 print(f"Retrying... ({attempt + 2}/{max_retries})")
                 continue
             else:
                 print("All retries exhausted, using fallback")
+                note(fallback=True)
                 return fallback_response(action, role, len(history))
 
+@timed('prompt')
 def build_system_prompt(role: str, narrative_mode: str, setting: str, game_name: str) -> str:
     """
     Строит системный промт для DeepSeek в зависимости от настроек
@@ -347,39 +563,6 @@ def build_system_prompt(role: str, narrative_mode: str, setting: str, game_name:
     
     return base
 
-def extract_characters(text: str) -> List[Dict[str, str]]:
-    """
-    Извлекает персонажей из текста ИИ
-    """
-    characters = []
-    
-    # Ищем NPC в формате [NPC: ...]
-    npc_pattern = r'\[NPC:\s*([^\|]+)\s*\|\s*Роль:\s*([^\|]+)\s*\|\s*Внешность:\s*([^\]]+)\]'
-    matches = re.findall(npc_pattern, text)
-    
-    for match in matches:
-        characters.append({
-            'name': match[0].strip(),
-            'role': match[1].strip(),
-            'description': match[2].strip()
-        })
-    
-    # Дополнительно ищем упоминания имён собственных
-    name_pattern = r'([А-ЯЁ][а-яё]+(?:\s+[А-ЯЁ][а-яё]+)?)\s+(?:сказал|произнёс|спросил|ответил|кивнул|улыбнулся)'
-    name_matches = re.findall(name_pattern, text)
-    
-    existing_names = {c['name'] for c in characters}
-    for name in name_matches:
-        if name not in existing_names and len(name) > 2:
-            characters.append({
-                'name': name,
-                'role': 'NPC',
-                'description': 'Персонаж истории'
-            })
-            existing_names.add(name)
-    
-    return characters
-
 def fallback_response(action: str, role: str, history_len: int) -> Dict[str, Any]:
     """
     Фоллбэк на случай ошибки API - даёт базовое продолжение
@@ -0,0 +1,103 @@
+'''
+NPC extraction from story text.
+Both the explicit [NPC: name | Роль: ... | Внешность: ...] tags and the
+"<Имя> сказал/ответил/..." speaker heuristic are one precompiled pattern, so the
+text is scanned once. NpcExtractor can also be fed streamed chunks and reports
+each NPC as soon as its tag (or speech verb) has arrived.
+'''
+
+import re
+from typing import Dict, List, Optional
+
+SPEECH_VERBS = ['сказал', 'произнёс', 'спросил', 'ответил', 'кивнул', 'улыбнулся']
+
+NPC_RE = re.compile(
+    r'\[NPC:\s*(?P<name>[^\|]+)\s*\|\s*Роль:\s*(?P<role>[^\|]+)\s*\|\s*Внешность:\s*(?P<description>[^\]]+)\]'
+    r'|(?P<speaker>[А-ЯЁ][а-яё]+(?:\s+[А-ЯЁ][а-яё]+)?)\s+(?:' + '|'.join(SPEECH_VERBS) + ')'
+)
+
+# Сколько последних слов держим в буфере между чанками: «Имя Фамилия» + недописанный глагол
+TAIL_WORDS = 3
+TAIL_WORD_RE = re.compile(r'\S+\s*$')
+
+
+class NpcExtractor:
+    '''
+    Инкрементальный извлекатель: feed(chunk) возвращает новых NPC, close() — оставшихся.
+    Один и тот же персонаж отдаётся один раз; тег с ролью заменяет догадку по глаголу речи.
+    '''
+
+    def __init__(self):
+        self.buffer = ''
+        self.characters: Dict[str, Dict[str, str]] = {}
+        self.from_tags: List[str] = []
+
+    def _accept(self, match) -> Optional[Dict[str, str]]:
+        if match.group('speaker') is None:
+            npc = {
+                'name': match.group('name').strip(),
+                'role': match.group('role').strip(),
+                'description': match.group('description').strip()
+            }
+            if npc['name'] in self.from_tags:
+                return None
+            self.from_tags.append(npc['name'])
+            self.characters[npc['name']] = npc
+            return npc
+
+        name = match.group('speaker')
+        if name in self.characters or len(name) <= 2:
+            return None
+        npc = {'name': name, 'role': 'NPC', 'description': 'Персонаж истории'}
+        self.characters[name] = npc
+        return npc
+
+    def _safe_end(self) -> int:
+        '''Граница, до которой буфер уже не может измениться от следующих чанков'''
+        open_tag = self.buffer.rfind('[')
+        if open_tag > self.buffer.rfind(']'):
+            return open_tag
+        end = len(self.buffer)
+        for _ in range(TAIL_WORDS):
+            word = TAIL_WORD_RE.search(self.buffer, 0, end)
+            if not word:
+                return 0
+            end = word.start()
+        return end
+
+    def _scan(self, limit: int) -> List[Dict[str, str]]:
+        found = []
+        consumed = 0
+        cut = limit
+        for match in NPC_RE.finditer(self.buffer):
+            if match.end() > limit:
+                # Совпадение заходит в хвост — дождёмся следующего чанка, вдруг имя длиннее
+                cut = min(limit, match.start())
+                break
+            npc = self._accept(match)
+            if npc:
+                found.append(npc)
+            consumed = match.end()
+        self.buffer = self.buffer[max(consumed, cut):]
+        return found
+
+    def feed(self, chunk: str) -> List[Dict[str, str]]:
+        self.buffer += chunk
+        return self._scan(self._safe_end())
+
+    def close(self) -> List[Dict[str, str]]:
+        return self._scan(len(self.buffer))
+
+    def result(self) -> List[Dict[str, str]]:
+        '''Все найденные NPC: сначала теги, затем имена из реплик'''
+        tagged = [self.characters[name] for name in self.from_tags]
+        speakers = [npc for name, npc in self.characters.items() if name not in self.from_tags]
+        return tagged + speakers
+
+
+def extract_characters(text: str) -> List[Dict[str, str]]:
+    '''Извлекает персонажей из готового текста за один проход'''
+    extractor = NpcExtractor()
+    extractor.feed(text)
+    extractor.close()
+    return extractor.result()
@@ -0,0 +1,189 @@
+'''
+Persistent per-game NPC registry for ai-story.
+Every turn's extracted NPCs are upserted into game_npcs keyed by
+(game_id, normalized_name); short forms like "Лань" are folded into the
+known full name "Лань Ванцзи". upsert_npcs returns only what changed, so the
+client no longer has to resend and dedupe the whole cast.
+'''
+
+import json
+import os
+import re
+from typing import Dict, Any, List, Optional
+from timing import connect_db
+
+PLACEHOLDER_ROLE = 'NPC'
+PLACEHOLDER_DESCRIPTION = 'Персонаж истории'
+
+NON_NAME_RE = re.compile(r'[^\w\s-]+')
+
+def normalize_name(name: str) -> str:
+    '''Ключ для сравнения имён: нижний регистр, ё→е, без знаков препинания и лишних пробелов'''
+    cleaned = NON_NAME_RE.sub(' ', name.lower().replace('ё', 'е'))
+    return ' '.join(cleaned.split())
+
+def is_enabled() -> bool:
+    return bool(os.environ.get('DATABASE_URL'))
+
+def get_db_connection():
+    from psycopg2.extras import RealDictCursor
+    return connect_db(os.environ.get('DATABASE_URL'), cursor_factory=RealDictCursor)
+
+def find_alias_owner(normalized: str, rows: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    '''
+    Ищет уже известного персонажа, которым может быть normalized.
+    "лань" ↔ "лань ванцзи": одно имя целиком входит в другое по словам.
+    При нескольких кандидатах берём того, кого видели последним.
+    '''
+    # Точное имя важнее алиаса: иначе упоминание уйдёт другому персонажу
+    for row in rows:
+        if normalized == row['normalized_name']:
+            return row
+    for row in rows:
+        if normalized in row['aliases']:
+            return row
+
+    words = normalized.split()
+    candidates = []
+    for row in rows:
+        known_words = row['normalized_name'].split()
+        shorter, longer = (words, known_words) if len(words) <= len(known_words) else (known_words, words)
+        if shorter and all(w in longer for w in shorter):
+            candidates.append(row)
+    if not candidates:
+        return None
+    return max(candidates, key=lambda r: r['last_seen_turn'])
+
+def is_placeholder(npc: Dict[str, Any]) -> bool:
+    return npc.get('role') == PLACEHOLDER_ROLE and npc.get('description') == PLACEHOLDER_DESCRIPTION
+
+def to_npc(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'name': row['name'],
+        'role': row['role'],
+        'description': row['description'],
+        'aliases': row['aliases'],
+        'firstSeenTurn': row['first_seen_turn'],
+        'lastSeenTurn': row['last_seen_turn']
+    }
+
+def name_taken(normalized: str, row: Dict[str, Any], rows: List[Dict[str, Any]]) -> bool:
+    '''Имя уже занято другим персонажем игры — переименование нарушило бы уникальный индекс'''
+    return any(other is not row and other['normalized_name'] == normalized for other in rows)
+
+def merge_npc(row: Dict[str, Any], npc: Dict[str, Any], normalized: str, turn: int, rows: List[Dict[str, Any]]) -> bool:
+    '''Вливает новое упоминание в запись реестра; True, если клиенту есть что обновить'''
+    changed = False
+    row['last_seen_turn'] = max(row['last_seen_turn'], turn)
+
+    # Полное имя важнее короткого: "Лань" → "Лань Ванцзи", если оно не принадлежит другой записи
+    if len(normalized.split()) > len(row['normalized_name'].split()) and not name_taken(normalized, row, rows):
+        row['aliases'].append(row['normalized_name'])
+        row['previous_name'] = row['name']
+        row['name'] = npc['name']
+        row['normalized_name'] = normalized
+        changed = True
+    elif normalized != row['normalized_name'] and normalized not in row['aliases']:
+        row['aliases'].append(normalized)
+
+    # Тег [NPC: ...] с ролью и внешностью заменяет догадку по глаголу речи
+    if not is_placeholder(npc) and (npc['role'], npc['description']) != (row['role'], row['description']):
+        row['role'] = npc['role']
+        row['description'] = npc['description']
+        changed = True
+    return changed
+
+def upsert_npcs(game_id: int, turn: int, npcs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    '''
+    Сохраняет NPC хода в реестр игры.
+    Возвращает только новых и изменившихся персонажей (дельту); у переименованных есть previousName.
+    '''
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        # Блокируем каст игры целиком — параллельные ходы одной игры не создадут дублей.
+        # Читаем отдельным запросом после блокировки: его снимок видит персонажей, добавленных ходом,
+        # которого мы ждали, и переименование не наткнётся на их имена
+        cur.execute("SELECT id FROM game_npcs WHERE game_id = %s FOR UPDATE", (game_id,))
+        cur.execute(
+            """SELECT id, name, normalized_name, aliases, role, description, first_seen_turn, last_seen_turn
+               FROM game_npcs WHERE game_id = %s""",
+            (game_id,)
+        )
+        rows = [dict(r) for r in cur.fetchall()]
+        dirty: Dict[int, Dict[str, Any]] = {}
+        delta: Dict[int, Dict[str, Any]] = {}
+
+        for npc in npcs:
+            normalized = normalize_name(npc['name'])
+            if not normalized:
+                continue
+            row = find_alias_owner(normalized, rows)
+            if row is None:
+                row = {
+                    'id': None,
+                    'name': npc['name'],
+                    'normalized_name': normalized,
+                    'aliases': [],
+                    'role': npc['role'],
+                    'description': npc['description'],
+                    'first_seen_turn': turn,
+                    'last_seen_turn': turn
+                }
+                rows.append(row)
+                delta[id(row)] = row
+            elif merge_npc(row, npc, normalized, turn, rows):
+                delta[id(row)] = row
+            dirty[id(row)] = row
+
+        for row in dirty.values():
+            if row['id'] is None:
+                cur.execute(
+                    """INSERT INTO game_npcs
+                       (game_id, name, normalized_name, aliases, role, description, first_seen_turn, last_seen_turn)
+                       VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                       ON CONFLICT (game_id, normalized_name) DO UPDATE
+                       SET last_seen_turn = GREATEST(game_npcs.last_seen_turn, EXCLUDED.last_seen_turn),
+                           updated_at = CURRENT_TIMESTAMP
+                       RETURNING id""",
+                    (game_id, row['name'], row['normalized_name'], json.dumps(row['aliases'], ensure_ascii=False),
+                     row['role'], row['description'], row['first_seen_turn'], row['last_seen_turn'])
+                )
+                row['id'] = cur.fetchone()['id']
+            else:
+                cur.execute(
+                    """UPDATE game_npcs
+                       SET name = %s, normalized_name = %s, aliases = %s, role = %s, description = %s,
+                           last_seen_turn = %s, updated_at = CURRENT_TIMESTAMP
+                       WHERE id = %s""",
+                    (row['name'], row['normalized_name'], json.dumps(row['aliases'], ensure_ascii=False),
+                     row['role'], row['description'], row['last_seen_turn'], row['id'])
+                )
+        conn.commit()
+
+        result = []
+        for row in delta.values():
+            npc = to_npc(row)
+            if row.get('previous_name'):
+                npc['previousName'] = row['previous_name']
+            result.append(npc)
+        return result
+    finally:
+        cur.close()
+        conn.close()
+
+def list_npcs(game_id: int) -> List[Dict[str, Any]]:
+    '''Весь каст игры в порядке появления'''
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            """SELECT name, role, description, aliases, first_seen_turn, last_seen_turn
+               FROM game_npcs WHERE game_id = %s
+               ORDER BY first_seen_turn, id""",
+            (game_id,)
+        )
+        return [to_npc(r) for r in cur.fetchall()]
+    finally:
+        cur.close()
+        conn.close()
@@ -0,0 +1,161 @@
+'''
+Pool of pre-generated opening scenes for popular canon universes.
+The first turn is the slowest one, and many games start from the same canon
+universe (universes.source_type = 'canon'). For every popular
+universe × genre × narrative mode a few varied openings wait in opening_pool;
+take() hands one out (each opening goes to exactly one game) and refill()
+tops the pool back up in the background.
+'''
+
+import json
+import os
+from typing import Dict, Any, List, Optional, Callable
+from timing import connect_db, span
+
+POOL_SIZE = int(os.environ.get('OPENING_POOL_SIZE', '3'))
+POPULAR_UNIVERSES = int(os.environ.get('OPENING_POOL_UNIVERSES', '10'))
+NARRATIVE_MODES = ('first', 'third', 'love-interest')
+# Пул готовится для роли по умолчанию; автору сцена нужна другая
+POOL_ROLE = 'hero'
+# Сколько сцен генерирует один прогон refill — он не должен занимать экземпляр надолго
+REFILL_BATCH = int(os.environ.get('OPENING_POOL_BATCH', '3'))
+
+# Разные завязки, чтобы сцены одной комбинации не повторяли друг друга
+OPENING_HOOKS = [
+    'Первая сцена начинается с загадки, которую герой не может игнорировать.',
+    'Первая сцена начинается посреди конфликта — кто-то уже в опасности.',
+    'Первая сцена начинается с встречи с ярким персонажем этого мира.',
+    'Первая сцена начинается с тихой атмосферной детали, за которой скрывается угроза.',
+    'Первая сцена начинается с неожиданного известия, меняющего планы героя.'
+]
+
+def is_enabled() -> bool:
+    return bool(os.environ.get('DATABASE_URL')) and POOL_SIZE > 0
+
+def get_db_connection():
+    from psycopg2.extras import RealDictCursor
+    return connect_db(os.environ.get('DATABASE_URL'), cursor_factory=RealDictCursor)
+
+def preset_setting(universe: Dict[str, Any]) -> str:
+    '''Сеттинг игры из канонической вселенной — с ним сгенерированы сцены пула'''
+    title = universe['name']
+    if universe.get('canon_source'):
+        title += f" ({universe['canon_source']})"
+    description = (universe.get('description') or '').strip()
+    return f'{title}. {description}' if description else title
+
+def start_action(setting: str) -> str:
+    '''Действие первого хода — то же, что шлёт клиент'''
+    return f'Начни историю в сеттинге: {setting}' if setting else 'Начни захватывающую историю'
+
+def take(universe_id: Any, settings: Dict[str, Any], action: str) -> Optional[Dict[str, Any]]:
+    '''
+    Забирает готовую сцену для новой игры по пресету вселенной. Подходит, только если игрок ничего
+    не менял: играет за героя, первое действие стандартное, сеттинг, название и жанр — пустые или как
+    у пресета. None — генерировать как обычно
+    '''
+    setting = settings.get('setting', '') or ''
+    if settings.get('role', POOL_ROLE) != POOL_ROLE or action != start_action(setting):
+        return None
+    genre = settings.get('genre', '') or ''
+    name = settings.get('name', '') or ''
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        with span('opening_pool'):
+            cur.execute(
+                """DELETE FROM opening_pool WHERE id = (
+                       SELECT id FROM opening_pool
+                       WHERE universe_id = %s AND narrative_mode = %s AND role = %s
+                         AND (%s = '' OR genre = %s) AND (%s = '' OR setting = %s) AND (%s = '' OR name = %s)
+                       ORDER BY created_at
+                       LIMIT 1
+                       FOR UPDATE SKIP LOCKED
+                   )
+                   RETURNING name, setting, genre, text, characters""",
+                (int(universe_id), settings.get('narrativeMode', 'third'), POOL_ROLE, genre, genre, setting, setting, name, name)
+            )
+            row = cur.fetchone()
+        conn.commit()
+        return dict(row) if row else None
+    finally:
+        cur.close()
+        conn.close()
+
+def pool_gaps(cur, universe_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    '''Комбинации популярных вселенных, где сцен меньше POOL_SIZE; популярность — число историй во вселенной'''
+    cur.execute(
+        """SELECT u.id, u.name, u.description, u.canon_source, COALESCE(u.genre, '') AS genre,
+                  COUNT(s.id) AS uses
+           FROM universes u
+           LEFT JOIN stories s ON s.universe_id = u.id
+           WHERE u.source_type = 'canon' AND (%s::integer IS NULL OR u.id = %s)
+           GROUP BY u.id
+           ORDER BY uses DESC, u.id
+           LIMIT %s""",
+        (universe_id, universe_id, POPULAR_UNIVERSES)
+    )
+    universes = cur.fetchall()
+    if not universes:
+        return []
+    cur.execute(
+        """SELECT universe_id, narrative_mode, COUNT(*) AS ready FROM opening_pool
+           WHERE universe_id = ANY(%s) AND role = %s
+           GROUP BY universe_id, narrative_mode""",
+        ([u['id'] for u in universes], POOL_ROLE)
+    )
+    ready = {(row['universe_id'], row['narrative_mode']): row['ready'] for row in cur.fetchall()}
+    gaps = []
+    for universe in universes:
+        for mode in NARRATIVE_MODES:
+            have = ready.get((universe['id'], mode), 0)
+            if have < POOL_SIZE:
+                gaps.append({'universe': dict(universe), 'narrative_mode': mode, 'have': have, 'missing': POOL_SIZE - have})
+    return gaps
+
+def store_opening(universe: Dict[str, Any], narrative_mode: str, setting: str, result: Dict[str, Any]):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            """INSERT INTO opening_pool (universe_id, genre, narrative_mode, role, name, setting, text, characters)
+               VALUES (%s, %s, %s, %s, %s, %s, %s, %s)""",
+            (universe['id'], universe['genre'], narrative_mode, POOL_ROLE, universe['name'], setting,
+             result['text'], json.dumps(result.get('characters', []), ensure_ascii=False))
+        )
+        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+
+def refill(generate: Callable[[str, Dict[str, Any]], Optional[Dict[str, Any]]], universe_id: Any = None) -> int:
+    '''
+    Догенерирует недостающие сцены (не больше REFILL_BATCH за прогон). generate(action, settings)
+    возвращает ответ как у обычного первого хода или None, если сцена не получилась. Соединение
+    с базой не держится, пока идёт генерация. Возвращает число новых сцен
+    '''
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        gaps = pool_gaps(cur, int(universe_id) if universe_id else None)
+    finally:
+        cur.close()
+        conn.close()
+
+    added = 0
+    for gap in gaps:
+        universe = gap['universe']
+        setting = preset_setting(universe)
+        settings = {
+            'name': universe['name'], 'setting': setting, 'genre': universe['genre'],
+            'narrativeMode': gap['narrative_mode'], 'role': POOL_ROLE
+        }
+        for i in range(gap['missing']):
+            if added >= REFILL_BATCH:
+                return added
+            hook = OPENING_HOOKS[(gap['have'] + i) % len(OPENING_HOOKS)]
+            result = generate(f"{start_action(setting)}\n\n{hook}", settings)
+            if result:
+                store_opening(universe, gap['narrative_mode'], setting, result)
+                added += 1
+    return added
@@ -8,11 +8,10 @@ import os
 import hashlib
 import hmac
 import base64
-import jwt
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from response import json_response, preflight
+from timing import connect_db, instrument
 
 def hash_password(password: str) -> str:
     salt = os.urandom(32)
@@ -27,6 +26,7 @@ def verify_password(stored_hash: str, password: str) -> bool:
     return hmac.compare_digest(stored_key, new_key)
 
 def create_token(user_id: int, username: str) -> str:
+    import jwt
     jwt_secret = os.environ.get('JWT_SECRET')
     if not jwt_secret:
         raise ValueError('JWT_SECRET not configured')
@@ -39,6 +39,7 @@ def create_token(user_id: int, username: str) -> str:
     return jwt.encode(payload, jwt_secret, algorithm='HS256')
 
 def verify_token(token: str) -> Optional[Dict[str, Any]]:
+    import jwt
     jwt_secret = os.environ.get('JWT_SECRET')
     if not jwt_secret:
         return None
@@ -51,32 +52,20 @@ def verify_token(token: str) -> Optional[Dict[str, Any]]:
     except jwt.InvalidTokenError:
         return None
 
+@instrument('auth')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return preflight('GET, POST, OPTIONS', 'Content-Type, X-Auth-Token')
+    
+    from psycopg2.extras import RealDictCursor
     
     dsn = os.environ.get('DATABASE_URL')
     if not dsn:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Database configuration error'}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': 'Database configuration error'})
     
-    conn = psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    conn = connect_db(dsn, cursor_factory=RealDictCursor)
     
     try:
         if method == 'POST':
@@ -89,30 +78,15 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 password = body.get('password', '')
                 
                 if not email or not username or not password:
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Все поля обязательны'}),
-                        'isBase64Encoded': False
-                    }
+                    return json_response(400, {'error': 'Все поля обязательны'})
                 
                 if len(password) < 6:
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Пароль должен быть минимум 6 символов'}),
-                        'isBase64Encoded': False
-                    }
+                    return json_response(400, {'error': 'Пароль должен быть минимум 6 символов'})
                 
                 cursor = conn.cursor()
                 cursor.execute("SELECT id FROM users WHERE email = %s OR username = %s", (email, username))
                 if cursor.fetchone():
-                    return {
-                        'statusCode': 409,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Email или имя пользователя уже заняты'}),
-                        'isBase64Encoded': False
-                    }
+                    return json_response(409, {'error': 'Email или имя пользователя уже заняты'})
                 
                 password_hash = hash_password(password)
                 cursor.execute(
@@ -124,33 +98,23 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 
                 token = create_token(user['id'], user['username'])
                 
-                return {
-                    'statusCode': 201,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({
-                        'token': token,
-                        'user': {
-                            'id': user['id'],
-                            'username': user['username'],
-                            'email': user['email'],
-                            'display_name': user['display_name'],
-                            'created_at': user['created_at'].isoformat() if user['created_at'] else None
-                        }
-                    }),
-                    'isBase64Encoded': False
-                }
+                return json_response(201, {
+                    'token': token,
+                    'user': {
+                        'id': user['id'],
+                        'username': user['username'],
+                        'email': user['email'],
+                        'display_name': user['display_name'],
+                        'created_at': user['created_at'].isoformat() if user['created_at'] else None
+                    }
+                })
             
             elif action == 'login':
                 login = body.get('login', '').strip()
                 password = body.get('password', '')
                 
                 if not login or not password:
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Введите логин и пароль'}),
-                        'isBase64Encoded': False
-                    }
+                    return json_response(400, {'error': 'Введите логин и пароль'})
                 
                 cursor = conn.cursor()
                 cursor.execute(
@@ -160,45 +124,30 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 user = cursor.fetchone()
                 
                 if not user or not verify_password(user['password_hash'], password):
-                    return {
-                        'statusCode': 401,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Неверный логин или пароль'}),
-                        'isBase64Encoded': False
-                    }
+                    return json_response(401, {'error': 'Неверный логин или пароль'})
                 
                 cursor.execute("UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = %s", (user['id'],))
                 conn.commit()
                 
                 token = create_token(user['id'], user['username'])
                 
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({
-                        'token': token,
-                        'user': {
-                            'id': user['id'],
-                            'username': user['username'],
-                            'email': user['email'],
-                            'display_name': user['display_name'],
-                            'avatar_url': user['avatar_url']
-                        }
-                    }),
-                    'isBase64Encoded': False
-                }
+                return json_response(200, {
+                    'token': token,
+                    'user': {
+                        'id': user['id'],
+                        'username': user['username'],
+                        'email': user['email'],
+                        'display_name': user['display_name'],
+                        'avatar_url': user['avatar_url']
+                    }
+                })
             
             elif action == 'verify':
                 token = body.get('token', '')
                 payload = verify_token(token)
                 
                 if not payload:
-                    return {
-                        'statusCode': 401,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Недействительный токен'}),
-                        'isBase64Encoded': False
-                    }
+                    return json_response(401, {'error': 'Недействительный токен'})
                 
                 cursor = conn.cursor()
                 cursor.execute(
@@ -208,34 +157,19 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 user = cursor.fetchone()
                 
                 if not user:
-                    return {
-                        'statusCode': 404,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Пользователь не найден'}),
-                        'isBase64Encoded': False
+                    return json_response(404, {'error': 'Пользователь не найден'})
+                
+                return json_response(200, {
+                    'user': {
+                        'id': user['id'],
+                        'username': user['username'],
+                        'email': user['email'],
+                        'display_name': user['display_name'],
+                        'avatar_url': user['avatar_url']
                     }
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({
-                        'user': {
-                            'id': user['id'],
-                            'username': user['username'],
-                            'email': user['email'],
-                            'display_name': user['display_name'],
-                            'avatar_url': user['avatar_url']
-                        }
-                    }),
-                    'isBase64Encoded': False
-                }
+                })
         
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Метод не поддерживается'}),
-            'isBase64Encoded': False
-        }
+        return json_response(405, {'error': 'Метод не поддерживается'})
     
     finally:
         conn.close()
\ No newline at end of file
@@ -0,0 +1,144 @@
+'''
+Условные GET для списков: ETag и Last-Modified из счётчика версий коллекции, 304 без запроса списка.
+Копия лежит в папке каждой функции, которая читает или меняет версионируемые коллекции, — копии должны совпадать.
+Запись в той же транзакции поднимает версию (строка в collection_versions на пользователя и коллекцию):
+    bump_version(cur, 'characters', ALL_USERS, owner_id)
+Чтение сначала берёт версию — один запрос по первичному ключу — и отвечает 304, если она у клиента уже есть:
+    version = current_version(cur, 'characters', user_id, variant=f'universe{universe_id}')
+    cached = not_modified(event, version)
+    if cached:
+        return cached
+    ...
+    return json_response(200, rows, headers=version.headers())
+'''
+
+import datetime
+import re
+from typing import Dict, Any, Optional
+
+# Счётчик «для всех»: общие списки (universes, game-entities) и выборки без пользователя
+ALL_USERS = 0
+
+# Браузер сам перепроверяет ответ при каждом запросе (no-cache), общим кешам ответ не достаётся (private)
+CACHE_CONTROL = 'private, no-cache'
+
+# Внутри ETag — только символы токена, без кавычек и пробелов
+ETAG_UNSAFE_RE = re.compile(r'[^A-Za-z0-9_.=-]')
+
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def http_date(value: datetime.datetime) -> str:
+    '''IMF-fixdate без strftime: названия дней и месяцев не должны зависеть от локали'''
+    return (f'{WEEKDAYS[value.weekday()]}, {value.day:02d} {MONTHS[value.month - 1]} {value.year} '
+            f'{value.hour:02d}:{value.minute:02d}:{value.second:02d} GMT')
+
+
+def parse_http_date(value: str) -> Optional[datetime.datetime]:
+    '''Разбирает «Sun, 06 Nov 1994 08:49:37 GMT»; устаревшие форматы и мусор — None (заголовок игнорируется)'''
+    parts = value.replace(',', ' ').split()
+    if len(parts) != 6 or parts[5] != 'GMT' or parts[2] not in MONTHS:
+        return None
+    try:
+        hour, minute, second = (int(p) for p in parts[4].split(':'))
+        return datetime.datetime(int(parts[3]), MONTHS.index(parts[2]) + 1, int(parts[1]), hour, minute, second)
+    except ValueError:
+        return None
+
+
+class CollectionVersion:
+    '''Версия одной коллекции для одного пользователя; variant различает выборки (фильтры) внутри неё'''
+
+    def __init__(self, collection: str, scope: int, version: int,
+                 updated_at: Optional[datetime.datetime], variant: str = ''):
+        self.collection = collection
+        self.scope = scope
+        self.version = version
+        # TIMESTAMP без зоны пишется CURRENT_TIMESTAMP базы — считаем его UTC; HTTP-даты с точностью до секунды
+        self.updated_at = updated_at.replace(microsecond=0, tzinfo=None) if updated_at else None
+        self.variant = variant
+
+    @property
+    def etag(self) -> str:
+        tag = f'{self.collection}-{self.scope}-v{self.version}'
+        if self.variant:
+            tag += '-' + self.variant
+        return '"' + ETAG_UNSAFE_RE.sub('_', tag) + '"'
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            'ETag': self.etag,
+            'Cache-Control': CACHE_CONTROL,
+            # Без Expose-Headers fetch с другого origin не увидит ETag и Last-Modified
+            'Access-Control-Expose-Headers': 'ETag, Last-Modified'
+        }
+        if self.updated_at:
+            headers['Last-Modified'] = http_date(self.updated_at)
+        return headers
+
+
+def current_version(cur, collection: str, scope: Any = ALL_USERS, variant: str = '') -> CollectionVersion:
+    '''
+    Версия до запроса списка, а не после: если запись успеет между ними, клиент получит
+    новый список со старым ETag и просто перезапросит его, а устаревший список с новым ETag невозможен
+    '''
+    scope = int(scope) if scope else ALL_USERS
+    cur.execute(
+        "SELECT version, updated_at FROM collection_versions WHERE user_id = %s AND collection = %s",
+        (scope, collection)
+    )
+    row = cur.fetchone()
+    if not row:
+        # Коллекцию ещё не меняли с появления счётчиков — версия 0 до первой записи
+        return CollectionVersion(collection, scope, 0, None, variant)
+    if isinstance(row, dict):
+        return CollectionVersion(collection, scope, row['version'], row['updated_at'], variant)
+    return CollectionVersion(collection, scope, row[0], row[1], variant)
+
+
+def bump_version(cur, collection: str, *scopes: Any):
+    '''
+    Поднимает версию коллекции для каждого scope (ALL_USERS и/или id владельца; None пропускается).
+    Зовётся до commit той же транзакции, что и запись. Scope идут по возрастанию — параллельные
+    записи берут блокировки строк в одном порядке и не ловят взаимоблокировку
+    '''
+    targets = sorted({int(scope) for scope in scopes if scope is not None}) or [ALL_USERS]
+    cur.execute(
+        """INSERT INTO collection_versions (user_id, collection, version, updated_at)
+           SELECT scope, %s, 1, CURRENT_TIMESTAMP FROM unnest(%s::integer[]) AS scope
+           ON CONFLICT (user_id, collection)
+           DO UPDATE SET version = collection_versions.version + 1, updated_at = CURRENT_TIMESTAMP""",
+        (collection, targets)
+    )
+
+
+def request_header(event: Dict[str, Any], name: str) -> Optional[str]:
+    lowered = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == lowered:
+            return value
+    return None
+
+
+def not_modified(event: Dict[str, Any], version: CollectionVersion) -> Optional[Dict[str, Any]]:
+    '''
+    Ответ 304, если у клиента актуальная версия, иначе None. Как в RFC 9110: при If-None-Match
+    (слабое сравнение, W/ не важен) If-Modified-Since не смотрим
+    '''
+    if_none_match = request_header(event, 'If-None-Match')
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        matched = '*' in tags or version.etag in (tag[2:] if tag.startswith('W/') else tag for tag in tags)
+    else:
+        if_modified_since = request_header(event, 'If-Modified-Since')
+        since = parse_http_date(if_modified_since) if if_modified_since else None
+        matched = since is not None and version.updated_at is not None and version.updated_at <= since
+    if not matched:
+        return None
+    return {
+        'statusCode': 304,
+        'headers': {'Access-Control-Allow-Origin': '*', **version.headers()},
+        'body': '',
+        'isBase64Encoded': False
+    }
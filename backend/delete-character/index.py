@@ -5,13 +5,14 @@ Args: event - dict with httpMethod, queryStringParameters (character_id)
 Returns: HTTP response with success message
 '''
 
-import json
 import os
 from typing import Dict, Any, Optional, Tuple
-import psycopg2
-import jwt
+from conditional import ALL_USERS, bump_version
+from response import json_response, preflight
+from timing import connect_db, instrument
 
 def verify_jwt(token: str) -> Optional[Dict[str, Any]]:
+    import jwt
     jwt_secret = os.environ.get('JWT_SECRET')
     if not jwt_secret:
         return None
@@ -25,43 +26,22 @@ def require_auth(event: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optio
     headers = event.get('headers', {})
     auth_header = headers.get('X-Auth-Token', headers.get('x-auth-token', ''))
     if not auth_header:
-        return None, {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Требуется авторизация'})
-        }
+        return None, json_response(401, {'error': 'Требуется авторизация'})
     user = verify_jwt(auth_header)
     if not user:
-        return None, {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Недействительный токен'})
-        }
+        return None, json_response(401, {'error': 'Недействительный токен'})
     return user, None
 
+@instrument('delete-character')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'DELETE')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Auth-Token',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return preflight('DELETE, OPTIONS', 'Content-Type, X-User-Id, X-Auth-Token')
+    
     
     if method != 'DELETE':
-        return {
-            'statusCode': 405,
-            'headers': {'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
+        return json_response(405, {'error': 'Method not allowed'})
     
     user, error = require_auth(event)
     if error:
@@ -69,57 +49,40 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     database_url = os.environ.get('DATABASE_URL')
     if not database_url:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Database configuration error'}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': 'Database configuration error'})
     
     params = event.get('queryStringParameters') or {}
     character_id = params.get('character_id')
     
     if not character_id:
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'character_id is required'}),
-            'isBase64Encoded': False
-        }
+        return json_response(400, {'error': 'character_id is required'})
     
     headers = event.get('headers', {})
     user_id = headers.get('X-User-Id') or headers.get('x-user-id')
     
-    conn = psycopg2.connect(database_url)
+    conn = connect_db(database_url)
     cur = conn.cursor()
     
     if user_id:
         cur.execute(
-            "DELETE FROM characters WHERE id = %s AND user_id = %s",
+            "DELETE FROM characters WHERE id = %s AND user_id = %s RETURNING user_id",
             (int(character_id), int(user_id))
         )
     else:
         cur.execute(
-            "DELETE FROM characters WHERE id = %s",
+            "DELETE FROM characters WHERE id = %s RETURNING user_id",
             (int(character_id),)
         )
     
+    deleted = cur.fetchone()
     deleted_count = cur.rowcount
+    if deleted:
+        bump_version(cur, 'characters', ALL_USERS, deleted[0])
     conn.commit()
     cur.close()
     conn.close()
     
     if deleted_count == 0:
-        return {
-            'statusCode': 404,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Character not found or access denied'}),
-            'isBase64Encoded': False
-        }
+        return json_response(404, {'error': 'Character not found or access denied'})
     
-    return {
-        'statusCode': 200,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'success': True, 'message': 'Character deleted'}),
-        'isBase64Encoded': False
-    }
+    return json_response(200, {'success': True, 'message': 'Character deleted'})
@@ -1,10 +1,10 @@
-import json
 import os
-import psycopg2
 from typing import Dict, Any, Optional, Tuple
-import jwt
+from response import json_response, preflight
+from timing import connect_db, instrument
 
 def verify_jwt(token: str) -> Optional[Dict[str, Any]]:
+    import jwt
     jwt_secret = os.environ.get('JWT_SECRET')
     if not jwt_secret:
         return None
@@ -18,20 +18,13 @@ def require_auth(event: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optio
     headers = event.get('headers', {})
     auth_header = headers.get('X-Auth-Token', headers.get('x-auth-token', ''))
     if not auth_header:
-        return None, {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Требуется авторизация'})
-        }
+        return None, json_response(401, {'error': 'Требуется авторизация'})
     user = verify_jwt(auth_header)
     if not user:
-        return None, {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Недействительный токен'})
-        }
+        return None, json_response(401, {'error': 'Недействительный токен'})
     return user, None
 
+@instrument('delete-game')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Delete saved game from library
@@ -41,28 +34,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Auth-Token',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return preflight('DELETE, OPTIONS', 'Content-Type, X-User-Id, X-Auth-Token')
+    
     
     if method != 'DELETE':
-        return {
-            'statusCode': 405,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Content-Type': 'application/json'
-            },
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
+        return json_response(405, {'error': 'Method not allowed'})
     
     user, error = require_auth(event)
     if error:
@@ -72,19 +48,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     story_id = params.get('story_id')
     
     if not story_id:
-        return {
-            'statusCode': 400,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Content-Type': 'application/json'
-            },
-            'body': json.dumps({'error': 'story_id required'}),
-            'isBase64Encoded': False
-        }
+        return json_response(400, {'error': 'story_id required'})
     
     database_url = os.environ.get('DATABASE_URL')
     
-    conn = psycopg2.connect(database_url)
+    conn = connect_db(database_url)
     cursor = conn.cursor()
     
     cursor.execute('DELETE FROM saved_stories WHERE id = %s', (story_id,))
@@ -95,12 +63,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     cursor.close()
     conn.close()
     
-    return {
-        'statusCode': 200,
-        'headers': {
-            'Access-Control-Allow-Origin': '*',
-            'Content-Type': 'application/json'
-        },
-        'body': json.dumps({'success': deleted, 'message': 'Game deleted' if deleted else 'Not found'}),
-        'isBase64Encoded': False
-    }
\ No newline at end of file
+    return json_response(200, {'success': deleted, 'message': 'Game deleted' if deleted else 'Not found'})
\ No newline at end of file
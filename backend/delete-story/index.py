@@ -1,10 +1,10 @@
-import json
 import os
 from typing import Dict, Any, Optional, Tuple
-import psycopg2
-import jwt
+from response import json_response, preflight
+from timing import connect_db, instrument
 
 def verify_jwt(token: str) -> Optional[Dict[str, Any]]:
+    import jwt
     jwt_secret = os.environ.get('JWT_SECRET')
     if not jwt_secret:
         return None
@@ -18,20 +18,13 @@ def require_auth(event: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optio
     headers = event.get('headers', {})
     auth_header = headers.get('X-Auth-Token', headers.get('x-auth-token', ''))
     if not auth_header:
-        return None, {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Требуется авторизация'})
-        }
+        return None, json_response(401, {'error': 'Требуется авторизация'})
     user = verify_jwt(auth_header)
     if not user:
-        return None, {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Недействительный токен'})
-        }
+        return None, json_response(401, {'error': 'Недействительный токен'})
     return user, None
 
+@instrument('delete-story')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Deletes story from database by ID
@@ -41,26 +34,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
+        return preflight('DELETE, OPTIONS', 'Content-Type, X-Auth-Token')
+    
     
     if method != 'DELETE':
-        return {
-            'statusCode': 405,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
+        return json_response(405, {'error': 'Method not allowed'})
     
     user, error = require_auth(event)
     if error:
@@ -70,27 +48,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     story_id = params.get('id')
     
     if not story_id:
-        return {
-            'statusCode': 400,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Story ID is required'})
-        }
+        return json_response(400, {'error': 'Story ID is required'})
     
     dsn = os.environ.get('DATABASE_URL')
     if not dsn:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Database not configured'})
-        }
+        return json_response(500, {'error': 'Database not configured'})
     
-    conn = psycopg2.connect(dsn)
+    conn = connect_db(dsn)
     cur = conn.cursor()
     
     cur.execute("DELETE FROM stories WHERE id = %s", (story_id,))
@@ -101,21 +65,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     conn.close()
     
     if deleted_count == 0:
-        return {
-            'statusCode': 404,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Story not found'})
-        }
+        return json_response(404, {'error': 'Story not found'})
     
-    return {
-        'statusCode': 200,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*'
-        },
-        'isBase64Encoded': False,
-        'body': json.dumps({'success': True, 'id': story_id}, ensure_ascii=False)
-    }
\ No newline at end of file
+    return json_response(200, {'success': True, 'id': story_id})
\ No newline at end of file
@@ -7,11 +7,12 @@ Returns: HTTP response with entities data or operation status
 import json
 import os
 from typing import Dict, Any, Optional, Tuple
-import psycopg2
-from psycopg2.extras import RealDictCursor
-import jwt
+from conditional import ALL_USERS, bump_version, current_version, not_modified
+from response import json_response, preflight
+from timing import connect_db, instrument
 
 def verify_jwt(token: str) -> Optional[Dict[str, Any]]:
+    import jwt
     jwt_secret = os.environ.get('JWT_SECRET')
     if not jwt_secret:
         return None
@@ -29,63 +30,44 @@ def require_auth(event: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optio
     auth_header = headers.get('X-Auth-Token', headers.get('x-auth-token', ''))
     
     if not auth_header:
-        error_response = {
-            'statusCode': 401,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Требуется авторизация'})
-        }
+        error_response = json_response(401, {'error': 'Требуется авторизация'})
         return None, error_response
     
     user = verify_jwt(auth_header)
     if not user:
-        error_response = {
-            'statusCode': 401,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Недействительный токен'})
-        }
+        error_response = json_response(401, {'error': 'Недействительный токен'})
         return None, error_response
     
     return user, None
 
 def get_db_connection():
+    from psycopg2.extras import RealDictCursor
     dsn = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    return connect_db(dsn, cursor_factory=RealDictCursor)
 
+@instrument('game-entities')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     params = event.get('queryStringParameters') or {}
     entity_type = params.get('type', 'characters')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
+        return preflight('GET, POST, PUT, DELETE, OPTIONS', 'Content-Type, X-Auth-Token, If-None-Match, If-Modified-Since')
     
     if entity_type not in ['characters', 'worlds', 'plots']:
-        return {
-            'statusCode': 400,
-            'headers': {'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Invalid entity type. Use characters, worlds, or plots'})
-        }
+        return json_response(400, {'error': 'Invalid entity type. Use characters, worlds, or plots'})
     
     conn = get_db_connection()
     cur = conn.cursor()
     
     try:
         if method == 'GET':
+            # Списки общие — версия на всю коллекцию
+            version = current_version(cur, entity_type)
+            cached = not_modified(event, version)
+            if cached:
+                return cached
+            
             if entity_type == 'characters':
                 cur.execute('''
                     SELECT id, name, role, avatar, stats, personality, backstory, character_type, created_at 
@@ -107,15 +89,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             entities = cur.fetchall()
             
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'isBase64Encoded': False,
-                'body': json.dumps([dict(row) for row in entities], default=str)
-            }
+            return json_response(200, [dict(row) for row in entities], headers=version.headers())
         
         elif method == 'POST':
             user, error = require_auth(event)
@@ -168,17 +142,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 ''', (name, description, genre, hooks, conflict, resolution))
             
             entity = cur.fetchone()
+            bump_version(cur, entity_type)
             conn.commit()
             
-            return {
-                'statusCode': 201,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'isBase64Encoded': False,
-                'body': json.dumps(dict(entity), default=str)
-            }
+            return json_response(201, dict(entity))
         
         elif method == 'PUT':
             user, error = require_auth(event)
@@ -189,11 +156,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             body = json.loads(event.get('body', '{}'))
             
             if not entity_id:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Missing id parameter'})
-                }
+                return json_response(400, {'error': 'Missing id parameter'})
             
             if entity_type == 'characters':
                 update_fields = []
@@ -205,18 +168,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         update_values.append(body[field])
                 
                 if not update_fields:
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'No fields to update'})
-                    }
+                    return json_response(400, {'error': 'No fields to update'})
                 
                 update_values.append(entity_id)
                 query = f'''
                     UPDATE t_p56538376_rpg_creative_platfor.characters 
                     SET {', '.join(update_fields)}
                     WHERE id = %s
-                    RETURNING id, name, role, avatar, stats, personality, backstory, character_type, created_at
+                    RETURNING id, name, role, avatar, stats, personality, backstory, character_type, created_at, user_id
                 '''
                 cur.execute(query, update_values)
             elif entity_type == 'worlds':
@@ -229,11 +188,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         update_values.append(body[field])
                 
                 if not update_fields:
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'No fields to update'})
-                    }
+                    return json_response(400, {'error': 'No fields to update'})
                 
                 update_values.append(entity_id)
                 query = f'''
@@ -253,11 +208,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         update_values.append(body[field])
                 
                 if not update_fields:
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'No fields to update'})
-                    }
+                    return json_response(400, {'error': 'No fields to update'})
                 
                 update_values.append(entity_id)
                 query = f'''
@@ -269,24 +220,18 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 cur.execute(query, update_values)
             
             entity = cur.fetchone()
-            conn.commit()
             
             if not entity:
-                return {
-                    'statusCode': 404,
-                    'headers': {'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Entity not found'})
-                }
+                conn.commit()
+                return json_response(404, {'error': 'Entity not found'})
+            
+            entity = dict(entity)
+            # Персонаж может принадлежать пользователю — его список в save-character тоже устарел
+            owner_id = entity.pop('user_id', None)
+            bump_version(cur, entity_type, ALL_USERS, owner_id)
+            conn.commit()
             
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'isBase64Encoded': False,
-                'body': json.dumps(dict(entity), default=str)
-            }
+            return json_response(200, entity)
         
         elif method == 'DELETE':
             user, error = require_auth(event)
@@ -296,31 +241,19 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             entity_id = params.get('id')
             
             if not entity_id:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Missing id parameter'})
-                }
+                return json_response(400, {'error': 'Missing id parameter'})
             
             table = f't_p56538376_rpg_creative_platfor.{entity_type}'
-            cur.execute(f'DELETE FROM {table} WHERE id = %s', (entity_id,))
+            owner = 'user_id' if entity_type == 'characters' else 'NULL AS user_id'
+            cur.execute(f'DELETE FROM {table} WHERE id = %s RETURNING {owner}', (entity_id,))
+            deleted = cur.fetchone()
+            if deleted:
+                bump_version(cur, entity_type, ALL_USERS, deleted['user_id'])
             conn.commit()
             
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'isBase64Encoded': False,
-                'body': json.dumps({'success': True})
-            }
+            return json_response(200, {'success': True})
         
-        return {
-            'statusCode': 405,
-            'headers': {'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
+        return json_response(405, {'error': 'Method not allowed'})
     
     finally:
         cur.close()
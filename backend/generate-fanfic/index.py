@@ -10,8 +10,11 @@ import os
 import hashlib
 import time
 from typing import Dict, Any, List
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import metrics
+from response import json_response, preflight
+from timing import connect_db, instrument, note, span
+
+DEEPSEEK_BASE_URL = os.environ.get('DEEPSEEK_BASE_URL', 'https://api.deepseek.com')
 
 # Кеш
 CACHE: Dict[str, tuple] = {}
@@ -36,33 +39,19 @@ def save_to_cache(key: str, value: str):
         expired_keys = [k for k, (t, _) in CACHE.items() if current_time - t >= CACHE_TTL]
         for k in expired_keys:
             del CACHE[k]
+    metrics.set_gauge('cache_entries', len(CACHE), function='generate-fanfic')
 
+@instrument('generate-fanfic')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return preflight('POST, OPTIONS', 'Content-Type, X-User-Id')
+    
+    from psycopg2.extras import RealDictCursor
     
     if method != 'POST':
-        return {
-            'statusCode': 405,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
+        return json_response(405, {'error': 'Method not allowed'})
     
     body = event.get('body', '{}')
     if not body or body == 'null':
@@ -76,32 +65,16 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     custom_prompt: str = body_data.get('custom_prompt', '')
     
     if not universe_id or not character_ids:
-        return {
-            'statusCode': 400,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'universe_id and character_ids required'}),
-            'isBase64Encoded': False
-        }
+        return json_response(400, {'error': 'universe_id and character_ids required'})
     
     database_url = os.environ.get('DATABASE_URL')
     deepseek_key = os.environ.get('DEEPSEEK_API_KEY')
     
     if not database_url or not deepseek_key:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Server configuration error'}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': 'Server configuration error'})
     
-    conn = psycopg2.connect(database_url)
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    conn = connect_db(database_url, cursor_factory=RealDictCursor)
+    cur = conn.cursor()
     
     cur.execute(
         "SELECT * FROM universes WHERE id = %s",
@@ -112,15 +85,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     if not universe:
         cur.close()
         conn.close()
-        return {
-            'statusCode': 404,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Universe not found'}),
-            'isBase64Encoded': False
-        }
+        return json_response(404, {'error': 'Universe not found'})
     
     placeholders = ','.join(['%s'] * len(character_ids))
     cur.execute(
@@ -133,15 +98,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     conn.close()
     
     if not characters:
-        return {
-            'statusCode': 404,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Characters not found'}),
-            'isBase64Encoded': False
-        }
+        return json_response(404, {'error': 'Characters not found'})
     
     import requests
     
@@ -187,61 +144,48 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     full_prompt = f"{system_prompt}\n\n{user_prompt}"
     cache_key = get_cache_key(full_prompt)
     cached = get_from_cache(cache_key)
+    note(cache='hit' if cached else 'miss')
     
     if cached:
         # Возвращаем из кеша (не сохраняем в БД повторно)
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*',
-                'X-Cache': 'HIT'
+        return json_response(200, {
+            'story_id': None,
+            'content': cached,
+            'universe': universe['name'],
+            'characters': [c['name'] for c in characters]
+        }, headers={'X-Cache': 'HIT'})
+    
+    with span('deepseek'):
+        response = requests.post(
+            f'{DEEPSEEK_BASE_URL}/v1/chat/completions',
+            headers={
+                'Authorization': f'Bearer {deepseek_key}',
+                'Content-Type': 'application/json'
             },
-            'body': json.dumps({
-                'story_id': None,
-                'content': cached,
-                'universe': universe['name'],
-                'characters': [c['name'] for c in characters]
-            }),
-            'isBase64Encoded': False
-        }
-    
-    response = requests.post(
-        'https://api.deepseek.com/v1/chat/completions',
-        headers={
-            'Authorization': f'Bearer {deepseek_key}',
-            'Content-Type': 'application/json'
-        },
-        json={
-            'model': 'deepseek-chat',
-            'messages': [
-                {'role': 'system', 'content': system_prompt},
-                {'role': 'user', 'content': user_prompt}
-            ],
-            'temperature': 0.7,
-            'max_tokens': 2000
-        },
-        timeout=40
-    )
+            json={
+                'model': 'deepseek-chat',
+                'messages': [
+                    {'role': 'system', 'content': system_prompt},
+                    {'role': 'user', 'content': user_prompt}
+                ],
+                'temperature': 0.7,
+                'max_tokens': 2000
+            },
+            timeout=40
+        )
+    note(upstream_status=response.status_code)
     
     if response.status_code != 200:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'AI generation failed', 'details': response.text}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': 'AI generation failed', 'details': response.text})
     
     result = response.json()
     generated_text = result['choices'][0]['message']['content']
+    note(tokens=result.get('usage', {}).get('total_tokens'))
     
     # Сохраняем в кеш
     save_to_cache(cache_key, generated_text)
     
-    conn = psycopg2.connect(database_url)
+    conn = connect_db(database_url)
     cur = conn.cursor()
     
     cur.execute(
@@ -264,18 +208,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     cur.close()
     conn.close()
     
-    return {
-        'statusCode': 200,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*',
-            'X-Cache': 'MISS'
-        },
-        'body': json.dumps({
-            'story_id': story_id,
-            'content': generated_text,
-            'universe': universe['name'],
-            'characters': [c['name'] for c in characters]
-        }),
-        'isBase64Encoded': False
-    }
\ No newline at end of file
+    return json_response(200, {
+        'story_id': story_id,
+        'content': generated_text,
+        'universe': universe['name'],
+        'characters': [c['name'] for c in characters]
+    }, headers={'X-Cache': 'MISS'})
\ No newline at end of file
@@ -0,0 +1,208 @@
+'''
+Метрики функций: счётчики, gauge и гистограммы с фиксированными корзинами.
+Копия лежит в папке каждой функции (как timing.py) — копии должны совпадать.
+Значения копятся в памяти экземпляра; фоновый поток раз в METRICS_FLUSH_SECONDS (по умолчанию 60 с),
+после METRICS_FLUSH_REQUESTS запросов и при выходе процесса дописывает накопленное дельтами
+в таблицу function_metrics. Читает её функция metrics: Prometheus-текст и p50/p95/p99
+    inc('upstream_errors_total', function='story-ai', status='429')
+    observe('request_duration_ms', 812.4, function='story-ai')
+Запросы через timing.instrument пишутся сами — см. record_request
+'''
+
+import atexit
+import json
+import os
+import threading
+import time
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_SECONDS', '60'))
+# Столько запросов сбрасываются, не дожидаясь интервала: короткоживущий экземпляр тоже успеет записать
+FLUSH_REQUESTS = int(os.environ.get('METRICS_FLUSH_REQUESTS', '200'))
+
+# Gauge у каждого экземпляра свой — без метки instance значения разных экземпляров перетирали бы друг друга
+INSTANCE_ID = os.urandom(6).hex()
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Registry:
+    '''Все метрики экземпляра; между сбросами в базу хранятся дельты'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[Tuple[str, LabelKey], float] = {}
+        self.gauges: Dict[Tuple[str, LabelKey], float] = {}
+        # [счётчики по корзинам + корзина +Inf, сумма, количество]
+        self.histograms: Dict[Tuple[str, LabelKey], list] = {}
+        self.bounds: Dict[str, Sequence[float]] = {}
+        self.requests = 0
+        self.last_flush = time.monotonic()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self.lock:
+            self.gauges[(name, label_key({**labels, 'instance': INSTANCE_ID}))] = value
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = LATENCY_BUCKETS_MS, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            self.bounds.setdefault(name, buckets)
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+            index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+            histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def drain(self) -> List[Dict[str, Any]]:
+        '''Строки для function_metrics; счётчики и гистограммы обнуляются, gauge остаются'''
+        with self.lock:
+            rows = []
+            for (name, labels), value in self.counters.items():
+                rows.append({'name': name, 'kind': 'counter', 'labels': dict(labels), 'value': value})
+            for (name, labels), value in self.gauges.items():
+                rows.append({'name': name, 'kind': 'gauge', 'labels': dict(labels), 'value': value})
+            for (name, labels), (counts, total, count) in self.histograms.items():
+                rows.append({
+                    'name': name, 'kind': 'histogram', 'labels': dict(labels), 'value': total,
+                    'count': count, 'buckets': list(counts), 'bounds': list(self.bounds[name])
+                })
+            self.counters = {}
+            self.histograms = {}
+            self.requests = 0
+            self.last_flush = time.monotonic()
+            return rows
+
+    def due(self) -> bool:
+        return self.requests >= FLUSH_REQUESTS or time.monotonic() - self.last_flush >= FLUSH_INTERVAL
+
+
+REGISTRY = Registry()
+
+_flusher: Optional[threading.Thread] = None
+_flusher_lock = threading.Lock()
+_wake = threading.Event()
+
+
+def inc(name: str, value: float = 1, **labels):
+    REGISTRY.inc(name, value, **labels)
+
+
+def set_gauge(name: str, value: float, **labels):
+    REGISTRY.set_gauge(name, value, **labels)
+
+
+def observe(name: str, value: float, buckets: Sequence[float] = LATENCY_BUCKETS_MS, **labels):
+    REGISTRY.observe(name, value, buckets, **labels)
+
+
+def record_request(function: str, status: Any, total_ms: float, phases: Dict[str, float], fields: Dict[str, Any]):
+    '''Всё, что timing знает о запросе: время, фазы, исход кеша, токены, ошибки апстрима'''
+    start_flusher()
+    inc('requests_total', function=function, status=status)
+    observe('request_duration_ms', total_ms, function=function)
+    for phase, ms in phases.items():
+        observe('phase_duration_ms', ms, function=function, phase=phase)
+    if 'db_connect' in phases:
+        # Пула соединений нет — ожидание базы на запросе это время подключения
+        observe('db_wait_ms', phases['db_connect'], function=function)
+    if 'cache' in fields:
+        inc('cache_requests_total', function=function, outcome=fields['cache'])
+    if fields.get('tokens'):
+        observe('llm_tokens', fields['tokens'], TOKEN_BUCKETS, function=function)
+    upstream_status = fields.get('upstream_status')
+    if fields.get('upstream_error') or (isinstance(upstream_status, int) and upstream_status >= 400):
+        inc('upstream_errors_total', function=function, status=upstream_status or fields.get('upstream_error'))
+    if 'error' in fields:
+        inc('handler_errors_total', function=function)
+    with REGISTRY.lock:
+        REGISTRY.requests += 1
+        if REGISTRY.requests >= FLUSH_REQUESTS:
+            _wake.set()
+
+
+def start_flusher():
+    '''
+    Запускает фоновый сброс при первом запросе (не при импорте — холодный старт его не ждёт).
+    Запись в базу идёт вне пути ответа; при выходе процесса дописывается остаток
+    '''
+    global _flusher
+    if _flusher is not None or not os.environ.get('DATABASE_URL'):
+        return
+    with _flusher_lock:
+        if _flusher is not None:
+            return
+        _flusher = threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True)
+        _flusher.start()
+        atexit.register(flush, True)
+
+
+def _flush_loop():
+    while True:
+        _wake.wait(FLUSH_INTERVAL)
+        _wake.clear()
+        flush()
+
+
+def flush(force: bool = False) -> int:
+    '''Дописывает дельты в function_metrics; без DATABASE_URL метрики просто копятся в памяти'''
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn or not (force or REGISTRY.due()):
+        return 0
+    rows = REGISTRY.drain()
+    if not rows:
+        return 0
+    try:
+        import psycopg2
+        conn = psycopg2.connect(dsn)
+        cur = conn.cursor()
+        cur.executemany(
+            """INSERT INTO function_metrics (function, instance, name, kind, labels, value, count, buckets, bounds)
+               VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+            [(
+                row['labels'].get('function', ''), INSTANCE_ID, row['name'], row['kind'],
+                json.dumps(row['labels'], ensure_ascii=False), row['value'],
+                row.get('count'), row.get('buckets'), row.get('bounds')
+            ) for row in rows]
+        )
+        conn.commit()
+        cur.close()
+        conn.close()
+    except Exception as e:
+        # Метрики не должны ронять запрос: дельты этого окна теряются, следующее пишется как обычно
+        print(f"Metrics flush failed: {type(e).__name__} - {e}")
+        return 0
+    return len(rows)
+
+
+def histogram_quantile(q: float, bounds: Sequence[float], counts: Sequence[int]) -> Optional[float]:
+    '''
+    Квантиль по корзинам (не накопленным), как histogram_quantile в Prometheus:
+    линейная интерполяция внутри корзины; попадание в +Inf — последняя конечная граница
+    '''
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for i, count in enumerate(counts):
+        if seen + count >= rank and count:
+            if i >= len(bounds):
+                return float(bounds[-1])
+            lower = bounds[i - 1] if i else 0.0
+            return lower + (bounds[i] - lower) * (rank - seen) / count
+        seen += count
+    return float(bounds[-1])
@@ -0,0 +1,175 @@
+'''
+Content-addressed image store for generate-image.
+Images are keyed by a hash of the prompt and render params, so the same
+request always maps to the same object and can be served without re-rendering.
+Backend: S3 (IMAGE_STORE_BUCKET and IMAGE_STORE_PUBLIC_URL set, the default when
+configured) or 'local' for development only — IMAGE_STORE_BACKEND=local must be set
+explicitly, since files on one instance's disk are invisible to the others behind the
+load balancer. Without either, get_store raises ImageStoreNotConfigured.
+'''
+
+import hashlib
+import json
+import os
+from typing import Dict, Any, Optional
+
+# Публичный адрес функции generate-image (см. backend/func2url.json)
+FUNCTION_URL = 'https://functions.poehali.dev/16a136ce-ff21-4430-80df-ad1caa87a3a7'
+
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+CONTENT_TYPES = {
+    'jpg': 'image/jpeg',
+    'webp': 'image/webp'
+}
+
+def content_type(ext: str) -> str:
+    # ext бывает составным: 'thumb.webp'
+    return CONTENT_TYPES.get(ext.rsplit('.', 1)[-1], 'application/octet-stream')
+
+def normalize_prompt(prompt: str) -> str:
+    return ' '.join(prompt.split()).lower()
+
+def prompt_seed(prompt: str) -> int:
+    '''Детерминированный seed из нормализованного промпта — один и тот же портрет рендерится одинаково'''
+    digest = hashlib.sha256(normalize_prompt(prompt).encode('utf-8')).digest()
+    return int.from_bytes(digest[:4], 'big')
+
+def image_key(prompt: str, params: Dict[str, Any]) -> str:
+    '''Стабильный ключ: sha256 от нормализованного промпта и параметров рендера'''
+    payload = json.dumps({'prompt': normalize_prompt(prompt), 'params': params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def is_valid_key(key: str) -> bool:
+    return len(key) == 64 and all(c in '0123456789abcdef' for c in key)
+
+
+class ImageStoreNotConfigured(Exception):
+    pass
+
+
+class ImageStore:
+    '''Базовый интерфейс хранилища картинок'''
+
+    def exists(self, key: str, ext: str = 'jpg') -> bool:
+        raise NotImplementedError
+
+    def get(self, key: str, ext: str = 'jpg') -> Optional[bytes]:
+        raise NotImplementedError
+
+    def put(self, key: str, data: bytes, ext: str = 'jpg') -> None:
+        raise NotImplementedError
+
+    def url(self, key: str, ext: str = 'jpg') -> str:
+        raise NotImplementedError
+
+
+class LocalImageStore(ImageStore):
+    '''Хранит файлы на диске, отдаёт их через GET этой же функции'''
+
+    def __init__(self, root: str, public_url: str):
+        self.root = root
+        self.public_url = public_url
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str, ext: str) -> str:
+        # Шардируем по первым двум символам, чтобы не держать всё в одной папке
+        return os.path.join(self.root, key[:2], f'{key}.{ext}')
+
+    def exists(self, key: str, ext: str = 'jpg') -> bool:
+        return os.path.exists(self._path(key, ext))
+
+    def get(self, key: str, ext: str = 'jpg') -> Optional[bytes]:
+        path = self._path(key, ext)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def put(self, key: str, data: bytes, ext: str = 'jpg') -> None:
+        path = self._path(key, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Пишем во временный файл и переименовываем — читатели не увидят полузаписанную картинку
+        tmp_path = f'{path}.tmp{os.getpid()}'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def url(self, key: str, ext: str = 'jpg') -> str:
+        return f'{self.public_url}?id={key}&format={ext}'
+
+
+class S3ImageStore(ImageStore):
+    '''S3-совместимое объектное хранилище, картинки отдаются напрямую из бакета'''
+
+    def __init__(self, bucket: str, public_url: str, endpoint_url: Optional[str] = None, prefix: str = 'images'):
+        import boto3
+        from botocore.exceptions import ClientError
+
+        self.client = boto3.client('s3', endpoint_url=endpoint_url)
+        self.client_error = ClientError
+        self.bucket = bucket
+        self.public_url = public_url.rstrip('/')
+        self.prefix = prefix
+
+    def _object_key(self, key: str, ext: str) -> str:
+        return f'{self.prefix}/{key[:2]}/{key}.{ext}'
+
+    def exists(self, key: str, ext: str = 'jpg') -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key, ext))
+            return True
+        except self.client_error:
+            return False
+
+    def get(self, key: str, ext: str = 'jpg') -> Optional[bytes]:
+        try:
+            obj = self.client.get_object(Bucket=self.bucket, Key=self._object_key(key, ext))
+            return obj['Body'].read()
+        except self.client_error:
+            return None
+
+    def put(self, key: str, data: bytes, ext: str = 'jpg') -> None:
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=self._object_key(key, ext),
+            Body=data,
+            ContentType=content_type(ext),
+            CacheControl=CACHE_CONTROL
+        )
+
+    def url(self, key: str, ext: str = 'jpg') -> str:
+        return f'{self.public_url}/{self._object_key(key, ext)}'
+
+
+_STORE: Optional[ImageStore] = None
+
+def get_store() -> ImageStore:
+    '''
+    Создаёт хранилище один раз на инстанс функции. Бакет задан — S3; локальный диск только
+    по явному IMAGE_STORE_BACKEND=local (разработка); иначе ImageStoreNotConfigured
+    '''
+    global _STORE
+    if _STORE is None:
+        backend = os.environ.get('IMAGE_STORE_BACKEND') or ('s3' if os.environ.get('IMAGE_STORE_BUCKET') else '')
+        if backend == 's3':
+            bucket = os.environ.get('IMAGE_STORE_BUCKET')
+            public_url = os.environ.get('IMAGE_STORE_PUBLIC_URL')
+            if not bucket or not public_url:
+                raise ImageStoreNotConfigured('IMAGE_STORE_BUCKET and IMAGE_STORE_PUBLIC_URL are required for the s3 image store')
+            _STORE = S3ImageStore(
+                bucket=bucket,
+                public_url=public_url,
+                endpoint_url=os.environ.get('IMAGE_STORE_ENDPOINT') or None
+            )
+        elif backend == 'local':
+            _STORE = LocalImageStore(
+                root=os.environ.get('IMAGE_STORE_DIR', '/tmp/generated-images'),
+                public_url=os.environ.get('IMAGE_PUBLIC_URL', FUNCTION_URL)
+            )
+        else:
+            raise ImageStoreNotConfigured(
+                'Image store is not configured: set IMAGE_STORE_BUCKET and IMAGE_STORE_PUBLIC_URL '
+                '(or IMAGE_STORE_BACKEND=local for development)'
+            )
+    return _STORE
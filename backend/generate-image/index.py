@@ -1,42 +1,128 @@
 import json
+import os
 import urllib.parse
 import time
 import base64
-from typing import Dict, Any
-import requests
+from typing import Dict, Any, Iterator, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from image_store import get_store, image_key, prompt_seed, is_valid_key, content_type, CACHE_CONTROL, ImageStoreNotConfigured
+from jobs import enqueue_job, get_job, process_pending_jobs
+from variants import VARIANT_SIZES, variant_ext, make_variants
+from translation import lookup_translation, request_translation
+from response import CORS_HEADERS, dumps, json_response, preflight
+from timing import instrument, note, timed
 
+# Параметры рендера pollinations.ai — входят в ключ хранилища
+RENDER_PARAMS = {
+    'width': 576,
+    'height': 1024,
+    'model': 'flux',
+    'enhance': True
+}
+
+# Фоновые воркеры для асинхронного режима; живут столько же, сколько инстанс функции
+WORKER_POOL = ThreadPoolExecutor(max_workers=2)
+
+class RenderError(Exception):
+    pass
+
+@timed('render')
+def render_image(prompt: str, seed: int) -> bytes:
+    '''Рендерит картинку в pollinations.ai и возвращает JPEG'''
+    import requests
+    # Кодируем промпт правильно для pollinations.ai
+    encoded_prompt = urllib.parse.quote(prompt, safe='')
+    # flux - бесплатная модель, gptimage требует авторизацию
+    image_url = (
+        f"https://image.pollinations.ai/prompt/{encoded_prompt}"
+        f"?width={RENDER_PARAMS['width']}&height={RENDER_PARAMS['height']}&seed={seed}"
+        f"&model={RENDER_PARAMS['model']}&nologo=True&enhance={RENDER_PARAMS['enhance']}"
+    )
+    
+    # Загружаем картинку с pollinations.ai, маскируясь под браузер
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        'Accept': 'image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8',
+        'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
+        'Referer': 'https://pollinations.ai/',
+        'Origin': 'https://pollinations.ai'
+    }
+    response = requests.get(image_url, headers=headers, timeout=90)
+    note(upstream_status=response.status_code)
+    
+    if response.status_code != 200:
+        raise RenderError(f'Pollinations returned {response.status_code}')
+    
+    return response.content
+
+@timed('store')
+def store_rendered(store, key: str, data: bytes) -> None:
+    '''Сохраняет исходный JPEG и его WebP-варианты рядом с ним'''
+    store.put(key, data)
+    for size, variant in make_variants(data).items():
+        store.put(key, variant, variant_ext(size))
+
+def image_urls(store, key: str, size: str = '') -> Dict[str, Any]:
+    variants = {s: store.url(key, variant_ext(s)) for s in VARIANT_SIZES}
+    return {
+        'url': variants[size] if size in variants else store.url(key),
+        'variants': variants
+    }
+
+def render_to_store(key: str, prompt: str, params: Dict[str, Any]) -> str:
+    store = get_store()
+    if not store.exists(key):
+        store_rendered(store, key, render_image(prompt, params.get('seed', prompt_seed(prompt))))
+    return store.url(key)
+
+def run_worker() -> None:
+    try:
+        process_pending_jobs(render_to_store)
+    except Exception as e:
+        print(f"Image worker failed: {type(e).__name__} - {e}")
+
+@instrument('generate-image')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
-    Business: Generates images using Pollinations.ai free API and returns as base64
-    Args: event with httpMethod, body containing prompt
+    Business: Generates images using Pollinations.ai free API, stores them by content hash and returns a stable URL
+    Args: event with httpMethod, body containing prompt, optional size, reroll, async and translate flags (POST),
+          queryStringParameters with id, size or job_id (GET), action=work (POST, X-Worker-Token) runs pending jobs
           context with request_id
-    Returns: HTTP response with base64 encoded image
+    Returns: HTTP response with image URL, 202 with job id in async mode, job status or the stored image itself
     '''
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return preflight('GET, POST, OPTIONS')
+    
+    import requests
+    
+    # Без общего хранилища ссылки на картинки работали бы только на одном инстансе — отказываем сразу
+    try:
+        get_store()
+    except ImageStoreNotConfigured as e:
+        print(f"Image store error: {e}")
+        return json_response(503, {'error': str(e)})
+    
+    params = event.get('queryStringParameters') or {}
+    
+    if method == 'GET':
+        if params.get('job_id'):
+            return job_status(params['job_id'])
+        return serve_image(event)
+    
+    # Отдельный запуск воркера (например, по расписанию) — добирает зависшие задачи. Каждый запуск
+    # рендерит чужие промпты, поэтому без IMAGE_WORKER_TOKEN эндпоинт закрыт
+    if method == 'POST' and params.get('action') == 'work':
+        token = os.environ.get('IMAGE_WORKER_TOKEN')
+        headers = event.get('headers') or {}
+        if not token or headers.get('X-Worker-Token', headers.get('x-worker-token')) != token:
+            return json_response(403, {'error': 'Invalid worker token'})
+        processed = process_pending_jobs(render_to_store)
+        return json_response(200, {'processed': processed})
     
     if method != 'POST':
-        return {
-            'statusCode': 405,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
+        return json_response(405, {'error': 'Method not allowed'})
     
     body_str = event.get('body', '{}')
     if not body_str or body_str.strip() == '':
@@ -44,77 +130,197 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     body_data = json.loads(body_str)
     prompt = body_data.get('prompt', '')
+    size = body_data.get('size', '')
     
     if not prompt:
-        return {
-            'statusCode': 400,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Prompt is required'}),
-            'isBase64Encoded': False
-        }
+        return json_response(400, {'error': 'Prompt is required'})
     
-    seed = int(time.time() * 1000)
+    # Русский промпт: перевод и рендер за один запрос, без клиента посередине
+    if body_data.get('translate'):
+        return pipeline_response(event, prompt, size, bool(body_data.get('reroll')))
     
-    # Кодируем промпт правильно для pollinations.ai
-    encoded_prompt = urllib.parse.quote(prompt, safe='')
-    # flux - бесплатная модель, gptimage требует авторизацию
-    image_url = f'https://image.pollinations.ai/prompt/{encoded_prompt}?width=576&height=1024&seed={seed}&model=flux&nologo=True&enhance=True'
+    # По умолчанию seed выводится из промпта, и повторный запрос попадает в уже готовую картинку.
+    # reroll даёт новый вариант — со своим seed и своим ключом.
+    seed = int(time.time() * 1000) if body_data.get('reroll') else prompt_seed(prompt)
+    render_params = {**RENDER_PARAMS, 'seed': seed}
+    
+    store = get_store()
+    key = image_key(prompt, render_params)
+    
+    # Такая картинка уже есть — генерацию пропускаем
+    if store.exists(key):
+        # Картинки, сохранённые до появления вариантов, дотранскодируем один раз
+        if not store.exists(key, variant_ext('thumb')):
+            store_rendered(store, key, store.get(key))
+        return json_response(200, {**image_urls(store, key, size), 'id': key, 'seed': seed, 'cached': True}, headers={'X-Cache': 'HIT'})
+    
+    if body_data.get('async'):
+        return submit_job(key, prompt, render_params)
     
     try:
-        # Загружаем картинку с pollinations.ai, маскируясь под браузер
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8',
-            'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
-            'Referer': 'https://pollinations.ai/',
-            'Origin': 'https://pollinations.ai'
-        }
-        response = requests.get(image_url, headers=headers, timeout=90)
+        store_rendered(store, key, render_image(prompt, seed))
         
-        if response.status_code != 200:
-            return {
-                'statusCode': 500,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': f'Pollinations returned {response.status_code}'}),
-                'isBase64Encoded': False
-            }
-        
-        # Конвертируем в base64
-        image_base64 = base64.b64encode(response.content).decode('utf-8')
-        data_url = f'data:image/jpeg;base64,{image_base64}'
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'url': data_url}),
-            'isBase64Encoded': False
-        }
+        return json_response(200, {**image_urls(store, key, size), 'id': key, 'seed': seed, 'cached': False}, headers={'X-Cache': 'MISS'})
+    except RenderError as e:
+        return json_response(500, {'error': str(e)})
     except requests.exceptions.Timeout:
-        return {
-            'statusCode': 504,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Image generation timeout - try again'}),
-            'isBase64Encoded': False
-        }
+        return json_response(504, {'error': 'Image generation timeout - try again'})
     except Exception as e:
+        return json_response(500, {'error': f'Failed to generate image: {str(e)}'})
+
+def serve_image(event: Dict[str, Any]) -> Dict[str, Any]:
+    '''Отдаёт сохранённую картинку по id с долгим кешированием — содержимое по ключу не меняется'''
+    params = event.get('queryStringParameters') or {}
+    key = params.get('id', '')
+    size = params.get('size', '')
+    ext = variant_ext(size) if size else params.get('format', 'jpg')
+    allowed = {'jpg'} | {variant_ext(s) for s in VARIANT_SIZES}
+    
+    if not is_valid_key(key) or ext not in allowed:
+        return json_response(400, {'error': 'Invalid image id'})
+    
+    store = get_store()
+    data = store.get(key, ext)
+    
+    # Варианта ещё нет, а исходник есть — транскодируем по запросу
+    if data is None and ext != 'jpg':
+        original = store.get(key)
+        if original is not None:
+            store_rendered(store, key, original)
+            data = store.get(key, ext)
+    
+    if data is None:
+        return json_response(404, {'error': 'Image not found'})
+    
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': content_type(ext),
+            'Cache-Control': CACHE_CONTROL,
+            'ETag': f'"{key}"',
+            **CORS_HEADERS
+        },
+        'body': base64.b64encode(data).decode('utf-8'),
+        'isBase64Encoded': True
+    }
+
+def submit_job(key: str, prompt: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    '''Асинхронный режим: ставит задачу в очередь и сразу отвечает 202'''
+    if not os.environ.get('DATABASE_URL'):
+        return json_response(500, {'error': 'Database not configured'})
+    
+    job = enqueue_job(key, prompt, params)
+    WORKER_POOL.submit(run_worker)
+    
+    return json_response(202, {'job_id': job['id'], 'status': 'pending', 'id': key})
+
+def job_status(job_id: str) -> Dict[str, Any]:
+    if not job_id.isdigit():
+        return json_response(400, {'error': 'Invalid job id'})
+    
+    job = get_job(int(job_id))
+    if not job:
+        return json_response(404, {'error': 'Job not found'})
+    
+    # Для клиента running — тот же pending
+    status = 'pending' if job['status'] in ('pending', 'running') else job['status']
+    result: Dict[str, Any] = {'job_id': job['id'], 'status': status, 'id': job['image_key']}
+    if status == 'done':
+        result['url'] = job['result_url']
+    elif status == 'failed':
+        result['error'] = job['error']
+    else:
+        # Поллинг заодно будит воркер, если прошлый инстанс бросил задачу
+        WORKER_POOL.submit(run_worker)
+    
+    return json_response(200, result, headers={'Cache-Control': 'no-store'})
+
+def translate_cached(prompt: str) -> Tuple[str, bool]:
+    cached = lookup_translation(prompt)
+    if cached:
+        return cached, True
+    api_key = os.environ.get('DEEPSEEK_API_KEY')
+    if not api_key:
+        raise RuntimeError('API key not configured')
+    return request_translation(prompt, api_key), False
+
+def run_pipeline(prompt: str, size: str, reroll: bool) -> Iterator[Dict[str, Any]]:
+    '''
+    Конвейер перевод → улучшение → рендер, возвращает события прогресса по шагам.
+    Сначала ищется готовая картинка по исходному русскому промпту: при попадании перевод
+    (кеш в памяти, БД, затем платный LLM) не нужен вовсе.
+    '''
+    import requests
+    store = get_store()
+    # Алиас: русский промпт → ключ уже отрендеренной картинки
+    alias_key = image_key(prompt, {**RENDER_PARAMS, 'source': 'ru'})
+    
+    if not reroll:
+        target = store.get(alias_key, 'alias')
+        if target and store.exists(target.decode('utf-8')):
+            key = target.decode('utf-8')
+            yield {'stage': 'lookup', 'status': 'hit'}
+            yield {'stage': 'done', **image_urls(store, key, size), 'id': key, 'cached': True}
+            return
+        yield {'stage': 'lookup', 'status': 'miss'}
+    
+    yield {'stage': 'translate', 'status': 'started'}
+    try:
+        translated, translation_cached = translate_cached(prompt)
+    except Exception as e:
+        yield {'stage': 'error', 'error': f'Translation failed: {str(e)}'}
+        return
+    yield {'stage': 'translate', 'status': 'done', 'cached': translation_cached, 'translated': translated}
+    
+    # Seed и ключ считаются от английского промпта — так же, как при прямом вызове generate-image
+    seed = int(time.time() * 1000) if reroll else prompt_seed(translated)
+    key = image_key(translated, {**RENDER_PARAMS, 'seed': seed})
+    
+    cached = store.exists(key)
+    if not cached:
+        yield {'stage': 'render', 'status': 'started', 'seed': seed}
+        try:
+            store_rendered(store, key, render_image(translated, seed))
+        except requests.exceptions.Timeout:
+            yield {'stage': 'error', 'error': 'Image generation timeout - try again'}
+            return
+        except Exception as e:
+            yield {'stage': 'error', 'error': f'Failed to generate image: {str(e)}'}
+            return
+        yield {'stage': 'render', 'status': 'done'}
+    
+    if not reroll:
+        store.put(alias_key, key.encode('utf-8'), 'alias')
+    
+    yield {'stage': 'done', **image_urls(store, key, size), 'id': key, 'seed': seed, 'translated': translated, 'cached': cached}
+
+def pipeline_response(event: Dict[str, Any], prompt: str, size: str, reroll: bool) -> Dict[str, Any]:
+    '''
+    Ответ не потоковый: handler возвращает тело целиком, поэтому события собираются до конца конвейера
+    и приходят вместе с результатом как журнал шагов. С Accept: text/event-stream журнал в формате SSE
+    (одним телом), иначе — итоговый JSON со списком событий
+    '''
+    events = list(run_pipeline(prompt, size, reroll))
+    final = events[-1]
+    status_code = 500 if final['stage'] == 'error' else 200
+    
+    headers = event.get('headers') or {}
+    accept = headers.get('Accept', headers.get('accept', ''))
+    if 'text/event-stream' in accept:
+        body = ''.join(
+            f"event: {e['stage']}\ndata: {dumps(e)}\n\n" for e in events
+        )
         return {
-            'statusCode': 500,
+            'statusCode': status_code,
             'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
+                'Content-Type': 'text/event-stream; charset=utf-8',
+                'Cache-Control': 'no-store',
+                **CORS_HEADERS
             },
-            'body': json.dumps({'error': f'Failed to generate image: {str(e)}'}),
+            'body': body,
             'isBase64Encoded': False
-        }
\ No newline at end of file
+        }
+    
+    result = {k: v for k, v in final.items() if k != 'stage'}
+    result['events'] = events[:-1]
+    return json_response(status_code, result)
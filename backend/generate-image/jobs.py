@@ -0,0 +1,123 @@
+'''
+Postgres-backed queue of image generation jobs.
+Workers claim jobs with FOR UPDATE SKIP LOCKED, so several instances can
+drain the same table without blocking each other or rendering a job twice.
+'''
+
+import json
+import os
+from typing import Dict, Any, Optional, Callable
+from timing import connect_db
+
+MAX_ATTEMPTS = 3
+# Задача в статусе running дольше этого считается брошенной (инстанс заморозили/убили)
+STALE_AFTER_SECONDS = 300
+
+def get_db_connection():
+    from psycopg2.extras import RealDictCursor
+    dsn = os.environ.get('DATABASE_URL')
+    return connect_db(dsn, cursor_factory=RealDictCursor)
+
+def enqueue_job(image_key: str, prompt: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    '''Ставит задачу в очередь; если такая же картинка уже в работе — возвращает существующую задачу'''
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            """SELECT id, status FROM image_jobs
+               WHERE image_key = %s AND status IN ('pending', 'running')
+               ORDER BY created_at DESC LIMIT 1""",
+            (image_key,)
+        )
+        existing = cur.fetchone()
+        if existing:
+            return dict(existing)
+
+        cur.execute(
+            """INSERT INTO image_jobs (image_key, prompt, params)
+               VALUES (%s, %s, %s)
+               RETURNING id, status""",
+            (image_key, prompt, json.dumps(params))
+        )
+        job = cur.fetchone()
+        conn.commit()
+        return dict(job)
+    finally:
+        cur.close()
+        conn.close()
+
+def get_job(job_id: int) -> Optional[Dict[str, Any]]:
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            """SELECT id, image_key, status, result_url, error, attempts, created_at, finished_at
+               FROM image_jobs WHERE id = %s""",
+            (job_id,)
+        )
+        job = cur.fetchone()
+        return dict(job) if job else None
+    finally:
+        cur.close()
+        conn.close()
+
+def claim_job(cur) -> Optional[Dict[str, Any]]:
+    cur.execute(
+        """SELECT id, image_key, prompt, params, attempts FROM image_jobs
+           WHERE status = 'pending'
+              OR (status = 'running' AND started_at < CURRENT_TIMESTAMP - make_interval(secs => %s))
+           ORDER BY created_at
+           FOR UPDATE SKIP LOCKED
+           LIMIT 1""",
+        (STALE_AFTER_SECONDS,)
+    )
+    job = cur.fetchone()
+    if not job:
+        return None
+    cur.execute(
+        """UPDATE image_jobs
+           SET status = 'running', started_at = CURRENT_TIMESTAMP, attempts = attempts + 1
+           WHERE id = %s""",
+        (job['id'],)
+    )
+    return dict(job)
+
+def process_pending_jobs(render: Callable[[str, str, Dict[str, Any]], str], limit: int = 5) -> int:
+    '''
+    Забирает и выполняет до limit задач.
+    render(image_key, prompt, params) сохраняет картинку и возвращает её URL.
+    '''
+    processed = 0
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        while processed < limit:
+            # Короткая транзакция только на захват — рендер идёт без удержания блокировки
+            job = claim_job(cur)
+            conn.commit()
+            if not job:
+                break
+
+            try:
+                result_url = render(job['image_key'], job['prompt'], job['params'] or {})
+                cur.execute(
+                    """UPDATE image_jobs
+                       SET status = 'done', result_url = %s, error = NULL, finished_at = CURRENT_TIMESTAMP
+                       WHERE id = %s""",
+                    (result_url, job['id'])
+                )
+            except Exception as e:
+                final = job['attempts'] + 1 >= MAX_ATTEMPTS
+                cur.execute(
+                    """UPDATE image_jobs
+                       SET status = %s, error = %s, finished_at = CASE WHEN %s THEN CURRENT_TIMESTAMP END
+                       WHERE id = %s""",
+                    ('failed' if final else 'pending', str(e)[:500], final, job['id'])
+                )
+                print(f"Image job {job['id']} attempt {job['attempts'] + 1} failed: {type(e).__name__} - {e}")
+            conn.commit()
+            processed += 1
+    finally:
+        cur.close()
+        conn.close()
+    return processed
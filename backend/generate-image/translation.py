@@ -0,0 +1,135 @@
+'''
+Translation of Russian image prompts into English FLUX prompts with a two-level cache.
+Shared by translate-prompt and the translate-and-render pipeline in generate-image —
+keep both copies of this file identical.
+'''
+
+import hashlib
+import os
+import time
+from typing import Dict, Optional
+from timing import connect_db, note, span, timed
+
+DEEPSEEK_BASE_URL = os.environ.get('DEEPSEEK_BASE_URL', 'https://api.deepseek.com')
+
+TRANSLATE_SYSTEM_PROMPT = 'You are a professional translator for AI image generation. Translate Russian descriptions into detailed English prompts optimized for FLUX model. Add artistic details, style keywords, and quality tags. Keep it under 150 words. Focus on: lighting, atmosphere, style (dark fantasy, realistic, cinematic), composition, details.'
+
+# Кеш переводов: при temperature 0 перевод одного и того же текста стабилен
+CACHE: Dict[str, tuple] = {}
+CACHE_TTL = 86400  # сутки
+CACHE_MAX_SIZE = 500
+
+def normalize_source(prompt: str) -> str:
+    return ' '.join(prompt.split()).lower()
+
+def get_cache_key(prompt: str) -> str:
+    return hashlib.md5(normalize_source(prompt).encode('utf-8')).hexdigest()
+
+def get_from_cache(key: str) -> str | None:
+    if key in CACHE:
+        cached_time, cached_value = CACHE[key]
+        if time.time() - cached_time < CACHE_TTL:
+            return cached_value
+        else:
+            del CACHE[key]
+    return None
+
+def save_to_cache(key: str, value: str):
+    CACHE[key] = (time.time(), value)
+    if len(CACHE) > CACHE_MAX_SIZE:
+        current_time = time.time()
+        expired_keys = [k for k, (t, _) in CACHE.items() if current_time - t >= CACHE_TTL]
+        for k in expired_keys:
+            del CACHE[k]
+        # Если всё свежее — выкидываем самые старые записи
+        if len(CACHE) > CACHE_MAX_SIZE:
+            oldest = sorted(CACHE, key=lambda k: CACHE[k][0])[:len(CACHE) - CACHE_MAX_SIZE]
+            for k in oldest:
+                del CACHE[k]
+
+def load_translation(key: str) -> Optional[str]:
+    '''Второй уровень кеша в БД — переживает холодные старты и делится между инстансами'''
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        return None
+    import psycopg2
+    try:
+        conn = connect_db(dsn)
+        cur = conn.cursor()
+        cur.execute("SELECT translated FROM prompt_translations WHERE source_hash = %s", (key,))
+        row = cur.fetchone()
+        cur.close()
+        conn.close()
+        return row[0] if row else None
+    except psycopg2.Error as e:
+        print(f"Translation cache read failed: {e}")
+        return None
+
+def store_translation(key: str, source: str, translated: str):
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        return
+    import psycopg2
+    try:
+        conn = connect_db(dsn)
+        cur = conn.cursor()
+        cur.execute(
+            """INSERT INTO prompt_translations (source_hash, source_text, translated)
+               VALUES (%s, %s, %s)
+               ON CONFLICT (source_hash) DO NOTHING""",
+            (key, normalize_source(source), translated)
+        )
+        conn.commit()
+        cur.close()
+        conn.close()
+    except psycopg2.Error as e:
+        print(f"Translation cache write failed: {e}")
+
+@timed('translation_cache')
+def lookup_translation(prompt: str) -> Optional[str]:
+    '''Ищет перевод в памяти, затем в БД; LLM не вызывает'''
+    cache_key = get_cache_key(prompt)
+    cached = get_from_cache(cache_key) or load_translation(cache_key)
+    note(cache='hit' if cached else 'miss')
+    if cached:
+        save_to_cache(cache_key, cached)
+    return cached
+
+def request_translation(prompt: str, api_key: str) -> str:
+    '''Переводит через DeepSeek и кладёт результат в оба уровня кеша'''
+    import requests
+    with span('deepseek'):
+        response = requests.post(
+            f'{DEEPSEEK_BASE_URL}/v1/chat/completions',
+            headers={
+                'Authorization': f'Bearer {api_key}',
+                'Content-Type': 'application/json'
+            },
+            json={
+                'model': 'deepseek-chat',
+                'messages': [
+                    {
+                        'role': 'system',
+                        'content': TRANSLATE_SYSTEM_PROMPT
+                    },
+                    {
+                        'role': 'user',
+                        'content': f'Translate and enhance this description for FLUX image generation: {prompt}'
+                    }
+                ],
+                'temperature': 0,
+                'max_tokens': 200
+            },
+            timeout=30
+        )
+    note(upstream_status=response.status_code)
+    response.raise_for_status()
+    data = response.json()
+    note(tokens=data.get('usage', {}).get('total_tokens'))
+    
+    translated = data['choices'][0]['message']['content'].strip()
+    
+    cache_key = get_cache_key(prompt)
+    save_to_cache(cache_key, translated)
+    store_translation(cache_key, prompt, translated)
+    return translated
@@ -0,0 +1,59 @@
+'''
+WebP variants of generated images (thumb, card, full).
+Transcoding is CPU-bound, so it runs in a small process pool instead of the
+handler thread; a batch of portraits is spread across worker processes.
+'''
+
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+
+# Ширина x высота для каждого размера; исходник 576x1024
+VARIANT_SIZES = {
+    'thumb': (144, 256),
+    'card': (288, 512),
+    'full': (576, 1024)
+}
+
+WEBP_QUALITY = int(os.environ.get('IMAGE_WEBP_QUALITY', '80'))
+TRANSCODE_TIMEOUT = 30
+
+_POOL: Optional[ProcessPoolExecutor] = None
+
+def variant_ext(size: str) -> str:
+    return f'{size}.webp'
+
+def transcode(data: bytes, size: str) -> bytes:
+    '''Уменьшает картинку до размера size и кодирует в WebP; выполняется в дочернем процессе'''
+    from PIL import Image
+
+    width, height = VARIANT_SIZES[size]
+    with Image.open(io.BytesIO(data)) as img:
+        img = img.convert('RGB')
+        if img.size != (width, height):
+            img.thumbnail((width, height), Image.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, format='WEBP', quality=WEBP_QUALITY, method=4)
+        return out.getvalue()
+
+def get_pool() -> ProcessPoolExecutor:
+    # Пул создаётся при первой транскодировке, чтобы не платить за него на холодном старте
+    global _POOL
+    if _POOL is None:
+        workers = int(os.environ.get('IMAGE_TRANSCODE_WORKERS', '0')) or min(2, os.cpu_count() or 1)
+        _POOL = ProcessPoolExecutor(max_workers=workers)
+    return _POOL
+
+def make_variants(data: bytes, sizes=None) -> Dict[str, bytes]:
+    '''Транскодирует исходник во все размеры параллельно; при ошибке размер пропускается'''
+    sizes = sizes or list(VARIANT_SIZES)
+    pool = get_pool()
+    futures = {size: pool.submit(transcode, data, size) for size in sizes}
+    variants: Dict[str, bytes] = {}
+    for size, future in futures.items():
+        try:
+            variants[size] = future.result(timeout=TRANSCODE_TIMEOUT)
+        except Exception as e:
+            print(f"WebP transcode failed for {size}: {type(e).__name__} - {e}")
+    return variants
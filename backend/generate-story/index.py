@@ -1,8 +1,12 @@
 import json
 import os
 from typing import Dict, Any
-import requests
+from response import json_response, preflight
+from timing import instrument, note, span
 
+DEEPSEEK_BASE_URL = os.environ.get('DEEPSEEK_BASE_URL', 'https://api.deepseek.com')
+
+@instrument('generate-story')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Generates creative stories using DeepSeek AI without censorship
@@ -13,26 +17,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     # Handle CORS OPTIONS request
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
+        return preflight('POST, OPTIONS', 'Content-Type, X-User-Id')
+    
+    import requests
     
     if method != 'POST':
-        return {
-            'statusCode': 405,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
+        return json_response(405, {'error': 'Method not allowed'})
     
     # Parse request body
     body_str = event.get('body') or '{}'
@@ -52,26 +42,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     is_continuation = bool(story_context and player_action)
     
     if not prompt and not is_continuation:
-        return {
-            'statusCode': 400,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Prompt is required'})
-        }
+        return json_response(400, {'error': 'Prompt is required'})
     
     # Get DeepSeek API key from environment
     api_key = os.environ.get('DEEPSEEK_API_KEY')
     if not api_key:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'API key not configured'})
-        }
+        return json_response(500, {'error': 'API key not configured'})
     
     # Build system prompt based on narrative mode
     narrative_instructions = {
@@ -117,28 +93,24 @@ NPC: {npc_characters}
         'stream': False
     }
     
-    response = requests.post(
-        'https://api.deepseek.com/v1/chat/completions',
-        headers=headers,
-        json=payload,
-        timeout=25
-    )
+    with span('deepseek'):
+        response = requests.post(
+            f'{DEEPSEEK_BASE_URL}/v1/chat/completions',
+            headers=headers,
+            json=payload,
+            timeout=25
+        )
+    note(upstream_status=response.status_code)
     
     if response.status_code != 200:
-        return {
-            'statusCode': response.status_code,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'error': 'DeepSeek API error',
-                'details': response.text
-            })
-        }
+        return json_response(response.status_code, {
+            'error': 'DeepSeek API error',
+            'details': response.text
+        })
     
     result = response.json()
     story_text = result['choices'][0]['message']['content']
+    note(tokens=result.get('usage', {}).get('total_tokens'))
     
     response_key = 'continuation' if is_continuation else 'story'
     response_data = {
@@ -147,12 +119,4 @@ NPC: {npc_characters}
         'tokens_used': result.get('usage', {}).get('total_tokens', 0)
     }
     
-    return {
-        'statusCode': 200,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*'
-        },
-        'isBase64Encoded': False,
-        'body': json.dumps(response_data, ensure_ascii=False)
-    }
\ No newline at end of file
+    return json_response(200, response_data)
\ No newline at end of file
@@ -0,0 +1,192 @@
+'''
+Business: Метрики всех функций из function_metrics — Prometheus-текст и перцентили задержек по окнам
+Args: event с httpMethod GET; queryStringParameters: format=prometheus или window (с), step (с), function
+Returns: text/plain в формате Prometheus или JSON с частотой запросов, p50/p95/p99, ошибками и долей попаданий в кеш
+'''
+
+import json
+import os
+from typing import Dict, Any, List, Optional
+from metrics import LATENCY_BUCKETS_MS, histogram_quantile
+from response import CORS_HEADERS, compress, json_response, preflight
+from timing import connect_db, instrument
+
+DEFAULT_WINDOW = 3600
+MAX_WINDOW = 30 * 86400
+
+# Gauge без свежих записей — экземпляр уже остановлен
+GAUGE_STALE_SECONDS = 600
+
+def int_param(params: Dict[str, Any], name: str, default: int, upper: int) -> int:
+    value = params.get(name, '')
+    if not str(value).isdigit() or int(value) <= 0:
+        return default
+    return min(int(value), upper)
+
+def prometheus_number(value: float) -> str:
+    '''Целые без экспоненты: {:g} превратил бы счётчик 1234567 в 1.23457e+06'''
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+def prometheus_labels(labels: Dict[str, Any], extra: Optional[Dict[str, str]] = None) -> str:
+    items = {**labels, **(extra or {})}
+    if not items:
+        return ''
+    escaped = (
+        f'{k}="' + str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for k, v in sorted(items.items())
+    )
+    return '{' + ','.join(escaped) + '}'
+
+def prometheus_text(cur) -> str:
+    '''
+    Счётчики и гистограммы — сумма дельт за всё время (монотонно растут, как ждёт Prometheus),
+    gauge — последнее значение каждого живого экземпляра
+    '''
+    lines: List[str] = []
+    typed = set()
+
+    def declare(name: str, kind: str):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f'# TYPE {name} {kind}')
+
+    cur.execute("""
+        SELECT name, labels, SUM(value) FROM function_metrics
+        WHERE kind = 'counter' GROUP BY name, labels ORDER BY name
+    """)
+    for name, labels, value in cur.fetchall():
+        declare(name, 'counter')
+        lines.append(f'{name}{prometheus_labels(labels)} {prometheus_number(value)}')
+
+    cur.execute("""
+        SELECT DISTINCT ON (name, labels) name, labels, value FROM function_metrics
+        WHERE kind = 'gauge' AND recorded_at >= NOW() - make_interval(secs => %s)
+        ORDER BY name, labels, recorded_at DESC
+    """, (GAUGE_STALE_SECONDS,))
+    for name, labels, value in cur.fetchall():
+        declare(name, 'gauge')
+        lines.append(f'{name}{prometheus_labels(labels)} {prometheus_number(value)}')
+
+    cur.execute("""
+        SELECT m.name, m.labels, m.bounds, b.i, SUM(b.c)
+        FROM function_metrics m, unnest(m.buckets) WITH ORDINALITY AS b(c, i)
+        WHERE m.kind = 'histogram'
+        GROUP BY m.name, m.labels, m.bounds, b.i
+        ORDER BY m.name, m.labels::text, b.i
+    """)
+    histograms: Dict[tuple, Dict[str, Any]] = {}
+    for name, labels, bounds, index, count in cur.fetchall():
+        key = (name, json.dumps(labels, sort_keys=True))
+        entry = histograms.setdefault(key, {'name': name, 'labels': labels, 'bounds': bounds, 'counts': {}})
+        entry['counts'][index] = int(count)
+    cur.execute("""
+        SELECT name, labels, SUM(value), SUM(count) FROM function_metrics
+        WHERE kind = 'histogram' GROUP BY name, labels
+    """)
+    totals = {(name, json.dumps(labels, sort_keys=True)): (total, count) for name, labels, total, count in cur.fetchall()}
+
+    for key, entry in histograms.items():
+        name, labels = entry['name'], entry['labels']
+        declare(name, 'histogram')
+        cumulative = 0
+        for i, bound in enumerate(entry['bounds'] + [None], start=1):
+            cumulative += entry['counts'].get(i, 0)
+            le = '+Inf' if bound is None else f'{bound:g}'
+            lines.append(f'{name}_bucket{prometheus_labels(labels, {"le": le})} {cumulative}')
+        total, count = totals.get(key, (0, 0))
+        lines.append(f'{name}_sum{prometheus_labels(labels)} {prometheus_number(total)}')
+        lines.append(f'{name}_count{prometheus_labels(labels)} {int(count)}')
+    return '\n'.join(lines) + '\n'
+
+def window_report(cur, window: int, step: int, function: str) -> Dict[str, Any]:
+    '''По каждой функции и каждому отрезку step секунд за последние window секунд'''
+    function_filter = 'AND function = %s' if function else ''
+    extra = (function,) if function else ()
+    bucket_expr = 'to_timestamp(floor(extract(epoch FROM recorded_at) / %s) * %s)'
+    report: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+    def slot(fn: str, started) -> Dict[str, Any]:
+        return report.setdefault(fn, {}).setdefault(started.isoformat(), {
+            'window_start': started.isoformat(), 'requests': 0, 'errors': 0, 'counts': [0] * (len(LATENCY_BUCKETS_MS) + 1),
+            'cache': {}
+        })
+
+    cur.execute(f"""
+        SELECT function, {bucket_expr} AS started, b.i, SUM(b.c)
+        FROM function_metrics, unnest(buckets) WITH ORDINALITY AS b(c, i)
+        WHERE name = 'request_duration_ms' AND recorded_at >= NOW() - make_interval(secs => %s) {function_filter}
+        GROUP BY 1, 2, 3
+    """, (step, step, window, *extra))
+    for fn, started, index, count in cur.fetchall():
+        if index <= len(LATENCY_BUCKETS_MS) + 1:
+            slot(fn, started)['counts'][index - 1] += int(count)
+
+    cur.execute(f"""
+        SELECT function, {bucket_expr} AS started, name, labels->>'status', labels->>'outcome', SUM(value)
+        FROM function_metrics
+        WHERE name IN ('requests_total', 'cache_requests_total')
+          AND recorded_at >= NOW() - make_interval(secs => %s) {function_filter}
+        GROUP BY 1, 2, 3, 4, 5
+    """, (step, step, window, *extra))
+    for fn, started, name, status, outcome, value in cur.fetchall():
+        entry = slot(fn, started)
+        if name == 'requests_total':
+            entry['requests'] += int(value)
+            if not status.isdigit() or int(status) >= 500:
+                entry['errors'] += int(value)
+        else:
+            entry['cache'][outcome] = entry['cache'].get(outcome, 0) + int(value)
+
+    functions = {}
+    for fn, slots in sorted(report.items()):
+        rows = []
+        for entry in sorted(slots.values(), key=lambda e: e['window_start']):
+            counts = entry.pop('counts')
+            cache = entry.pop('cache')
+            lookups = sum(cache.values())
+            entry['rps'] = round(entry['requests'] / step, 4)
+            for q in (0.5, 0.95, 0.99):
+                value = histogram_quantile(q, LATENCY_BUCKETS_MS, counts)
+                entry[f'p{int(q * 100)}_ms'] = round(value, 1) if value is not None else None
+            entry['cache_hit_ratio'] = round(cache.get('hit', 0) / lookups, 3) if lookups else None
+            rows.append(entry)
+        functions[fn] = rows
+    return {'window_seconds': window, 'step_seconds': step, 'functions': functions}
+
+@instrument('metrics')
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return preflight('GET, OPTIONS', 'Content-Type, X-Metrics-Token')
+
+    if method != 'GET':
+        return json_response(405, {'error': 'Method not allowed'})
+
+    # Метрики раскрывают нагрузку и ошибки всех функций — без METRICS_TOKEN эндпоинт закрыт
+    token = os.environ.get('METRICS_TOKEN')
+    headers = event.get('headers') or {}
+    if not token or headers.get('X-Metrics-Token', headers.get('x-metrics-token')) != token:
+        return json_response(403, {'error': 'Invalid metrics token'})
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        return json_response(500, {'error': 'Database not configured'})
+
+    params = event.get('queryStringParameters') or {}
+    conn = connect_db(dsn)
+    cur = conn.cursor()
+    try:
+        if params.get('format') == 'prometheus':
+            return compress({
+                'statusCode': 200,
+                'headers': {'Content-Type': 'text/plain; version=0.0.4', **CORS_HEADERS},
+                'body': prometheus_text(cur),
+                'isBase64Encoded': False
+            })
+        window = int_param(params, 'window', DEFAULT_WINDOW, MAX_WINDOW)
+        step = int_param(params, 'step', window, window)
+        return json_response(200, window_report(cur, window, step, params.get('function', '')))
+    finally:
+        cur.close()
+        conn.close()
@@ -8,15 +8,15 @@ import os
 import hashlib
 import hmac
 import base64
-import jwt
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional
-import psycopg2
-from psycopg2.extras import RealDictCursor
 from urllib.parse import urlencode
 import urllib.request
+from response import json_response, preflight
+from timing import connect_db, instrument, span, timed
 
 def create_token(user_id: int, username: str) -> str:
+    import jwt
     jwt_secret = os.environ.get('JWT_SECRET')
     if not jwt_secret:
         raise ValueError('JWT_SECRET not configured')
@@ -41,6 +41,7 @@ def verify_telegram_auth(auth_data: Dict[str, Any], bot_token: str) -> bool:
     
     return calculated_hash == check_hash
 
+@timed('vk')
 def get_vk_user_info(access_token: str) -> Optional[Dict[str, Any]]:
     try:
         url = f'https://api.vk.com/method/users.get?access_token={access_token}&v=5.131&fields=photo_200'
@@ -52,36 +53,24 @@ def get_vk_user_info(access_token: str) -> Optional[Dict[str, Any]]:
         pass
     return None
 
+@instrument('oauth')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return preflight('GET, POST, OPTIONS')
+    
+    from psycopg2.extras import RealDictCursor
     
     dsn = os.environ.get('DATABASE_URL')
     if not dsn:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Database configuration error'}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': 'Database configuration error'})
     
     vk_app_id = os.environ.get('VK_APP_ID')
     vk_app_secret = os.environ.get('VK_APP_SECRET')
     telegram_bot_token = os.environ.get('TELEGRAM_BOT_TOKEN')
     
-    conn = psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    conn = connect_db(dsn, cursor_factory=RealDictCursor)
     
     try:
         if method == 'POST':
@@ -93,33 +82,18 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 redirect_uri = body.get('redirect_uri')
                 
                 if not code or not vk_app_id or not vk_app_secret:
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Missing VK credentials'}),
-                        'isBase64Encoded': False
-                    }
+                    return json_response(400, {'error': 'Missing VK credentials'})
                 
                 token_url = f'https://oauth.vk.com/access_token?client_id={vk_app_id}&client_secret={vk_app_secret}&redirect_uri={redirect_uri}&code={code}'
                 
                 try:
-                    with urllib.request.urlopen(token_url) as response:
+                    with span('vk'), urllib.request.urlopen(token_url) as response:
                         token_data = json.loads(response.read())
                 except Exception as e:
-                    return {
-                        'statusCode': 401,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': f'VK request failed: {str(e)}'}),
-                        'isBase64Encoded': False
-                    }
+                    return json_response(401, {'error': f'VK request failed: {str(e)}'})
                 
                 if 'access_token' not in token_data:
-                    return {
-                        'statusCode': 401,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'VK auth failed', 'details': token_data}),
-                        'isBase64Encoded': False
-                    }
+                    return json_response(401, {'error': 'VK auth failed', 'details': token_data})
                 
                 vk_user_id = str(token_data['user_id'])
                 user_info = get_vk_user_info(token_data['access_token'])
@@ -130,18 +104,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 
                 if user:
                     token = create_token(user['id'], user['username'])
-                    return {
-                        'statusCode': 200,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({
-                            'token': token,
-                            'user': {
-                                'id': user['id'],
-                                'username': user['username'],
-                                'email': user['email']
-                            }
-                        })
-                    }
+                    return json_response(200, {
+                        'token': token,
+                        'user': {
+                            'id': user['id'],
+                            'username': user['username'],
+                            'email': user['email']
+                        }
+                    })
                 else:
                     username = f'vk_{vk_user_id}'
                     email = f'vk_{vk_user_id}@vk.com'
@@ -157,29 +127,20 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     conn.commit()
                     
                     token = create_token(new_user['id'], new_user['username'])
-                    return {
-                        'statusCode': 201,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({
-                            'token': token,
-                            'user': {
-                                'id': new_user['id'],
-                                'username': new_user['username'],
-                                'email': new_user['email']
-                            }
-                        })
-                    }
+                    return json_response(201, {
+                        'token': token,
+                        'user': {
+                            'id': new_user['id'],
+                            'username': new_user['username'],
+                            'email': new_user['email']
+                        }
+                    })
             
             elif provider == 'telegram':
                 auth_data = body.get('auth_data', {})
                 
                 if not telegram_bot_token or not verify_telegram_auth(auth_data.copy(), telegram_bot_token):
-                    return {
-                        'statusCode': 401,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Telegram auth verification failed'}),
-                        'isBase64Encoded': False
-                    }
+                    return json_response(401, {'error': 'Telegram auth verification failed'})
                 
                 telegram_id = str(auth_data.get('id'))
                 username = auth_data.get('username', f'tg_{telegram_id}')
@@ -193,18 +154,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 
                 if user:
                     token = create_token(user['id'], user['username'])
-                    return {
-                        'statusCode': 200,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({
-                            'token': token,
-                            'user': {
-                                'id': user['id'],
-                                'username': user['username'],
-                                'email': user['email']
-                            }
-                        })
-                    }
+                    return json_response(200, {
+                        'token': token,
+                        'user': {
+                            'id': user['id'],
+                            'username': user['username'],
+                            'email': user['email']
+                        }
+                    })
                 else:
                     email = f'tg_{telegram_id}@telegram.org'
                     display_name = f'{first_name} {last_name}'.strip() or username
@@ -218,19 +175,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     conn.commit()
                     
                     token = create_token(new_user['id'], new_user['username'])
-                    return {
-                        'statusCode': 201,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({
-                            'token': token,
-                            'user': {
-                                'id': new_user['id'],
-                                'username': new_user['username'],
-                                'email': new_user['email']
-                            }
-                        }),
-                        'isBase64Encoded': False
-                    }
+                    return json_response(201, {
+                        'token': token,
+                        'user': {
+                            'id': new_user['id'],
+                            'username': new_user['username'],
+                            'email': new_user['email']
+                        }
+                    })
         
         elif method == 'GET':
             params = event.get('queryStringParameters', {})
@@ -239,19 +191,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             if provider == 'vk' and vk_app_id:
                 auth_url = f'https://oauth.vk.com/authorize?client_id={vk_app_id}&display=page&redirect_uri={redirect_uri}&response_type=code&v=5.131'
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'url': auth_url}),
-                    'isBase64Encoded': False
-                }
+                return json_response(200, {'url': auth_url})
         
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Invalid request'}),
-            'isBase64Encoded': False
-        }
+        return json_response(400, {'error': 'Invalid request'})
     
     finally:
         conn.close()
\ No newline at end of file
@@ -9,45 +9,22 @@ import os
 import urllib.request
 import urllib.error
 from typing import Dict, Any
+from response import JSON_HEADERS, json_response, preflight
+from timing import instrument
 
+@instrument('openrouter')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return preflight('POST, OPTIONS', 'Content-Type, X-User-Id')
     
     if method != 'POST':
-        return {
-            'statusCode': 405,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Only POST allowed'}),
-            'isBase64Encoded': False
-        }
+        return json_response(405, {'error': 'Only POST allowed'})
     
     api_key = os.environ.get('OPENROUTER_API_KEY')
     if not api_key:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'OPENROUTER_API_KEY not configured'}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': 'OPENROUTER_API_KEY not configured'})
     
     body_data = json.loads(event.get('body', '{}'))
     
@@ -81,34 +58,15 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         with urllib.request.urlopen(req, timeout=60) as response:
             response_data = json.loads(response.read().decode('utf-8'))
             
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps(response_data),
-                'isBase64Encoded': False
-            }
+            return json_response(200, response_data)
     
     except urllib.error.HTTPError as e:
         error_body = e.read().decode('utf-8')
         return {
             'statusCode': e.code,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
+            'headers': dict(JSON_HEADERS),
             'body': error_body,
             'isBase64Encoded': False
         }
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
\ No newline at end of file
+        return json_response(500, {'error': str(e)})
\ No newline at end of file
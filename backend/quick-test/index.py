@@ -4,12 +4,14 @@ Args: event (пустой)
 Returns: Детальный отчет с оценкой и примерами из истории
 """
 
-import json
 import os
-import requests
 from typing import Dict, Any
+from keyword_matcher import KeywordMatcher, LemmaMatcher
+from response import json_response, preflight
+from timing import instrument, note, span
 
-API_URL = 'https://functions.poehali.dev/9ea67dc2-c306-4906-bf0f-da435600b92c'
+# story-ai; STORY_AI_URL — чтобы гонять тесты против локального мока
+API_URL = os.environ.get('STORY_AI_URL', 'https://functions.poehali.dev/9ea67dc2-c306-4906-bf0f-da435600b92c')
 
 TEST_SCENARIO = {
     'game_settings': {
@@ -37,6 +39,23 @@ TEST_SCENARIO = {
     'history': []
 }
 
+# Маркеры живости персонажей: слова сравниваются по основе, кортеж — формы одного слова
+STORY_LEXICONS = {
+    'mood_shifts': ['злость', 'нежность', ('холод', 'холодный'), 'тепло', 'сарказм', 'вдруг', 'внезапно', 'но затем'],
+    'contradiction_markers': ['противоречие', 'одновременно', 'но в то же время', 'я не могу... но', 'хотя нет'],
+    'bad_markers': ['чувствовал', 'ощущал', 'понять', 'подумать', 'сердце билось', 'глаза загорелись'],
+    'good_markers': ['сжал', 'отвернулся', ('краснеет', 'покраснел'), ('запинается', 'запнулся'), ('молчал', 'молча'), 'пауза']
+}
+
+# Междометия и паузы в речи ищутся как есть, без стемминга («погоди» ≠ «погода»)
+SPEECH_LEXICONS = {
+    'stream_markers': ['погоди', 'постой', 'нет, ', 'хотя', 'э-э-э', 'блять', 'ну вот'],
+    'natural_markers': ['блять', 'чёрт', 'ну...', '...', 'э-э', 'ммм']
+}
+
+STORY_MATCHER = LemmaMatcher(STORY_LEXICONS)
+SPEECH_MATCHER = KeywordMatcher(SPEECH_LEXICONS)
+
 def analyze_story(story: str) -> Dict[str, Any]:
     """Анализ истории на живость персонажей"""
     
@@ -49,10 +68,11 @@ def analyze_story(story: str) -> Dict[str, Any]:
     }
     
     examples = []
+    hits = STORY_MATCHER.scan(story)
+    speech = SPEECH_MATCHER.scan(story)
     
     # 1. Эмоциональные качели (NPC меняют настроение)
-    mood_shifts = ['злость', 'нежность', 'холод', 'тепло', 'сарказм', 'вдруг', 'внезапно', 'но затем']
-    mood_count = sum(1 for word in mood_shifts if word in story.lower())
+    mood_count = hits.count('mood_shifts')
     if mood_count >= 3:
         scores['emotional_swings'] = 10
         examples.append("✅ Эмоциональные качели: NPC меняет настроение")
@@ -61,8 +81,7 @@ def analyze_story(story: str) -> Dict[str, Any]:
         examples.append("⚠️ Слабые эмоциональные качели")
     
     # 2. Поток сознания (незаконченные фразы, возврат к мысли)
-    stream_markers = ['погоди', 'постой', 'нет, ', 'хотя', 'э-э-э', 'блять', 'ну вот']
-    stream_count = sum(1 for marker in stream_markers if marker in story.lower())
+    stream_count = speech.count('stream_markers')
     if stream_count >= 3:
         scores['stream_of_consciousness'] = 10
         examples.append("✅ Поток сознания: NPC сбивается, возвращается к мысли")
@@ -71,8 +90,7 @@ def analyze_story(story: str) -> Dict[str, Any]:
         examples.append("⚠️ Слабый поток сознания")
     
     # 3. Противоречия (NPC ошибается, меняет мнение)
-    contradiction_markers = ['противоречи', 'одновременно', 'но в то же время', 'я не могу... но', 'хотя нет']
-    contradiction_count = sum(1 for marker in contradiction_markers if marker in story.lower())
+    contradiction_count = hits.count('contradiction_markers')
     if contradiction_count >= 2:
         scores['contradictions'] = 10
         examples.append("✅ Противоречия: NPC противоречит себе, показывает сложность")
@@ -81,8 +99,7 @@ def analyze_story(story: str) -> Dict[str, Any]:
         examples.append("⚠️ Слабые противоречия")
     
     # 4. Живая речь (междометия, повторы, мат)
-    natural_markers = ['блять', 'чёрт', 'ну...', '...', 'э-э', 'ммм']
-    natural_count = sum(1 for marker in natural_markers if marker in story.lower())
+    natural_count = speech.count('natural_markers')
     if natural_count >= 3:
         scores['natural_speech'] = 10
         examples.append("✅ Живая речь: междометия, паузы, естественный язык")
@@ -91,11 +108,8 @@ def analyze_story(story: str) -> Dict[str, Any]:
         examples.append("⚠️ Слабая живая речь")
     
     # 5. Показывать, не рассказывать (действия вместо описания эмоций)
-    bad_markers = ['чувствовал', 'ощущал', 'понял', 'подумал', 'сердце билось', 'глаза загорелись']
-    good_markers = ['сжал', 'отвернулся', 'краснеет', 'запинается', 'молчал', 'пауза']
-    
-    bad_count = sum(1 for marker in bad_markers if marker in story.lower())
-    good_count = sum(1 for marker in good_markers if marker in story.lower())
+    bad_count = hits.count('bad_markers')
+    good_count = hits.count('good_markers')
     
     if good_count >= 3 and bad_count <= 1:
         scores['show_not_tell'] = 10
@@ -113,33 +127,28 @@ def analyze_story(story: str) -> Dict[str, Any]:
         'story_preview': story[:800] + '...' if len(story) > 800 else story
     }
 
+@instrument('quick-test')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """Запуск быстрого теста"""
     
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return preflight('GET, POST, OPTIONS')
+    
+    import requests
     
     try:
         print("🚀 Запуск теста 'Эмоциональная глубина + живые персонажи'")
         
-        response = requests.post(
-            API_URL,
-            json=TEST_SCENARIO,
-            headers={'Content-Type': 'application/json'},
-            timeout=45
-        )
+        with span('story_ai'):
+            response = requests.post(
+                API_URL,
+                json=TEST_SCENARIO,
+                headers={'Content-Type': 'application/json'},
+                timeout=45
+            )
+        note(upstream_status=response.status_code)
         
         if response.ok:
             data = response.json()
@@ -158,43 +167,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 print(f"✅ Тест завершен. Оценка: {analysis['total_score']}/10")
                 print(f"Примеры: {analysis['examples']}")
                 
-                return {
-                    'statusCode': 200,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps(result, ensure_ascii=False),
-                    'isBase64Encoded': False
-                }
+                return json_response(200, result)
             else:
-                return {
-                    'statusCode': 500,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({'error': 'No story generated'}),
-                    'isBase64Encoded': False
-                }
+                return json_response(500, {'error': 'No story generated'})
         else:
-            return {
-                'statusCode': response.status_code,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': f'API error: {response.text}'}),
-                'isBase64Encoded': False
-            }
+            return json_response(response.status_code, {'error': f'API error: {response.text}'})
     
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
\ No newline at end of file
+        return json_response(500, {'error': str(e)})
\ No newline at end of file
@@ -7,11 +7,12 @@ Returns: HTTP response with game data or operation status
 import json
 import os
 from typing import Dict, Any, Optional, Tuple
-import psycopg2
-from psycopg2.extras import RealDictCursor
-import jwt
+from conditional import bump_version, current_version, not_modified
+from response import json_response, preflight
+from timing import connect_db, instrument
 
 def verify_jwt(token: str) -> Optional[Dict[str, Any]]:
+    import jwt
     jwt_secret = os.environ.get('JWT_SECRET')
     if not jwt_secret:
         return None
@@ -25,46 +26,26 @@ def require_auth(event: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optio
     headers = event.get('headers', {})
     auth_header = headers.get('X-Auth-Token', headers.get('x-auth-token', ''))
     if not auth_header:
-        return None, {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Требуется авторизация'})
-        }
+        return None, json_response(401, {'error': 'Требуется авторизация'})
     user = verify_jwt(auth_header)
     if not user:
-        return None, {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Недействительный токен'})
-        }
+        return None, json_response(401, {'error': 'Недействительный токен'})
     return user, None
 
+@instrument('rpg-games')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return preflight('GET, POST, PUT, DELETE, OPTIONS', 'Content-Type, X-Auth-Token, If-None-Match, If-Modified-Since')
+    
+    from psycopg2.extras import RealDictCursor
     
     database_url = os.environ.get('DATABASE_URL')
     if not database_url:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Database configuration error'}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': 'Database configuration error'})
     
-    conn = psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    conn = connect_db(database_url, cursor_factory=RealDictCursor)
     cur = conn.cursor()
     
     try:
@@ -76,31 +57,22 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             params = event.get('queryStringParameters') or {}
             game_id = params.get('id')
             
+            # Одна версия на все игры пользователя: и список, и отдельная игра
+            version = current_version(cur, 'rpg_games', user['user_id'], variant=f'id{int(game_id)}' if game_id else '')
+            cached = not_modified(event, version)
+            if cached:
+                return cached
+            
             if game_id:
                 cur.execute('SELECT * FROM rpg_games WHERE id = %s AND user_id = %s', (int(game_id), user['user_id']))
                 game = cur.fetchone()
                 if not game:
-                    return {
-                        'statusCode': 404,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Game not found'}),
-                        'isBase64Encoded': False
-                    }
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps(dict(game), default=str),
-                    'isBase64Encoded': False
-                }
+                    return json_response(404, {'error': 'Game not found'})
+                return json_response(200, dict(game), headers=version.headers())
             else:
                 cur.execute('SELECT * FROM rpg_games WHERE user_id = %s ORDER BY last_played DESC NULLS LAST, created_at DESC', (user['user_id'],))
                 games = cur.fetchall()
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps([dict(g) for g in games], default=str),
-                    'isBase64Encoded': False
-                }
+                return json_response(200, [dict(g) for g in games], headers=version.headers())
         
         elif method == 'POST':
             user, error = require_auth(event)
@@ -116,31 +88,24 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             current_chapter = body.get('current_chapter', '')
             story_context = body.get('story_context', '')
             player_character_id = body.get('player_character_id')
+            universe_id = body.get('universe_id')
+            universe_id = int(universe_id) if str(universe_id or '').isdigit() else None
             
             if not title:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'title is required'}),
-                    'isBase64Encoded': False
-                }
+                return json_response(400, {'error': 'title is required'})
             
             cur.execute('''
                 INSERT INTO rpg_games 
-                (user_id, title, genre, setting, difficulty, current_chapter, story_context, player_character_id, last_played)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+                (user_id, title, genre, setting, difficulty, current_chapter, story_context, player_character_id, universe_id, last_played)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
                 RETURNING *
-            ''', (user['user_id'], title, genre, setting, difficulty, current_chapter, story_context, player_character_id))
+            ''', (user['user_id'], title, genre, setting, difficulty, current_chapter, story_context, player_character_id, universe_id))
             
             game = cur.fetchone()
+            bump_version(cur, 'rpg_games', user['user_id'])
             conn.commit()
             
-            return {
-                'statusCode': 201,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(dict(game), default=str),
-                'isBase64Encoded': False
-            }
+            return json_response(201, dict(game))
         
         elif method == 'PUT':
             user, error = require_auth(event)
@@ -151,12 +116,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             game_id = params.get('id')
             
             if not game_id:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'id is required'}),
-                    'isBase64Encoded': False
-                }
+                return json_response(400, {'error': 'id is required'})
             
             body = json.loads(event.get('body', '{}'))
             
@@ -174,12 +134,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         update_values.append(body[field])
             
             if not update_fields:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'No fields to update'}),
-                    'isBase64Encoded': False
-                }
+                return json_response(400, {'error': 'No fields to update'})
             
             update_fields.append('updated_at = CURRENT_TIMESTAMP')
             update_fields.append('last_played = CURRENT_TIMESTAMP')
@@ -196,21 +151,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             game = cur.fetchone()
             
             if not game:
-                return {
-                    'statusCode': 404,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Game not found'}),
-                    'isBase64Encoded': False
-                }
+                return json_response(404, {'error': 'Game not found'})
             
+            bump_version(cur, 'rpg_games', user['user_id'])
             conn.commit()
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(dict(game), default=str),
-                'isBase64Encoded': False
-            }
+            return json_response(200, dict(game))
         
         elif method == 'DELETE':
             user, error = require_auth(event)
@@ -221,31 +167,18 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             game_id = params.get('id')
             
             if not game_id:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'id is required'}),
-                    'isBase64Encoded': False
-                }
+                return json_response(400, {'error': 'id is required'})
             
             cur.execute('DELETE FROM rpg_games WHERE id = %s AND user_id = %s', (int(game_id), user['user_id']))
             deleted = cur.rowcount > 0
+            if deleted:
+                bump_version(cur, 'rpg_games', user['user_id'])
             conn.commit()
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': deleted, 'message': 'Game deleted' if deleted else 'Not found'}),
-                'isBase64Encoded': False
-            }
+            return json_response(200, {'success': deleted, 'message': 'Game deleted' if deleted else 'Not found'})
         
         else:
-            return {
-                'statusCode': 405,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Method not allowed'}),
-                'isBase64Encoded': False
-            }
+            return json_response(405, {'error': 'Method not allowed'})
     
     finally:
         cur.close()
@@ -4,13 +4,23 @@ Args: event (может быть пустым)
 Returns: HTTP response с детальным отчетом по всем тестам
 """
 
-import json
 import os
-import requests
+import statistics
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, List
+from keyword_matcher import LemmaMatcher, lemma_set
+from response import json_response, preflight
+from timing import instrument
 
-API_URL = 'https://functions.poehali.dev/9ea67dc2-c306-4906-bf0f-da435600b92c'
+# story-ai; STORY_AI_URL — чтобы гонять тесты против локального мока
+API_URL = os.environ.get('STORY_AI_URL', 'https://functions.poehali.dev/9ea67dc2-c306-4906-bf0f-da435600b92c')
+
+# Сценарии идут параллельно: весь прогон укладывается во время самого медленного
+DEFAULT_TIMEOUT = 60
+MAX_TIMEOUT = 120
+MAX_CONCURRENCY = 8
+MAX_REPEATS = 5
 
 TESTS = {
     'Mo Dao Zu Shi (канон китайского фэнтези)': {
@@ -112,6 +122,39 @@ TESTS = {
     }
 }
 
+# Лексиконы критериев; слова сравниваются по основе, кортеж — формы одного слова
+CANON_LEXICONS = {
+    'mdzs_terms': ['культиватор', 'культивация', 'клан', 'гуцин', 'флейта', 'демонический'],
+    'mdzs_names': ['Лань Ванцзи', 'Вэй Усянь'],
+    'lwz_traits': [('правила', 'правило'), 'запрет', ('строгий', 'строгость'), ('холод', 'холодный')],
+    'wwx_traits': [('ирония', 'ироничный'), ('шутка', 'шутить', 'шутил', 'пошутить'), ('дерзкий', 'дерзость'), ('усмехнулся', 'усмешка')],
+    'spn_hunt': [('охота', 'охотник'), 'нечисть', 'призрак', 'дух'],
+    'spn_details': ['Импал', 'рок', 'виски'],
+    'spn_humor': ['сарказм', ('шутка', 'шутить', 'шутил', 'пошутить'), ('усмехнулся', 'усмешка')],
+    'scifi_setting': ['станция', ('космос', 'космический'), 'ИИ', 'ЭРИДАН', 'Эхо'],
+    'scifi_future': ['2187', 'будущее', 'технология'],
+    'drama_names': ['Алекс', 'Дэниэл'],
+    'drama_context': ['5 лет', ('разрыв', 'разрыва'), 'концерт', 'джаз']
+}
+
+STYLE_LEXICONS = {
+    'inner_thoughts': ['подумать', ('вспомнить', 'вспоминать'), 'почувствовать', 'понять', 'осознать'],
+    'body_language': ['посмотрел', 'отвернулся', 'наклонился', 'сжал', 'прикоснулся'],
+    'memory': ['помнить', 'раньше', 'тогда', 'прошлое'],
+    'sensory': [('запах', 'запаха'), 'звук', 'шёпот', 'шорох', 'тишина', ('холод', 'холодный'), 'тепло', 'свет', ('тень', 'тени', 'тенью'), ('ветер', 'ветра')],
+    'emotions': ['напряжение', ('тревога', 'тревожный'), 'страх', 'радость', ('грусть', 'грустный'), 'злость', 'нежность', ('боль', 'боли', 'болью')],
+    'cliches': ['сердце билось', 'глаза загорелись', 'душа пела', 'бабочки в животе'],
+    'complex_emotions': ['противоречие', 'одновременно', 'с одной стороны', 'но в то же время', 'вопреки'],
+    'silence': ['молча', 'тишина', 'пауза', 'не сказ'],
+    'nsfw': [('поцелуй', 'поцелуи', 'поцеловать'), 'прикосновение', ('близость', 'близко'), 'объятия', ('ласка', 'ласковый'), ('страсть', 'страстный')],
+    'vulgar': [('трахать', 'трахнул'), ('ебать', 'ебаный'), 'сиськи', ('хуй', 'хуя'), 'пизда'],
+    'angel': ['ангел']
+}
+
+# Слова сравниваются по основе; имена и аббревиатуры канона (ИИ, ЭРИДАН) — подстрокой с учётом регистра
+CANON_MATCHER = LemmaMatcher(CANON_LEXICONS, case_sensitive=True)
+STYLE_MATCHER = LemmaMatcher(STYLE_LEXICONS)
+
 def analyze_response(test_name: str, story: str) -> Dict[str, Any]:
     """Анализ ответа ИИ по критериям"""
     
@@ -126,18 +169,22 @@ def analyze_response(test_name: str, story: str) -> Dict[str, Any]:
     issues = []
     recommendations = []
     
+    lemmas = lemma_set(story)
+    canon = CANON_MATCHER.scan(story, lemmas)
+    style = STYLE_MATCHER.scan(story, lemmas)
+    
     # 1. Понимание канона/сеттинга
     if 'Mo Dao Zu Shi' in test_name:
-        if any(word in story for word in ['культиватор', 'культивация', 'клан', 'гуцин', 'флейта', 'демонический']):
+        if canon.any('mdzs_terms'):
             canon_understanding += 3
             quotes.append("✓ Использует терминологию сянься")
-        if 'Лань Ванцзи' in story and 'Вэй Усянь' in story:
+        if canon.count('mdzs_names') == 2:
             canon_understanding += 2
             quotes.append("✓ Сохраняет имена персонажей")
-        if any(word in story for word in ['правил', 'запрет', 'строг', 'холод']):
+        if canon.any('lwz_traits'):
             canon_understanding += 2
             quotes.append("✓ Передает характер Лань Ванцзи")
-        if any(word in story for word in ['ирон', 'шутк', 'дерз', 'усмехн']):
+        if canon.any('wwx_traits'):
             canon_understanding += 2
             quotes.append("✓ Передает характер Вэй Усяня")
         if canon_understanding < 5:
@@ -145,29 +192,29 @@ def analyze_response(test_name: str, story: str) -> Dict[str, Any]:
             recommendations.append("Добавить в промпт больше деталей о мире сянься и правилах клана Лань")
     
     elif 'Сверхестественное' in test_name:
-        if any(word in story for word in ['охот', 'нечист', 'призрак', 'дух']):
+        if canon.any('spn_hunt'):
             canon_understanding += 3
-        if 'Импал' in story or 'рок' in story or 'виски' in story:
+        if canon.any('spn_details'):
             canon_understanding += 3
             quotes.append("✓ Детали из канона (Импала/рок/виски)")
-        if any(word in story for word in ['сарказм', 'шутк', 'усмехн']):
+        if canon.any('spn_humor'):
             canon_understanding += 2
-        if 'ангел' in story.lower():
+        if style.any('angel'):
             canon_understanding += 2
     
     elif 'Оригинальный мир' in test_name:
-        if any(word in story for word in ['станци', 'космос', 'ИИ', 'ЭРИДАН', 'Эхо']):
+        if canon.any('scifi_setting'):
             canon_understanding += 4
             quotes.append("✓ Использует элементы сеттинга")
-        if any(word in story for word in ['2187', 'будущ', 'технолог']):
+        if canon.any('scifi_future'):
             canon_understanding += 3
         if canon_understanding >= 5:
             quotes.append("✓ Построил оригинальный мир с нуля")
     
     elif 'Эмоциональная глубина' in test_name:
-        if 'Алекс' in story and 'Дэниэл' in story:
+        if canon.count('drama_names') == 2:
             canon_understanding += 3
-        if any(word in story for word in ['5 лет', 'разрыв', 'концерт', 'джаз']):
+        if canon.any('drama_context'):
             canon_understanding += 4
             quotes.append("✓ Учел контекст прошлых отношений")
     
@@ -179,15 +226,15 @@ def analyze_response(test_name: str, story: str) -> Dict[str, Any]:
     elif npc_count > 1:
         npc_alive += 2
     
-    if any(word in story.lower() for word in ['подума', 'вспомн', 'почувствова', 'понял', 'осозна']):
+    if style.any('inner_thoughts'):
         npc_alive += 2
         quotes.append("✓ NPC показывают внутренние переживания")
     
-    if any(word in story.lower() for word in ['посмотре', 'отверну', 'наклон', 'сжал', 'прикоснул']):
+    if style.any('body_language'):
         npc_alive += 2
         quotes.append("✓ NPC используют язык тела")
     
-    if any(word in story.lower() for word in ['помн', 'раньше', 'тогда', 'прошл']):
+    if style.any('memory'):
         npc_alive += 2
         quotes.append("✓ NPC помнят прошлое")
     
@@ -196,8 +243,7 @@ def analyze_response(test_name: str, story: str) -> Dict[str, Any]:
         recommendations.append("Усилить в промпте: NPC должны иметь память, эмоции, реакции на действия игрока")
     
     # 3. Атмосфера
-    sensory_words = ['запах', 'звук', 'шёпот', 'шорох', 'тишин', 'холод', 'тепл', 'свет', 'тень', 'ветер']
-    sensory_count = sum(1 for word in sensory_words if word in story.lower())
+    sensory_count = style.count('sensory')
     if sensory_count >= 3:
         atmosphere += 4
         quotes.append(f"✓ {sensory_count} сенсорных деталей")
@@ -208,8 +254,7 @@ def analyze_response(test_name: str, story: str) -> Dict[str, Any]:
         atmosphere += 2
         quotes.append("✓ Достаточная длина для атмосферы")
     
-    emotional_words = ['напряж', 'тревог', 'страх', 'радост', 'грус', 'злость', 'нежност', 'боль']
-    emotional_count = sum(1 for word in emotional_words if word in story.lower())
+    emotional_count = style.count('emotions')
     if emotional_count >= 2:
         atmosphere += 3
     
@@ -218,8 +263,7 @@ def analyze_response(test_name: str, story: str) -> Dict[str, Any]:
         recommendations.append("Добавить больше сенсорных деталей: запахи, звуки, текстуры")
     
     # 4. Глубина эмоций (не штампы)
-    cliche_phrases = ['сердце билось', 'глаза загорелись', 'душа пела', 'бабочки в животе']
-    cliche_count = sum(1 for phrase in cliche_phrases if phrase in story.lower())
+    cliche_count = style.count('cliches')
     
     if cliche_count == 0:
         emotional_depth += 4
@@ -228,12 +272,11 @@ def analyze_response(test_name: str, story: str) -> Dict[str, Any]:
         emotional_depth -= 2
         issues.append(f"❌ Найдено {cliche_count} штампов")
     
-    complex_emotions = ['противоречи', 'одновременно', 'с одной стороны', 'но в то же время', 'вопреки']
-    if any(phrase in story.lower() for phrase in complex_emotions):
+    if style.any('complex_emotions'):
         emotional_depth += 3
         quotes.append("✓ Показаны сложные/противоречивые эмоции")
     
-    if any(word in story.lower() for word in ['молча', 'тишин', 'пауз', 'не сказ']):
+    if style.any('silence'):
         emotional_depth += 2
         quotes.append("✓ Использует молчание для передачи эмоций")
     
@@ -242,11 +285,8 @@ def analyze_response(test_name: str, story: str) -> Dict[str, Any]:
         recommendations.append("Избегать штампов. Показывать эмоции через поступки, молчание, противоречия")
     
     # 5. NSFW - естественно или пошло
-    nsfw_indicators = ['поцел', 'прикосн', 'близ', 'объят', 'ласк', 'страст']
-    nsfw_count = sum(1 for word in nsfw_indicators if word in story.lower())
-    
-    vulgar_words = ['трах', 'еб', 'сиськ', 'хуй', 'пизд']
-    vulgar_count = sum(1 for word in vulgar_words if word in story.lower())
+    nsfw_count = style.count('nsfw')
+    vulgar_count = style.count('vulgar')
     
     if nsfw_count > 0 and vulgar_count == 0:
         nsfw_quality += 5
@@ -283,6 +323,97 @@ def analyze_response(test_name: str, story: str) -> Dict[str, Any]:
         'story': story
     }
 
+def run_scenario(test_name: str, test_data: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+    """Один прогон сценария: запрос к story-ai и анализ ответа"""
+    import requests
+    print(f"▶ Запуск теста: {test_name}")
+    
+    try:
+        response = requests.post(
+            API_URL,
+            json=test_data,
+            headers={'Content-Type': 'application/json'},
+            timeout=timeout
+        )
+        
+        if response.ok:
+            data = response.json()
+            story = data.get('story', '')
+            
+            if story:
+                analysis = analyze_response(test_name, story)
+                print(f"✅ {test_name}: оценка {analysis['total_score']}/10")
+                return analysis
+            
+            print(f"❌ {test_name}: пустой ответ")
+            return {
+                'test_name': test_name,
+                'error': 'Пустой ответ от API',
+                'total_score': 0
+            }
+        
+        error_msg = f"HTTP {response.status_code}"
+        try:
+            error_data = response.json()
+            error_msg = error_data.get('error', error_msg)
+        except:
+            pass
+        
+        print(f"❌ {test_name}: {error_msg}")
+        return {
+            'test_name': test_name,
+            'error': error_msg,
+            'total_score': 0
+        }
+    
+    except Exception as e:
+        print(f"❌ {test_name}: исключение {str(e)}")
+        return {
+            'test_name': test_name,
+            'error': str(e),
+            'total_score': 0
+        }
+
+def run_suite(concurrency: int, timeout: float, repeats: int) -> List[Dict[str, Any]]:
+    """
+    Прогоняет все сценарии параллельно вместо очереди с паузами.
+    Результаты возвращаются в порядке TESTS (повторы — подряд за своим сценарием).
+    """
+    jobs = [(test_name, test_data, repeat) for test_name, test_data in TESTS.items() for repeat in range(repeats)]
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(run_scenario, test_name, test_data, timeout) for test_name, test_data, _ in jobs]
+        results = []
+        for (_, _, repeat), future in zip(jobs, futures):
+            result = future.result()
+            if repeats > 1:
+                result['repeat'] = repeat + 1
+            results.append(result)
+    return results
+
+def scenario_stats(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Разброс оценок по повторам каждого сценария"""
+    stats = {}
+    for test_name in TESTS:
+        scores = [r['total_score'] for r in results if r['test_name'] == test_name and 'error' not in r]
+        stats[test_name] = {
+            'runs': len([r for r in results if r['test_name'] == test_name]),
+            'successful': len(scores),
+            'mean': round(statistics.mean(scores), 2) if scores else 0,
+            'stdev': round(statistics.stdev(scores), 2) if len(scores) > 1 else 0,
+            'min': min(scores) if scores else 0,
+            'max': max(scores) if scores else 0
+        }
+    return stats
+
+def get_int_param(params: Dict[str, Any], name: str, default: int, low: int, high: int) -> int:
+    try:
+        value = int(params.get(name, default))
+    except (TypeError, ValueError):
+        value = default
+    return max(low, min(high, value))
+
+@instrument('run-creativity-tests')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """Запуск всех тестов креативности"""
     
@@ -290,73 +421,17 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         method: str = event.get('httpMethod', 'GET')
         
         if method == 'OPTIONS':
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                    'Access-Control-Allow-Headers': 'Content-Type',
-                    'Access-Control-Max-Age': '86400'
-                },
-                'body': '',
-                'isBase64Encoded': False
-            }
+            return preflight('GET, POST, OPTIONS')
         
-        results = []
+        # Параметры прогона: ?concurrency=4&timeout=60&repeats=3
+        params = event.get('queryStringParameters') or {}
+        concurrency = get_int_param(params, 'concurrency', len(TESTS), 1, MAX_CONCURRENCY)
+        timeout = get_int_param(params, 'timeout', DEFAULT_TIMEOUT, 5, MAX_TIMEOUT)
+        repeats = get_int_param(params, 'repeats', 1, 1, MAX_REPEATS)
         
-        for test_name, test_data in TESTS.items():
-            print(f"\n{'='*80}")
-            print(f"Запуск теста: {test_name}")
-            print(f"{'='*80}\n")
-            
-            try:
-                response = requests.post(
-                    API_URL,
-                    json=test_data,
-                    headers={'Content-Type': 'application/json'},
-                    timeout=60
-                )
-                
-                if response.ok:
-                    data = response.json()
-                    story = data.get('story', '')
-                    
-                    if story:
-                        analysis = analyze_response(test_name, story)
-                        results.append(analysis)
-                        print(f"✅ Тест выполнен. Оценка: {analysis['total_score']}/10")
-                    else:
-                        results.append({
-                            'test_name': test_name,
-                            'error': 'Пустой ответ от API',
-                            'total_score': 0
-                        })
-                        print(f"❌ Пустой ответ")
-                else:
-                    error_msg = f"HTTP {response.status_code}"
-                    try:
-                        error_data = response.json()
-                        error_msg = error_data.get('error', error_msg)
-                    except:
-                        pass
-                    
-                    results.append({
-                        'test_name': test_name,
-                        'error': error_msg,
-                        'total_score': 0
-                    })
-                    print(f"❌ Ошибка: {error_msg}")
-            
-            except Exception as e:
-                results.append({
-                    'test_name': test_name,
-                    'error': str(e),
-                    'total_score': 0
-                })
-                print(f"❌ Исключение: {str(e)}")
-            
-            # Пауза между запросами
-            time.sleep(2)
+        started_at = time.time()
+        results = run_suite(concurrency, timeout, repeats)
+        print(f"Прогон занял {time.time() - started_at:.1f} с (параллельно: {concurrency})")
         
         # Итоговая статистика
         successful_tests = [r for r in results if 'error' not in r]
@@ -366,7 +441,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         report = {
             'summary': {
-                'total_tests': len(TESTS),
+                'total_tests': len(results),
                 'successful': len(successful_tests),
                 'failed': len(failed_tests),
                 'average_score': round(avg_score, 1),
@@ -375,24 +450,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'results': results,
             'timestamp': time.time()
         }
+        if repeats > 1:
+            report['scenarios'] = scenario_stats(results)
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json; charset=utf-8',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps(report, ensure_ascii=False, indent=2),
-            'isBase64Encoded': False
-        }
+        return json_response(200, report, indent=True)
     
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': f'Критическая ошибка: {str(e)}'}),
-            'isBase64Encoded': False
-        }
\ No newline at end of file
+        return json_response(500, {'error': f'Критическая ошибка: {str(e)}'})
\ No newline at end of file
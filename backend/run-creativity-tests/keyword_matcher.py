@@ -0,0 +1,294 @@
+'''
+Keyword engine for the story heuristics.
+KeywordMatcher compiles all category lexicons into a single Aho–Corasick
+automaton; one pass over the text reports which keywords of every category
+occur in it (plain substring semantics, same as `word in text`).
+LemmaMatcher compares single-word keywords by Snowball stem instead, so one
+dictionary word covers its inflections; each text is stemmed once into a set
+and word→stem results are kept in an LRU cache.
+Shared by ai-story, quick-test, run-creativity-tests and run_creativity_tests.py —
+keep all copies of this file identical.
+'''
+
+import re
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Текст режется на куски «слово + пробелы»; переход автомата по куску запоминается,
+# поэтому повторяющиеся слова проходятся одним обращением к словарю
+SEGMENT_RE = re.compile(r'\s+|\S+\s*')
+SEGMENT_CACHE_LIMIT = 50000
+
+
+class KeywordHits:
+    '''Результат одного прохода: найденные ключевые слова по категориям'''
+
+    def __init__(self, found: Dict[str, Set[str]]):
+        self.found = found
+
+    def any(self, category: str) -> bool:
+        return bool(self.found.get(category))
+
+    def count(self, category: str) -> int:
+        '''Сколько разных слов категории встретилось — как sum(1 for w in words if w in text)'''
+        return len(self.found.get(category, ()))
+
+    def words(self, category: str) -> Set[str]:
+        return self.found.get(category, set())
+
+
+class KeywordMatcher:
+    '''Автомат Ахо–Корасик по всем лексиконам сразу'''
+
+    def __init__(self, lexicons: Dict[str, Iterable[str]], case_sensitive: bool = False):
+        self.case_sensitive = case_sensitive
+        # Одно слово может входить в несколько категорий ('тишин' — и атмосфера, и молчание)
+        self.keyword_categories: Dict[str, List[str]] = {}
+        for category, words in lexicons.items():
+            for word in words:
+                key = word if case_sensitive else word.lower()
+                categories = self.keyword_categories.setdefault(key, [])
+                if category not in categories:
+                    categories.append(category)
+        self._build(list(self.keyword_categories))
+        self._segment_cache: Dict[Tuple[int, str], Tuple[int, Tuple[str, ...]]] = {}
+
+    def _build(self, keywords: List[str]):
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[List[str]] = [[]]
+        for word in keywords:
+            state = 0
+            for ch in word:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    goto.append({})
+                    outputs.append([])
+                    nxt = len(goto) - 1
+                    goto[state][ch] = nxt
+                state = nxt
+            outputs[state].append(word)
+
+        # Функции неудач в порядке обхода в ширину, сразу сворачиваем их в полный DFA:
+        # delta[s][ch] — куда перейти, отсутствие ключа означает корень
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [dict(goto[0])] + [{} for _ in range(len(goto) - 1)]
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            fallback = delta[fail[state]]
+            transitions = dict(fallback)
+            transitions.update(goto[state])
+            delta[state] = transitions
+            outputs[state] = outputs[state] + outputs[fail[state]]
+            for ch, nxt in goto[state].items():
+                fail[nxt] = fallback.get(ch, 0)
+                queue.append(nxt)
+
+        self._delta = delta
+        self._outputs: List[Optional[Tuple[str, ...]]] = [tuple(o) if o else None for o in outputs]
+
+    def _step(self, state: int, segment: str) -> Tuple[int, Tuple[str, ...]]:
+        delta = self._delta
+        outputs = self._outputs
+        hits: Tuple[str, ...] = ()
+        for ch in segment:
+            state = delta[state].get(ch, 0)
+            out = outputs[state]
+            if out is not None:
+                hits += out
+        return state, hits
+
+    def scan(self, text: str) -> KeywordHits:
+        '''Один проход по тексту, регистр приводится один раз'''
+        if not self.case_sensitive:
+            text = text.lower()
+        cache = self._segment_cache
+        if len(cache) > SEGMENT_CACHE_LIMIT:
+            cache.clear()
+
+        state = 0
+        matched: Set[str] = set()
+        for segment in SEGMENT_RE.findall(text):
+            key = (state, segment)
+            result = cache.get(key)
+            if result is None:
+                result = cache[key] = self._step(state, segment)
+            state = result[0]
+            if result[1]:
+                matched.update(result[1])
+
+        found: Dict[str, Set[str]] = {}
+        for word in matched:
+            for category in self.keyword_categories[word]:
+                found.setdefault(category, set()).add(word)
+        return KeywordHits(found)
+
+
+# Окончания стеммера Snowball для русского языка; первая группа — только после «а»/«я»
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND = (['вшись', 'вши', 'в'], ['ившись', 'ывшись', 'ивши', 'ывши', 'ив', 'ыв'])
+ADJECTIVE = ['ими', 'ыми', 'его', 'ого', 'ему', 'ому', 'ее', 'ие', 'ые', 'ое', 'ей', 'ий', 'ый', 'ой',
+             'ем', 'им', 'ым', 'ом', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею']
+PARTICIPLE = (['ем', 'нн', 'вш', 'ющ', 'щ'], ['ивш', 'ывш', 'ующ'])
+REFLEXIVE = ['ся', 'сь']
+VERB = (['ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'ешь', 'нно'],
+        ['ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен',
+         'ило', 'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'])
+NOUN = ['а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией', 'ей', 'ой', 'ий', 'й',
+        'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия', 'ья', 'я']
+DERIVATIONAL = ['ость', 'ост']
+SUPERLATIVE = ['ейше', 'ейш']
+
+STEM_CACHE_SIZE = 50000
+# Ключ лексикона, чья основа короче MIN_STEM_LENGTH («цел» от «целую», «уб» от «убью»), по основе
+# совпал бы с посторонними словами («цель», «убил») — lemma_key оставляет такому ключу само слово.
+# Он находит в тексте только эту форму: «целую» найдётся, «целуешь» — нет
+MIN_STEM_LENGTH = 4
+WORD_RE = re.compile(r'\w+')
+
+
+def _endings(groups) -> List[Tuple[str, bool]]:
+    '''Окончания по убыванию длины; флаг — требуется ли перед окончанием «а»/«я»'''
+    if isinstance(groups, tuple):
+        pairs = [(e, True) for e in groups[0]] + [(e, False) for e in groups[1]]
+    else:
+        pairs = [(e, False) for e in groups]
+    return sorted(pairs, key=lambda p: -len(p[0]))
+
+
+_PERFECTIVE_GERUND = _endings(PERFECTIVE_GERUND)
+_ADJECTIVE = _endings(ADJECTIVE)
+_PARTICIPLE = _endings(PARTICIPLE)
+_REFLEXIVE = _endings(REFLEXIVE)
+_VERB = _endings(VERB)
+_NOUN = _endings(NOUN)
+
+
+def _strip(rv: str, endings: List[Tuple[str, bool]]) -> Optional[str]:
+    '''Отрезает самое длинное подходящее окончание; None — если ни одно не подошло'''
+    for ending, after_a in endings:
+        if rv.endswith(ending):
+            if after_a and (len(rv) == len(ending) or rv[-len(ending) - 1] not in 'ая'):
+                return None
+            return rv[:-len(ending)]
+    return None
+
+
+def _region(word: str, start: int) -> int:
+    '''Начало области R1/R2: после первой пары «гласная + согласная» правее start'''
+    for i in range(start + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            return i + 1
+    return len(word)
+
+
+@lru_cache(maxsize=STEM_CACHE_SIZE)
+def stem(word: str) -> str:
+    '''Основа русского слова по алгоритму Snowball; результат кешируется (LRU)'''
+    word = word.lower().replace('ё', 'е')
+    rv_start = next((i + 1 for i, ch in enumerate(word) if ch in VOWELS), len(word))
+    r2_start = _region(word, _region(word, 0))
+    prefix, rv = word[:rv_start], word[rv_start:]
+
+    # Шаг 1: деепричастие, иначе (возвратность) + прилагательное/глагол/существительное
+    stripped = _strip(rv, _PERFECTIVE_GERUND)
+    if stripped is None:
+        reflexive = _strip(rv, _REFLEXIVE)
+        if reflexive is not None:
+            rv = reflexive
+        stripped = _strip(rv, _ADJECTIVE)
+        if stripped is not None:
+            participle = _strip(stripped, _PARTICIPLE)
+            if participle is not None:
+                stripped = participle
+        else:
+            stripped = _strip(rv, _VERB)
+            if stripped is None:
+                stripped = _strip(rv, _NOUN)
+    if stripped is not None:
+        rv = stripped
+
+    # Шаг 2: конечная «и»
+    if rv.endswith('и'):
+        rv = rv[:-1]
+
+    # Шаг 3: словообразовательное окончание в R2
+    for ending in DERIVATIONAL:
+        if rv.endswith(ending) and rv_start + len(rv) - len(ending) >= r2_start:
+            rv = rv[:-len(ending)]
+            break
+
+    # Шаг 4: превосходная степень, двойная «н», мягкий знак
+    for ending in SUPERLATIVE:
+        if rv.endswith(ending):
+            rv = rv[:-len(ending)]
+            break
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    elif rv.endswith('ь'):
+        rv = rv[:-1]
+    return prefix + rv
+
+
+def lemma_set(text: str) -> Set[str]:
+    '''Основы и сами слова текста одним множеством — считается один раз на историю'''
+    return _lemmas_of_lower(text.lower())
+
+
+def _lemmas_of_lower(lowered: str) -> Set[str]:
+    # split() на C в разы быстрее findall по всему тексту; регулярка идёт только по уникальным кускам
+    words: Set[str] = set()
+    for token in set(lowered.split()):
+        words.update(WORD_RE.findall(token.replace('ё', 'е')))
+    return words | {stem(word) for word in words}
+
+
+def lemma_key(word: str) -> str:
+    '''Ключ слова лексикона: основа, а для коротких основ — само слово'''
+    key = stem(word)
+    return key if len(key) >= MIN_STEM_LENGTH else word.replace('ё', 'е')
+
+
+class LemmaMatcher:
+    '''
+    Однословные ключи в нижнем регистре сравниваются по основе (O(1) на ключ),
+    фразы, знаки препинания и регистрозависимые имена — подстрокой.
+    '''
+
+    def __init__(self, lexicons: Dict[str, Iterable], case_sensitive: bool = False):
+        self.case_sensitive = case_sensitive
+        # Элемент лексикона — слово или кортеж форм одного слова: ('ветер', 'ветра');
+        # в результатах и счётчиках вся группа идёт под первой формой
+        self.stem_keywords: Dict[str, List[Tuple[str, str]]] = {}
+        # Фраз единицы, проверка `in` на C быстрее прохода автомата по всему тексту
+        self.phrases: List[Tuple[str, str]] = []
+        for category, words in lexicons.items():
+            for entry in words:
+                forms = (entry,) if isinstance(entry, str) else tuple(entry)
+                for form in forms:
+                    if WORD_RE.fullmatch(form) and form == form.lower():
+                        entries = self.stem_keywords.setdefault(lemma_key(form), [])
+                        if (category, forms[0]) not in entries:
+                            entries.append((category, forms[0]))
+                    else:
+                        self.phrases.append((category, form if case_sensitive else form.lower()))
+
+    def scan(self, text: str, lemmas: Optional[Set[str]] = None) -> KeywordHits:
+        '''lemmas можно передать готовыми, если по тексту гоняют несколько матчеров'''
+        lowered = None if self.case_sensitive else text.lower()
+        if lemmas is None:
+            # Лексикон из одних фраз/имён — токенизация не нужна
+            lemmas = _lemmas_of_lower(lowered if lowered is not None else text.lower()) if self.stem_keywords else set()
+        found: Dict[str, Set[str]] = {}
+        for key, entries in self.stem_keywords.items():
+            if key in lemmas:
+                for category, word in entries:
+                    found.setdefault(category, set()).add(word)
+        if self.phrases:
+            haystack = text if lowered is None else lowered
+            for category, phrase in self.phrases:
+                if phrase in haystack:
+                    found.setdefault(category, set()).add(phrase)
+        return KeywordHits(found)
@@ -8,11 +8,12 @@ Returns: HTTP response with character_id
 import json
 import os
 from typing import Dict, Any, Optional, Tuple
-import psycopg2
-from psycopg2.extras import RealDictCursor
-import jwt
+from conditional import ALL_USERS, bump_version, current_version, not_modified
+from response import json_response, preflight
+from timing import connect_db, instrument
 
 def verify_jwt(token: str) -> Optional[Dict[str, Any]]:
+    import jwt
     jwt_secret = os.environ.get('JWT_SECRET')
     if not jwt_secret:
         return None
@@ -26,48 +27,25 @@ def require_auth(event: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optio
     headers = event.get('headers', {})
     auth_header = headers.get('X-Auth-Token', headers.get('x-auth-token', ''))
     if not auth_header:
-        return None, {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Требуется авторизация'})
-        }
+        return None, json_response(401, {'error': 'Требуется авторизация'})
     user = verify_jwt(auth_header)
     if not user:
-        return None, {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Недействительный токен'})
-        }
+        return None, json_response(401, {'error': 'Недействительный токен'})
     return user, None
 
+@instrument('save-character')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Auth-Token',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return preflight('POST, GET, OPTIONS', 'Content-Type, X-User-Id, X-Auth-Token, If-None-Match, If-Modified-Since')
+    
+    from psycopg2.extras import RealDictCursor
     
     database_url = os.environ.get('DATABASE_URL')
     
     if not database_url:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Database configuration error'}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': 'Database configuration error'})
     
     if method == 'GET':
         params = event.get('queryStringParameters') or {}
@@ -75,8 +53,16 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         user_id = headers.get('X-User-Id') or headers.get('x-user-id')
         universe_id = params.get('universe_id')
         
-        conn = psycopg2.connect(database_url)
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        conn = connect_db(database_url, cursor_factory=RealDictCursor)
+        cur = conn.cursor()
+        
+        # Список пользователя — его счётчик, без пользователя — общий; фильтр по вселенной — вариант внутри версии
+        version = current_version(cur, 'characters', user_id, variant=f'universe{int(universe_id)}' if universe_id else '')
+        cached = not_modified(event, version)
+        if cached:
+            cur.close()
+            conn.close()
+            return cached
         
         if user_id and universe_id:
             cur.execute(
@@ -100,15 +86,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         cur.close()
         conn.close()
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'characters': [dict(c) for c in characters]}, default=str),
-            'isBase64Encoded': False
-        }
+        return json_response(200, {'characters': [dict(c) for c in characters]}, headers=version.headers())
     
     if method == 'POST':
         user, error = require_auth(event)
@@ -133,17 +111,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         character_role: str = body_data.get('role', 'main')
         
         if not name or not personality:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': 'name and personality are required'}),
-                'isBase64Encoded': False
-            }
+            return json_response(400, {'error': 'name and personality are required'})
         
-        conn = psycopg2.connect(database_url)
+        conn = connect_db(database_url)
         cur = conn.cursor()
         
         if user_id:
@@ -167,26 +137,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                  abilities, strengths, weaknesses, goals, character_role, character_role, 'fanfic')
             )
         character_id = cur.fetchone()[0]
+        bump_version(cur, 'characters', ALL_USERS, user_id)
         conn.commit()
         cur.close()
         conn.close()
         
-        return {
-            'statusCode': 201,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'character_id': character_id, 'name': name}),
-            'isBase64Encoded': False
-        }
+        return json_response(201, {'character_id': character_id, 'name': name})
     
-    return {
-        'statusCode': 405,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*'
-        },
-        'body': json.dumps({'error': 'Method not allowed'}),
-        'isBase64Encoded': False
-    }
\ No newline at end of file
+    return json_response(405, {'error': 'Method not allowed'})
\ No newline at end of file
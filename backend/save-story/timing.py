@@ -0,0 +1,187 @@
+'''
+Замеры фаз запроса: заголовок Server-Timing в ответе и одна JSON-строка лога на запрос.
+Копия лежит в папке каждой функции (как response.py) — копии должны совпадать.
+    @instrument('story-ai')
+    def handler(event, context): ...
+
+    with span('deepseek'):
+        response = requests.post(...)
+    note(cache='miss', tokens=1532, upstream_status=200)
+Вне instrument span, timed и note ничего не делают — хелперы можно звать откуда угодно
+'''
+
+import contextvars
+import functools
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Optional
+import metrics
+
+# Запрос обрабатывается в одном потоке; contextvars — чтобы не путались параллельные вызовы в шлюзе
+_current: contextvars.ContextVar = contextvars.ContextVar('request_timer', default=None)
+
+# TIMING_LOG=0 отключает строку лога (бенчмарки в одном процессе), Server-Timing остаётся
+LOG_ENABLED = os.environ.get('TIMING_LOG', '1') != '0'
+
+# В Server-Timing имя метрики — токен: буквы, цифры и -_.
+TOKEN_RE = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+class RequestTimer:
+    '''Фазы одного запроса: одноимённые спаны (несколько запросов к базе) складываются'''
+
+    def __init__(self, function: str, request_headers: Optional[Dict[str, str]] = None):
+        self.function = function
+        # Заголовки запроса нужны response.py (Accept-Encoding) — там нет event
+        self.request_headers = {k.lower(): v for k, v in (request_headers or {}).items()}
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.fields: Dict[str, Any] = {}
+
+    def add(self, name: str, ms: float):
+        self.phases[name] = self.phases.get(name, 0.0) + ms
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self, total_ms: float) -> str:
+        parts = [f"{TOKEN_RE.sub('_', name)};dur={ms:.1f}" for name, ms in self.phases.items()]
+        if 'cache' in self.fields:
+            parts.append(f"cache;desc={TOKEN_RE.sub('_', str(self.fields['cache']))}")
+        parts.append(f'total;dur={total_ms:.1f}')
+        return ', '.join(parts)
+
+    def log_record(self, event: Dict[str, Any], context: Any, status: Any, total_ms: float) -> Dict[str, Any]:
+        record = {
+            'fn': self.function,
+            'request_id': getattr(context, 'request_id', None),
+            'method': event.get('httpMethod'),
+            'status': status,
+            'ms': round(total_ms, 1),
+            'phases': {name: round(ms, 1) for name, ms in self.phases.items()}
+        }
+        repeated = {name: n for name, n in self.counts.items() if n > 1}
+        if repeated:
+            record['counts'] = repeated
+        record.update(self.fields)
+        return record
+
+
+def current() -> Optional[RequestTimer]:
+    return _current.get()
+
+
+def request_header(name: str) -> Optional[str]:
+    '''Заголовок текущего запроса без учёта регистра; вне instrument — None'''
+    timer = _current.get()
+    return timer.request_headers.get(name.lower()) if timer is not None else None
+
+
+@contextmanager
+def span(name: str):
+    '''Замер фазы; исключение внутри не глотается, время всё равно записывается'''
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, (time.perf_counter() - started) * 1000)
+
+
+def timed(name: Optional[str] = None) -> Callable:
+    '''Декоратор: весь вызов функции — одна фаза (по умолчанию с именем функции)'''
+    def decorator(fn: Callable) -> Callable:
+        phase = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(phase):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def note(**fields):
+    '''Поля для строки лога: cache, tokens, upstream_status, attempts, ...'''
+    timer = _current.get()
+    if timer is not None:
+        timer.fields.update(fields)
+
+
+def instrument(function: str) -> Callable:
+    '''
+    Обёртка handler: считает полное время, добавляет Server-Timing, печатает строку лога
+    и отдаёт запрос в metrics (в базу их пишет фоновый поток metrics, ответ его не ждёт).
+    OPTIONS проходит без замеров — preflight не должен платить за инструментирование
+    '''
+    def decorator(handler: Callable) -> Callable:
+        @functools.wraps(handler)
+        def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+            if event.get('httpMethod') == 'OPTIONS':
+                return handler(event, context)
+            timer = RequestTimer(function, event.get('headers'))
+            token = _current.set(timer)
+            response = None
+            try:
+                response = handler(event, context)
+                return response
+            except Exception as e:
+                timer.fields['error'] = f'{type(e).__name__}: {e}'
+                raise
+            finally:
+                _current.reset(token)
+                total_ms = timer.elapsed_ms()
+                status = response.get('statusCode') if isinstance(response, dict) else None
+                if isinstance(response, dict):
+                    headers = response.setdefault('headers', {})
+                    headers['Server-Timing'] = timer.server_timing(total_ms)
+                    # Без Timing-Allow-Origin браузер не отдаст фазы в PerformanceResourceTiming чужого origin
+                    headers['Timing-Allow-Origin'] = '*'
+                if LOG_ENABLED:
+                    print(json.dumps(timer.log_record(event, context, status, total_ms), ensure_ascii=False, default=str))
+                metrics.record_request(function, status if status is not None else 'exception', total_ms, timer.phases, timer.fields)
+        return wrapper
+    return decorator
+
+
+_DB_CLASSES: Dict[Any, tuple] = {}
+
+
+def _timed_db_classes(cursor_factory):
+    '''Подклассы соединения и курсора psycopg2: execute и commit идут в фазу db'''
+    if cursor_factory not in _DB_CLASSES:
+        import psycopg2.extensions
+
+        class TimedCursor(cursor_factory):
+            def execute(self, query, vars=None):
+                with span('db'):
+                    return super().execute(query, vars)
+
+            def executemany(self, query, vars_list):
+                with span('db'):
+                    return super().executemany(query, vars_list)
+
+        class TimedConnection(psycopg2.extensions.connection):
+            def commit(self):
+                with span('db'):
+                    return super().commit()
+
+        _DB_CLASSES[cursor_factory] = (TimedConnection, TimedCursor)
+    return _DB_CLASSES[cursor_factory]
+
+
+def connect_db(dsn: Optional[str], cursor_factory=None):
+    '''psycopg2.connect с замерами: подключение — фаза db_connect, запросы и commit — фаза db'''
+    import psycopg2
+    import psycopg2.extensions
+    connection_class, cursor_class = _timed_db_classes(cursor_factory or psycopg2.extensions.cursor)
+    with span('db_connect'):
+        return psycopg2.connect(dsn, connection_factory=connection_class, cursor_factory=cursor_class)
@@ -8,11 +8,12 @@ Returns: HTTP response with universe_id
 import json
 import os
 from typing import Dict, Any, List, Optional, Tuple
-import psycopg2
-from psycopg2.extras import RealDictCursor
-import jwt
+from conditional import bump_version, current_version, not_modified
+from response import json_response, preflight
+from timing import connect_db, instrument
 
 def verify_jwt(token: str) -> Optional[Dict[str, Any]]:
+    import jwt
     jwt_secret = os.environ.get('JWT_SECRET')
     if not jwt_secret:
         return None
@@ -26,52 +27,36 @@ def require_auth(event: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optio
     headers = event.get('headers', {})
     auth_header = headers.get('X-Auth-Token', headers.get('x-auth-token', ''))
     if not auth_header:
-        return None, {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Требуется авторизация'})
-        }
+        return None, json_response(401, {'error': 'Требуется авторизация'})
     user = verify_jwt(auth_header)
     if not user:
-        return None, {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Недействительный токен'})
-        }
+        return None, json_response(401, {'error': 'Недействительный токен'})
     return user, None
 
+@instrument('save-universe')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Auth-Token',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return preflight('POST, GET, OPTIONS', 'Content-Type, X-User-Id, X-Auth-Token, If-None-Match, If-Modified-Since')
+    
+    from psycopg2.extras import RealDictCursor
     
     database_url = os.environ.get('DATABASE_URL')
     
     if not database_url:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Database configuration error'}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': 'Database configuration error'})
     
     if method == 'GET':
-        conn = psycopg2.connect(database_url)
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        conn = connect_db(database_url, cursor_factory=RealDictCursor)
+        cur = conn.cursor()
+        
+        version = current_version(cur, 'universes')
+        cached = not_modified(event, version)
+        if cached:
+            cur.close()
+            conn.close()
+            return cached
         
         cur.execute("SELECT * FROM universes ORDER BY created_at DESC")
         universes = cur.fetchall()
@@ -79,15 +64,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         cur.close()
         conn.close()
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'universes': [dict(u) for u in universes]}, default=str),
-            'isBase64Encoded': False
-        }
+        return json_response(200, {'universes': [dict(u) for u in universes]}, headers=version.headers())
     
     if method == 'POST':
         user, error = require_auth(event)
@@ -107,17 +84,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         tags: List[str] = body_data.get('tags', [])
         
         if not name:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': 'name is required'}),
-                'isBase64Encoded': False
-            }
+            return json_response(400, {'error': 'name is required'})
         
-        conn = psycopg2.connect(database_url)
+        conn = connect_db(database_url)
         cur = conn.cursor()
         
         cur.execute(
@@ -127,26 +96,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             (name, description, canon_source, source_type, genre, tags)
         )
         universe_id = cur.fetchone()[0]
+        bump_version(cur, 'universes')
         conn.commit()
         cur.close()
         conn.close()
         
-        return {
-            'statusCode': 201,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'universe_id': universe_id, 'name': name}),
-            'isBase64Encoded': False
-        }
+        return json_response(201, {'universe_id': universe_id, 'name': name})
     
-    return {
-        'statusCode': 405,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*'
-        },
-        'body': json.dumps({'error': 'Method not allowed'}),
-        'isBase64Encoded': False
-    }
\ No newline at end of file
+    return json_response(405, {'error': 'Method not allowed'})
\ No newline at end of file
@@ -1,15 +1,28 @@
 """
 Business: Генерация игровых историй через DeepSeek API
-Args: event с httpMethod, body (game_data, user_action, history)
-Returns: HTTP response с сгенерированной историей
+Args: event с httpMethod, body (game_settings, setting, user_action, history) или, когда сессия
+      уже на сервере, только game_id, user_action и session_version из прошлого ответа;
+      speculate: true — заранее сгенерировать продолжения для «🎯 Варианты» (нужен X-User-Id)
+Returns: HTTP response с сгенерированной историей (и session_version, если передан game_id;
+         suggestions — варианты из ответа, если включён speculate)
 """
 
 import json
 import os
 import hashlib
+import re
+import threading
 import time
-from typing import Dict, Any
-import requests
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+import game_sessions
+import metrics
+from response import json_response, preflight
+from timing import instrument, note, span, timed
+
+# Адрес API переопределяется для локального мока (mock_llm_server.py)
+DEEPSEEK_BASE_URL = os.environ.get('DEEPSEEK_BASE_URL', 'https://api.deepseek.com')
 
 # Кеш
 CACHE: Dict[str, tuple] = {}
@@ -31,86 +44,91 @@ def save_to_cache(key: str, value: str):
     CACHE[key] = (time.time(), value)
     if len(CACHE) > 50:
         current_time = time.time()
-        expired_keys = [k for k, (t, _) in CACHE.items() if current_time - t >= CACHE_TTL]
+        # Кеш пишет и фоновый поток спекуляций — обходим копию
+        expired_keys = [k for k, (t, _) in list(CACHE.items()) if current_time - t >= CACHE_TTL]
         for k in expired_keys:
-            del CACHE[k]
+            CACHE.pop(k, None)
+            SPECULATED.pop(k, None)
+    metrics.set_gauge('cache_entries', len(CACHE), function='story-ai')
 
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    try:
-        method: str = event.get('httpMethod', 'POST')
-        
-        if method == 'OPTIONS':
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                    'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
-                    'Access-Control-Max-Age': '86400'
-                },
-                'body': ''
-            }
-        
-        if method != 'POST':
-            return {
-                'statusCode': 405,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Method not allowed'})
-            }
-        
-        body_data = json.loads(event.get('body', '{}'))
-        
-        game_settings = body_data.get('game_settings', {})
-        user_action = body_data.get('user_action', '')
-        history = body_data.get('history', [])
-        
-        genre = game_settings.get('genre', 'фэнтези')
-        setting = body_data.get('setting', '')
-        characters = game_settings.get('initialCharacters', [])
-        rating = game_settings.get('rating', '18+')
-        narrative_mode = game_settings.get('narrativeMode', 'third')
-        role = game_settings.get('role', 'hero')
-        world_setting = body_data.get('setting', '')
-        
-        main_char = characters[0] if characters else None
-        mc_name = main_char.get('name', 'Игрок') if main_char else 'Игрок'
-        mc_role = main_char.get('role', 'герой') if main_char else 'герой'
-        mc_desc = main_char.get('description', '') if main_char else ''
-        
-        npc_list = characters[1:] if len(characters) > 1 else []
-        npc_str = ''
-        if npc_list:
-            npc_descriptions = []
-            for npc in npc_list[:5]:
-                npc_name = npc.get('name', '')
-                npc_role = npc.get('role', '')
-                npc_desc = npc.get('description', '')
-                npc_scenes = npc.get('scenes', '')
-                npc_quotes = npc.get('quotes', '')
-                npc_ideas = npc.get('ideas', '')
-                
-                npc_info = f"{npc_name} ({npc_role})"
-                if npc_desc:
-                    npc_info += f"\n  Описание: {npc_desc}"
-                if npc_scenes:
-                    npc_info += f"\n  Сцены: {npc_scenes}"
-                if npc_quotes:
-                    npc_info += f"\n  Фразы: {npc_quotes}"
-                if npc_ideas:
-                    npc_info += f"\n  Идеи: {npc_ideas}"
-                
-                npc_descriptions.append(npc_info)
-            npc_str = '\n\n'.join(npc_descriptions)
-        else:
-            npc_str = 'Создай интересных NPC по ходу истории'
-        
-        pov_instruction = {
-            'first': f'От первого лица ({mc_name}). ИГРОК ИГРАЕТ ЗА {mc_name.upper()}.',
-            'third': f'От третьего лица. ИГРОК КОНТРОЛИРУЕТ {mc_name.upper()}.',
-            'love-interest': f'Романтический интерес. Игрок влюбляется в {mc_name}.'
-        }.get(narrative_mode, f'Игрок управляет {mc_name}')
-        
-        system_prompt = f"""ТЫ — ведущий интерактивной игры. Жанр: {genre}. Рейтинг: {rating}. Мир: {world_setting or 'фэнтези'}
+# Спекулятивные ходы: после ответа продолжения для «🎯 Варианты» генерируются в фоне
+# и кладутся в CACHE под тем же ключом, который даст ход с этим вариантом
+SPECULATE_BUDGET_TOKENS = int(os.environ.get('SPECULATE_BUDGET_TOKENS', '20000'))  # на пользователя за окно; 0 — выключено
+SPECULATE_BUDGET_WINDOW = 3600
+SPECULATE_MAX_OPTIONS = 3
+SPECULATE_QUEUE_LIMIT = 30
+SPECULATE_WAIT = 20  # сколько ход ждёт уже идущую генерацию своего варианта, с
+
+# Один воркер: спекуляции идут по одной и только когда нет живых ходов — низкий приоритет
+SPECULATION_POOL = ThreadPoolExecutor(max_workers=1)
+
+SPECULATED: Dict[str, tuple] = {}  # ключ кеша -> (пользователь, токены)
+_spec_lock = threading.Lock()
+_spec_idle = threading.Condition()
+_foreground = 0
+_spec_pending = 0
+_spec_turns: Dict[tuple, int] = {}  # (пользователь, игра) -> номер последнего хода
+_spec_spent: Dict[str, List[tuple]] = {}  # пользователь -> [(время, токены)]
+_inflight: Dict[str, threading.Event] = {}
+
+SUGGESTIONS_RE = re.compile(r'🎯\s*\**Варианты\**\s*:\**\s*(.+?)(?=\n\s*\n|\n\s*-{3,}|\n\s*\*\*|\Z)', re.S)
+SUGGESTION_SPLIT_RE = re.compile(r'\s*(?:\n|;|\|)\s*|\s+(?=\d[.)]\s)')
+SUGGESTION_MARKER_RE = re.compile(r'^(?:[•*\-–—]|\d[.)])\s*')
+
+@timed('prompt')
+def build_messages(body_data: Dict[str, Any]) -> List[Dict[str, str]]:
+    '''Системный промпт по настройкам игры, последние 8 ходов истории и действие игрока'''
+    game_settings = body_data.get('game_settings', {})
+    user_action = body_data.get('user_action', '')
+    history = body_data.get('history', [])
+    
+    genre = game_settings.get('genre', 'фэнтези')
+    setting = body_data.get('setting', '')
+    characters = game_settings.get('initialCharacters', [])
+    rating = game_settings.get('rating', '18+')
+    narrative_mode = game_settings.get('narrativeMode', 'third')
+    role = game_settings.get('role', 'hero')
+    world_setting = body_data.get('setting', '')
+    
+    main_char = characters[0] if characters else None
+    mc_name = main_char.get('name', 'Игрок') if main_char else 'Игрок'
+    mc_role = main_char.get('role', 'герой') if main_char else 'герой'
+    mc_desc = main_char.get('description', '') if main_char else ''
+    
+    npc_list = characters[1:] if len(characters) > 1 else []
+    npc_str = ''
+    if npc_list:
+        npc_descriptions = []
+        for npc in npc_list[:5]:
+            npc_name = npc.get('name', '')
+            npc_role = npc.get('role', '')
+            npc_desc = npc.get('description', '')
+            npc_scenes = npc.get('scenes', '')
+            npc_quotes = npc.get('quotes', '')
+            npc_ideas = npc.get('ideas', '')
+            
+            npc_info = f"{npc_name} ({npc_role})"
+            if npc_desc:
+                npc_info += f"\n  Описание: {npc_desc}"
+            if npc_scenes:
+                npc_info += f"\n  Сцены: {npc_scenes}"
+            if npc_quotes:
+                npc_info += f"\n  Фразы: {npc_quotes}"
+            if npc_ideas:
+                npc_info += f"\n  Идеи: {npc_ideas}"
+            
+            npc_descriptions.append(npc_info)
+        npc_str = '\n\n'.join(npc_descriptions)
+    else:
+        npc_str = 'Создай интересных NPC по ходу истории'
+    
+    pov_instruction = {
+        'first': f'От первого лица ({mc_name}). ИГРОК ИГРАЕТ ЗА {mc_name.upper()}.',
+        'third': f'От третьего лица. ИГРОК КОНТРОЛИРУЕТ {mc_name.upper()}.',
+        'love-interest': f'Романтический интерес. Игрок влюбляется в {mc_name}.'
+    }.get(narrative_mode, f'Игрок управляет {mc_name}')
+    
+    system_prompt = f"""ТЫ — ведущий интерактивной игры. Жанр: {genre}. Рейтинг: {rating}. Мир: {world_setting or 'фэнтези'}
 
 ПЕРСОНАЖИ:
 • {mc_name} ({mc_role}) — ИГРОК. ⚠️ НИКОГДА не пиши за него!
@@ -169,91 +187,246 @@ NPC — ЖИВЫЕ:
 ✅ ХОРОШО: NPC забывает детали ("Погоди, ты же говорил про брата? Или это была сестра?"), делает поспешные выводы ("Ясно, значит ты предатель!" — хотя не так), меняет мнение ("Нет, постой, я неправ...")
 
 Заканчивай на моменте выбора или вопросе к игроку."""
-        
-        messages = [{'role': 'system', 'content': system_prompt}]
-        
-        for entry in history[-8:]:
-            messages.append({'role': 'user', 'content': entry.get('user', '')})
-            messages.append({'role': 'assistant', 'content': entry.get('ai', '')})
-        
-        if user_action:
-            if '@[МЕТА-КОМАНДА]:' in user_action:
-                meta_cmd, player_action = user_action.split('\n\n', 1)
-                meta_text = meta_cmd.replace('@[МЕТА-КОМАНДА]:', '').strip()
-                messages.append({'role': 'user', 'content': f"🎨 СТИЛИСТИЧЕСКАЯ ИНСТРУКЦИЯ: {meta_text}\n\n{mc_name}: {player_action}"})
-            else:
-                messages.append({'role': 'user', 'content': f"{mc_name}: {user_action}"})
+    
+    messages = [{'role': 'system', 'content': system_prompt}]
+    
+    for entry in history[-8:]:
+        messages.append({'role': 'user', 'content': entry.get('user', '')})
+        messages.append({'role': 'assistant', 'content': entry.get('ai', '')})
+    
+    if user_action:
+        if '@[МЕТА-КОМАНДА]:' in user_action:
+            meta_cmd, player_action = user_action.split('\n\n', 1)
+            meta_text = meta_cmd.replace('@[МЕТА-КОМАНДА]:', '').strip()
+            messages.append({'role': 'user', 'content': f"🎨 СТИЛИСТИЧЕСКАЯ ИНСТРУКЦИЯ: {meta_text}\n\n{mc_name}: {player_action}"})
         else:
-            messages.append({'role': 'user', 'content': "Начни игру. Первая сцена должна ЗАЦЕПИТЬ: атмосфера, загадка, конфликт или яркий персонаж."})
-        
-        # Проверяем кеш
-        cache_key = get_cache_key(json.dumps(messages, ensure_ascii=False))
-        cached = get_from_cache(cache_key)
-        if cached:
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*',
-                    'X-Cache': 'HIT'
-                },
-                'isBase64Encoded': False,
-                'body': json.dumps({'story': cached})
-            }
-        
-        api_key = os.environ.get('DEEPSEEK_API_KEY')
-        
-        if not api_key:
-            return {
-                'statusCode': 500,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'DeepSeek API key not configured'})
-            }
-        
-        response = requests.post(
-            'https://api.deepseek.com/v1/chat/completions',
-            headers={
-                'Authorization': f'Bearer {api_key}',
-                'Content-Type': 'application/json'
-            },
-            json={
-                'model': 'deepseek-chat',
-                'messages': messages,
-                'temperature': 0.9,
-                'max_tokens': 2000,
-                'top_p': 0.95,
-                'frequency_penalty': 0.3,
-                'presence_penalty': 0.3
-            },
-            timeout=30
-        )
-        
+            messages.append({'role': 'user', 'content': f"{mc_name}: {user_action}"})
+    else:
+        messages.append({'role': 'user', 'content': "Начни игру. Первая сцена должна ЗАЦЕПИТЬ: атмосфера, загадка, конфликт или яркий персонаж."})
+    
+    return messages
+
+def parse_suggestions(story: str) -> List[str]:
+    '''Варианты из строки «🎯 Варианты: ...» — через «;», «|», нумерацией или списком ниже'''
+    match = SUGGESTIONS_RE.search(story)
+    if not match:
+        return []
+    suggestions = []
+    for item in SUGGESTION_SPLIT_RE.split(match.group(1)):
+        item = SUGGESTION_MARKER_RE.sub('', item.strip()).strip(' []«»"\'')
+        if 2 <= len(item) <= 200 and item not in suggestions:
+            suggestions.append(item)
+    return suggestions[:SPECULATE_MAX_OPTIONS]
+
+def post_completion(requests, api_key: str, messages: List[Dict[str, str]]):
+    return requests.post(
+        f'{DEEPSEEK_BASE_URL}/v1/chat/completions',
+        headers={
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json'
+        },
+        json={
+            'model': 'deepseek-chat',
+            'messages': messages,
+            'temperature': 0.9,
+            'max_tokens': 2000,
+            'top_p': 0.95,
+            'frequency_penalty': 0.3,
+            'presence_penalty': 0.3
+        },
+        timeout=30
+    )
+
+@contextmanager
+def foreground_turn():
+    '''Живой ход: пока он идёт, фоновые спекуляции не начинаются'''
+    global _foreground
+    with _spec_idle:
+        _foreground += 1
+    try:
+        yield
+    finally:
+        with _spec_idle:
+            _foreground -= 1
+            _spec_idle.notify_all()
+
+def spent_tokens(owner: str) -> int:
+    '''Токены спекуляций пользователя за последнее окно; старые записи выкидываются'''
+    border = time.time() - SPECULATE_BUDGET_WINDOW
+    with _spec_lock:
+        entries = [e for e in _spec_spent.get(owner, []) if e[0] >= border]
+        _spec_spent[owner] = entries
+        return sum(tokens for _, tokens in entries)
+
+def speculate_next(owner: Optional[str], game_id: Any, body_data: Dict[str, Any], story: str,
+                   tokens: Optional[int]) -> Dict[str, Any]:
+    '''
+    Ставит в фон продолжения для вариантов из ответа и возвращает их клиенту: вариант,
+    отправленный дословно, даст тот же ключ кеша. Прошлые спекуляции этой игры устаревают
+    '''
+    global _spec_pending
+    suggestions = parse_suggestions(story)
+    if not owner or SPECULATE_BUDGET_TOKENS <= 0:
+        metrics.inc('speculative_jobs_total', len(suggestions), function='story-ai', outcome='disabled')
+        return {'suggestions': suggestions}
+    scope = (owner, str(game_id or ''))
+    history = body_data.get('history', []) + [{'user': body_data.get('user_action', ''), 'ai': story}]
+    with _spec_lock:
+        turn = _spec_turns[scope] = _spec_turns.get(scope, 0) + 1
+    # Оценка цены варианта — токены этого хода; точная сумма списывается после генерации
+    estimate = tokens or 2000
+    for suggestion in suggestions:
+        with _spec_lock:
+            if _spec_pending >= SPECULATE_QUEUE_LIMIT:
+                metrics.inc('speculative_jobs_total', function='story-ai', outcome='dropped')
+                continue
+            _spec_pending += 1
+        next_body = {
+            'game_settings': body_data.get('game_settings', {}), 'setting': body_data.get('setting', ''),
+            'user_action': suggestion, 'history': history
+        }
+        SPECULATION_POOL.submit(run_speculation, owner, scope, turn, next_body, estimate)
+    return {'suggestions': suggestions}
+
+def run_speculation(owner: str, scope: tuple, turn: int, body_data: Dict[str, Any], estimate: int):
+    global _spec_pending
+    with _spec_idle:
+        _spec_idle.wait_for(lambda: _foreground == 0)
+    try:
+        outcome = speculate_one(owner, scope, turn, body_data, estimate)
+    except Exception as e:
+        print(f"Speculation failed: {type(e).__name__} - {e}")
+        outcome = 'error'
+    finally:
+        with _spec_lock:
+            _spec_pending -= 1
+    metrics.inc('speculative_jobs_total', function='story-ai', outcome=outcome)
+
+def speculate_one(owner: str, scope: tuple, turn: int, body_data: Dict[str, Any], estimate: int) -> str:
+    if _spec_turns.get(scope) != turn:
+        # Игрок уже сходил — варианты этого хода больше не нужны
+        return 'stale'
+    if spent_tokens(owner) + estimate > SPECULATE_BUDGET_TOKENS:
+        return 'budget'
+    api_key = os.environ.get('DEEPSEEK_API_KEY')
+    if not api_key:
+        return 'error'
+    messages = build_messages(body_data)
+    cache_key = get_cache_key(json.dumps(messages, ensure_ascii=False))
+    if get_from_cache(cache_key):
+        return 'cached'
+    import requests
+    done = _inflight.setdefault(cache_key, threading.Event())
+    try:
+        response = post_completion(requests, api_key, messages)
         if not response.ok:
-            return {
-                'statusCode': response.status_code,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': f'DeepSeek API error: {response.text}'})
-            }
-        
+            return 'error'
         result = response.json()
-        story_text = result['choices'][0]['message']['content']
+        tokens = result.get('usage', {}).get('total_tokens') or estimate
+        with _spec_lock:
+            _spec_spent.setdefault(owner, []).append((time.time(), tokens))
+        save_to_cache(cache_key, result['choices'][0]['message']['content'])
+        SPECULATED[cache_key] = (owner, tokens)
+        metrics.inc('speculative_tokens_total', tokens, function='story-ai', use='generated')
+        return 'generated'
+    finally:
+        _inflight.pop(cache_key, None)
+        done.set()
+
+def story_response(session: Dict[str, Any] | None, body_data: Dict[str, Any], story: str, cache_status: str,
+                   extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    '''Ответ с историей; ход сессии дописывается на сервер, клиент получает её новую версию'''
+    data = {'story': story, **(extra or {})}
+    if session is not None:
+        data['session_version'] = game_sessions.append(session, [{'user': body_data.get('user_action', ''), 'ai': story}])
+    return json_response(200, data, headers={'X-Cache': cache_status})
+
+@instrument('story-ai')
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    try:
+        method: str = event.get('httpMethod', 'POST')
         
-        # Сохраняем в кеш
-        save_to_cache(cache_key, story_text)
+        if method == 'OPTIONS':
+            return preflight('POST, OPTIONS', 'Content-Type, X-User-Id, X-Auth-Token')
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*',
-                'X-Cache': 'MISS'
-            },
-            'isBase64Encoded': False,
-            'body': json.dumps({'story': story_text})
-        }
+        if method != 'POST':
+            return json_response(405, {'error': 'Method not allowed'})
+        
+        with foreground_turn():
+            return play_turn(event, json.loads(event.get('body', '{}')))
+    except game_sessions.SessionForbidden as e:
+        return json_response(403, {'error': str(e)})
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': f'Error: {str(e)}'})
-        }
\ No newline at end of file
+        return json_response(500, {'error': f'Error: {str(e)}'})
+
+def play_turn(event: Dict[str, Any], body_data: Dict[str, Any]) -> Dict[str, Any]:
+    import requests
+    
+    owner, verified = game_sessions.authenticate(event)
+    # Бюджет спекуляций — на пользователя, поэтому только подтверждённому токеном: иначе сменой
+    # X-User-Id можно тратить LLM без ограничений
+    speculate = bool(body_data.get('speculate'))
+    speculator = owner if verified else None
+    
+    session = None
+    game_id = body_data.get('game_id')
+    if game_id:
+        if 'history' in body_data or 'game_settings' in body_data:
+            # Полное состояние от клиента — оно же становится сессией
+            session = game_sessions.start('story-ai', game_id, {
+                'game_settings': body_data.get('game_settings', {}), 'setting': body_data.get('setting', '')
+            }, body_data.get('history', []), owner=owner)
+        else:
+            session = game_sessions.load('story-ai', game_id, body_data.get('session_version'), owner)
+            if session is None:
+                return json_response(409, {
+                    'error': 'Game session not found, resend game_settings, setting and history',
+                    'code': 'session_required'
+                })
+            body_data = {**session['settings'], 'user_action': body_data.get('user_action', ''), 'history': session['history']}
+    
+    messages = build_messages(body_data)
+    
+    # Проверяем кеш
+    with span('cache'):
+        cache_key = get_cache_key(json.dumps(messages, ensure_ascii=False))
+        cached = get_from_cache(cache_key)
+    done = _inflight.get(cache_key) if not cached else None
+    if done is not None:
+        # Игрок выбрал вариант, который как раз генерируется в фоне, — дождаться дешевле, чем начать заново
+        with span('speculation_wait'):
+            done.wait(SPECULATE_WAIT)
+        cached = get_from_cache(cache_key)
+    speculated = SPECULATED.pop(cache_key, None) if cached else None
+    note(cache='hit' if cached else 'miss', history_turns=len(body_data.get('history', [])))
+    if speculate and body_data.get('history'):
+        metrics.inc('speculative_turns_total', function='story-ai', outcome='hit' if speculated else 'miss')
+    if speculated:
+        note(speculative='hit')
+        metrics.inc('speculative_tokens_total', speculated[1], function='story-ai', use='served')
+    if cached:
+        extra = speculate_next(speculator, game_id, body_data, cached, speculated[1] if speculated else None) if speculate else None
+        return story_response(session, body_data, cached, 'HIT', extra)
+    
+    api_key = os.environ.get('DEEPSEEK_API_KEY')
+    
+    if not api_key:
+        return json_response(500, {'error': 'DeepSeek API key not configured'})
+    
+    with span('deepseek'):
+        response = post_completion(requests, api_key, messages)
+    note(upstream_status=response.status_code)
+    
+    if not response.ok:
+        return json_response(response.status_code, {'error': f'DeepSeek API error: {response.text}'})
+    
+    result = response.json()
+    story_text = result['choices'][0]['message']['content']
+    tokens = result.get('usage', {}).get('total_tokens')
+    note(tokens=tokens)
+    
+    # Сохраняем в кеш
+    save_to_cache(cache_key, story_text)
+    
+    extra = speculate_next(speculator, game_id, body_data, story_text, tokens) if speculate else None
+    return story_response(session, body_data, story_text, 'MISS', extra)
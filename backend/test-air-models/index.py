@@ -2,7 +2,10 @@ import json
 import os
 import urllib.request
 from typing import Dict, Any
+from response import json_response, preflight
+from timing import instrument
 
+@instrument('test-air-models')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Получить список доступных моделей из air.fail
@@ -12,26 +15,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return preflight('GET, OPTIONS')
     
     api_key = os.environ.get('CLAUDE_API_KEY')
     if not api_key:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'CLAUDE_API_KEY not configured'}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': 'CLAUDE_API_KEY not configured'})
     
     api_url = "https://api.air.fail/public/text"
     
@@ -52,16 +40,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             # Ищем DeepSeek
             deepseek_models = [m for m in models if 'deepseek' in m.get('slug', '').lower() or 'deepseek' in m.get('title', '').lower()]
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(deepseek_models, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            return json_response(200, deepseek_models)
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
\ No newline at end of file
+        return json_response(500, {'error': str(e)})
\ No newline at end of file
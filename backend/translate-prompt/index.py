@@ -1,8 +1,11 @@
 import json
 import os
 from typing import Dict, Any
-import requests
+from translation import lookup_translation, request_translation
+from response import json_response, preflight
+from timing import instrument
 
+@instrument('translate-prompt')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Translates Russian prompts to English for better FLUX results
@@ -13,28 +16,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return preflight('POST, OPTIONS')
+    
+    import requests
     
     if method != 'POST':
-        return {
-            'statusCode': 405,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
+        return json_response(405, {'error': 'Method not allowed'})
     
     body_str = event.get('body', '{}')
     if not body_str or body_str.strip() == '':
@@ -44,73 +31,22 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     prompt = body_data.get('prompt', '')
     
     if not prompt:
-        return {
-            'statusCode': 400,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Prompt is required'}),
-            'isBase64Encoded': False
-        }
+        return json_response(400, {'error': 'Prompt is required'})
+    
+    cached = lookup_translation(prompt)
+    if cached:
+        return json_response(200, {'translated': cached}, headers={'X-Cache': 'HIT'})
     
     api_key = os.environ.get('DEEPSEEK_API_KEY')
     if not api_key:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'API key not configured'}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': 'API key not configured'})
     
     try:
-        response = requests.post(
-            'https://api.deepseek.com/v1/chat/completions',
-            headers={
-                'Authorization': f'Bearer {api_key}',
-                'Content-Type': 'application/json'
-            },
-            json={
-                'model': 'deepseek-chat',
-                'messages': [
-                    {
-                        'role': 'system',
-                        'content': 'You are a professional translator for AI image generation. Translate Russian descriptions into detailed English prompts optimized for FLUX model. Add artistic details, style keywords, and quality tags. Keep it under 150 words. Focus on: lighting, atmosphere, style (dark fantasy, realistic, cinematic), composition, details.'
-                    },
-                    {
-                        'role': 'user',
-                        'content': f'Translate and enhance this description for FLUX image generation: {prompt}'
-                    }
-                ],
-                'temperature': 0.7,
-                'max_tokens': 200
-            },
-            timeout=30
-        )
-        response.raise_for_status()
-        data = response.json()
-        
-        translated = data['choices'][0]['message']['content'].strip()
+        translated = request_translation(prompt, api_key)
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'translated': translated}),
-            'isBase64Encoded': False
-        }
+        return json_response(200, {'translated': translated}, headers={'X-Cache': 'MISS'})
     except requests.exceptions.RequestException as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': f'Translation failed: {str(e)}'}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': f'Translation failed: {str(e)}'})
+    except (KeyError, IndexError, ValueError) as e:
+        # Ответ DeepSeek без choices/message или не JSON
+        return json_response(500, {'error': f'Translation failed: malformed response ({type(e).__name__})'})
@@ -1,8 +1,10 @@
 import json
 import os
 from typing import Dict, Any
-import psycopg2
+from response import json_response, preflight
+from timing import connect_db, instrument
 
+@instrument('update-story-progress')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Updates story progress (context and actions log)
@@ -12,28 +14,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return preflight('PUT, OPTIONS')
+    
     
     if method != 'PUT':
-        return {
-            'statusCode': 405,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
+        return json_response(405, {'error': 'Method not allowed'})
     
     body_str = event.get('body') or '{}'
     try:
@@ -46,29 +31,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     new_action: dict = body_data.get('new_action')
     
     if not story_id:
-        return {
-            'statusCode': 400,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'story_id is required'}),
-            'isBase64Encoded': False
-        }
+        return json_response(400, {'error': 'story_id is required'})
     
     dsn = os.environ.get('DATABASE_URL')
     if not dsn:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Database not configured'}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': 'Database not configured'})
     
-    conn = psycopg2.connect(dsn)
+    conn = connect_db(dsn)
     cur = conn.cursor()
     
     if new_action:
@@ -86,12 +55,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     cur.close()
     conn.close()
     
-    return {
-        'statusCode': 200,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*'
-        },
-        'isBase64Encoded': False,
-        'body': json.dumps({'success': True}, ensure_ascii=False)
-    }
+    return json_response(200, {'success': True})
@@ -8,11 +8,12 @@ Returns: HTTP response with updated universe data
 import json
 import os
 from typing import Dict, Any, List, Optional, Tuple
-import psycopg2
-from psycopg2.extras import RealDictCursor
-import jwt
+from conditional import bump_version
+from response import json_response, preflight
+from timing import connect_db, instrument
 
 def verify_jwt(token: str) -> Optional[Dict[str, Any]]:
+    import jwt
     jwt_secret = os.environ.get('JWT_SECRET')
     if not jwt_secret:
         return None
@@ -26,48 +27,25 @@ def require_auth(event: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optio
     headers = event.get('headers', {})
     auth_header = headers.get('X-Auth-Token', headers.get('x-auth-token', ''))
     if not auth_header:
-        return None, {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Требуется авторизация'})
-        }
+        return None, json_response(401, {'error': 'Требуется авторизация'})
     user = verify_jwt(auth_header)
     if not user:
-        return None, {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Недействительный токен'})
-        }
+        return None, json_response(401, {'error': 'Недействительный токен'})
     return user, None
 
+@instrument('update-universe')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Auth-Token',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return preflight('PUT, OPTIONS', 'Content-Type, X-User-Id, X-Auth-Token')
+    
+    from psycopg2.extras import RealDictCursor
     
     database_url = os.environ.get('DATABASE_URL')
     
     if not database_url:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Database configuration error'}),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': 'Database configuration error'})
     
     if method == 'PUT':
         user, error = require_auth(event)
@@ -88,18 +66,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         tags: List[str] = body_data.get('tags', [])
         
         if not universe_id or not name:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': 'id and name are required'}),
-                'isBase64Encoded': False
-            }
+            return json_response(400, {'error': 'id and name are required'})
         
-        conn = psycopg2.connect(database_url)
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        conn = connect_db(database_url, cursor_factory=RealDictCursor)
+        cur = conn.cursor()
         
         cur.execute("""UPDATE universes 
                SET name = %s, 
@@ -116,36 +86,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if not updated_universe:
             cur.close()
             conn.close()
-            return {
-                'statusCode': 404,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': 'Universe not found'}),
-                'isBase64Encoded': False
-            }
+            return json_response(404, {'error': 'Universe not found'})
         
+        bump_version(cur, 'universes')
         conn.commit()
         cur.close()
         conn.close()
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'universe': dict(updated_universe)}, default=str),
-            'isBase64Encoded': False
-        }
+        return json_response(200, {'universe': dict(updated_universe)})
     
-    return {
-        'statusCode': 405,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*'
-        },
-        'body': json.dumps({'error': 'Method not allowed'}),
-        'isBase64Encoded': False
-    }
\ No newline at end of file
+    return json_response(405, {'error': 'Method not allowed'})
\ No newline at end of file
@@ -0,0 +1,170 @@
+'''
+Общий конструктор ответов облачных функций: готовые CORS-заголовки и быстрая сериализация JSON.
+Копия лежит в папке каждой функции (как translation.py и keyword_matcher.py) — копии должны совпадать.
+orjson (если установлен) сам сериализует uuid и строки RealDictCursor (подкласс dict), а datetime отдаёт
+в _default — даты остаются в прежнем формате str() ('2024-01-01 12:00:00', не ISO с 'T'), который
+уже разбирает фронтенд; без orjson работает json из стандартной библиотеки с тем же форматом вывода.
+Тела от COMPRESS_MIN_BYTES сжимаются под Accept-Encoding запроса (br, если установлен brotli, иначе gzip)
+и уходят платформе в base64 с isBase64Encoded — см. compress
+'''
+
+import json
+import os
+from typing import Dict, Any, Optional
+from timing import note, request_header, span
+
+CORS_HEADERS = {'Access-Control-Allow-Origin': '*'}
+JSON_HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+
+# Меньше ~1 KB сжатие не окупается: выигрыш съедают заголовки и base64 между функцией и платформой
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+# Уровни — из bench_compression.py: выше почти не сжимают сильнее, но заметно дороже по CPU
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '4'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '4'))
+
+# None — ещё не загружали, False — orjson не установлен
+_orjson = None
+_brotli = None
+
+
+def _load_orjson():
+    '''orjson тянет за собой uuid и zoneinfo (~7 мс) — грузим при первой сериализации, а не на OPTIONS'''
+    global _orjson
+    if _orjson is None:
+        try:
+            import orjson
+            _orjson = orjson
+        except ImportError:
+            _orjson = False
+    return _orjson
+
+
+def _load_brotli():
+    global _brotli
+    if _brotli is None:
+        try:
+            import brotli
+            _brotli = brotli
+        except ImportError:
+            _brotli = False
+    return _brotli
+
+
+def _default(value: Any) -> Any:
+    '''
+    Типы, которых нет в JSON. Decimal, UUID, datetime и прочее — строкой, как раньше с default=str:
+    точность NUMERIC не теряется, а decimal и uuid не нужно импортировать ради isinstance
+    '''
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if isinstance(value, (bytes, memoryview)):
+        return bytes(value).decode('utf-8', errors='replace')
+    return str(value)
+
+
+def dumps(data: Any, indent: bool = False) -> str:
+    '''JSON-строка для тела ответа; кириллица не экранируется'''
+    orjson = _load_orjson()
+    if orjson:
+        try:
+            options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+            if indent:
+                options |= orjson.OPT_INDENT_2
+            return orjson.dumps(data, default=_default, option=options).decode('utf-8')
+        except TypeError:
+            # Целые больше 64 бит и прочая экзотика — пусть разбирается стандартный json
+            pass
+    if indent:
+        return json.dumps(data, default=_default, ensure_ascii=False, indent=2)
+    return json.dumps(data, default=_default, ensure_ascii=False, separators=(',', ':'))
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    '''br или gzip по Accept-Encoding (с учётом q); при равных весах br. None — отдаём как есть'''
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.partition(';')
+        params = params.strip().replace(' ', '')
+        try:
+            weights[name.strip().lower()] = float(params[2:]) if params.startswith('q=') else 1.0
+        except ValueError:
+            weights[name.strip().lower()] = 0.0
+    best, best_q = None, 0.0
+    for encoding in (('br', 'gzip') if _load_brotli() else ('gzip',)):
+        q = weights.get(encoding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress_bytes(data: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return _load_brotli().compress(data, quality=BROTLI_QUALITY)
+    # zlib со wbits=31 пишет формат gzip; модуль gzip ради этого не импортируем
+    import zlib
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress(response: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Сжимает текстовое тело ответа, если клиент это принимает и тело не меньше COMPRESS_MIN_BYTES.
+    Вне instrument заголовков запроса нет — ответ возвращается как есть
+    '''
+    body = response.get('body')
+    if not isinstance(body, str) or response.get('isBase64Encoded') or len(body) < COMPRESS_MIN_BYTES:
+        return response
+    headers = response.setdefault('headers', {})
+    if 'Content-Encoding' in headers:
+        return response
+    raw = body.encode('utf-8')
+    if len(raw) < COMPRESS_MIN_BYTES:
+        return response
+    # Ответ зависит от Accept-Encoding, даже когда этот клиент получил его несжатым
+    headers['Vary'] = 'Accept-Encoding'
+    encoding = choose_encoding(request_header('Accept-Encoding'))
+    if not encoding:
+        return response
+    import base64
+    with span('compress'):
+        packed = compress_bytes(raw, encoding)
+        if len(packed) >= len(raw):
+            return response
+        response['body'] = base64.b64encode(packed).decode('ascii')
+    response['isBase64Encoded'] = True
+    headers['Content-Encoding'] = encoding
+    etag = headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        # Сжатое тело уже не байт-в-байт то же — строгий ETag становится слабым, как у nginx
+        headers['ETag'] = 'W/' + etag
+    note(content_encoding=encoding, body_bytes=len(raw), sent_bytes=len(packed))
+    return response
+
+
+def json_response(status: int, data: Any, headers: Optional[Dict[str, str]] = None, indent: bool = False) -> Dict[str, Any]:
+    '''Ответ платформе: JSON-тело и CORS; headers дополняют или переопределяют JSON_HEADERS. Большие тела сжимаются'''
+    with span('encode'):
+        body = dumps(data, indent)
+    return compress({
+        'statusCode': status,
+        'headers': {**JSON_HEADERS, **headers} if headers else dict(JSON_HEADERS),
+        'body': body,
+        'isBase64Encoded': False
+    })
+
+
+def preflight(methods: str, allow_headers: str = 'Content-Type') -> Dict[str, Any]:
+    '''Ответ на OPTIONS: какие методы и заголовки функция принимает, кешируется браузером на сутки'''
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': methods,
+            'Access-Control-Allow-Headers': allow_headers,
+            'Access-Control-Max-Age': '86400'
+        },
+        'body': '',
+        'isBase64Encoded': False
+    }
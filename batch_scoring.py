@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Пакетная оценка историй по критериям run_creativity_tests.analyze_response
+Истории один раз превращаются в разреженную матрицу «история × термин», все баллы
+считаются векторно в NumPy; total_score совпадает с analyze_response до бита
+Запуск: python3 batch_scoring.py creativity-test-results.json [...] [--csv scores.csv]
+"""
+
+import argparse
+import csv
+import json
+import sys
+from typing import Dict, Any, List, Sequence, Union
+
+import numpy as np
+
+from run_creativity_tests import STORY_LEXICONS, NAME_LEXICONS, STORY_MATCHER, NAME_MATCHER
+
+# Термин — пара (категория, ключ): одно слово может считаться в нескольких категориях
+CATEGORIES = list(STORY_LEXICONS) + list(NAME_LEXICONS)
+CATEGORY_INDEX = {category: i for i, category in enumerate(CATEGORIES)}
+
+SCENARIOS = ['Mo Dao Zu Shi', 'Сверхестественное', 'Оригинальный мир', 'Эмоциональная глубина']
+
+SCORE_COLUMNS = ['canon_understanding', 'npc_alive', 'atmosphere', 'emotional_depth', 'nsfw_quality', 'total_score']
+
+
+class TermMatrix:
+    '''Разреженная матрица в формате COO: строка — история, столбец — термин, значение — 1'''
+
+    def __init__(self, rows: np.ndarray, cols: np.ndarray, terms: List[tuple], n_stories: int):
+        self.rows = rows
+        self.cols = cols
+        self.terms = terms
+        self.shape = (n_stories, len(terms))
+
+    def category_counts(self) -> np.ndarray:
+        '''Сколько разных ключей каждой категории встретилось в каждой истории (n_stories × n_categories)'''
+        term_category = np.array([CATEGORY_INDEX[category] for category, _ in self.terms], dtype=np.intp)
+        counts = np.zeros((self.shape[0], len(CATEGORIES)), dtype=np.int32)
+        if len(self.rows):
+            np.add.at(counts, (self.rows, term_category[self.cols]), 1)
+        return counts
+
+
+def build_term_matrix(stories: Sequence[str]) -> TermMatrix:
+    '''Один проход матчеров по каждой истории; дальше работаем только с индексами'''
+    term_index: Dict[tuple, int] = {}
+    rows: List[int] = []
+    cols: List[int] = []
+    for i, story in enumerate(stories):
+        found = dict(STORY_MATCHER.scan(story).found)
+        found.update(NAME_MATCHER.scan(story).found)
+        for category, words in found.items():
+            for word in words:
+                rows.append(i)
+                cols.append(term_index.setdefault((category, word), len(term_index)))
+    return TermMatrix(
+        np.array(rows, dtype=np.intp),
+        np.array(cols, dtype=np.intp),
+        list(term_index),
+        len(stories)
+    )
+
+
+class ScoreTable:
+    '''Таблица результатов: столбцы — массивы NumPy; to_pandas() — если установлен pandas'''
+
+    def __init__(self, columns: Dict[str, Any]):
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __getitem__(self, column: str):
+        return self.columns[column]
+
+    def rows(self) -> List[Dict[str, Any]]:
+        names = list(self.columns)
+        return [
+            {name: self.columns[name][i].item() if hasattr(self.columns[name][i], 'item') else self.columns[name][i] for name in names}
+            for i in range(len(self))
+        ]
+
+    def to_pandas(self):
+        import pandas as pd
+        return pd.DataFrame(self.columns)
+
+
+def _tiers(values: np.ndarray, thresholds: List[tuple]) -> np.ndarray:
+    '''Ступенчатые баллы: [(условие, балл), ...] проверяются по порядку, как цепочка if/elif'''
+    return np.select([cond(values) for cond, _ in thresholds], [score for _, score in thresholds], 0)
+
+
+def score_batch(test_names: Union[str, Sequence[str]], stories: Sequence[str]) -> ScoreTable:
+    '''Оценивает пачку историй; test_names — один сценарий на всех или по сценарию на историю'''
+    n = len(stories)
+    if isinstance(test_names, str):
+        test_names = [test_names] * n
+
+    counts = build_term_matrix(stories).category_counts()
+
+    def count(category: str) -> np.ndarray:
+        return counts[:, CATEGORY_INDEX[category]]
+
+    def has(category: str) -> np.ndarray:
+        return (count(category) > 0).astype(np.int32)
+
+    # Скалярные признаки текста — str.count на C, по одному вызову на историю
+    lengths = np.fromiter((len(s) for s in stories), dtype=np.int64, count=n)
+    dialogs = np.fromiter((s.count('—') + s.count(': "') + s.count('- ') for s in stories), dtype=np.int64, count=n)
+    scenario = np.array(
+        [next((i for i, marker in enumerate(SCENARIOS) if marker in name), -1) for name in test_names],
+        dtype=np.int8
+    )
+
+    # 1. Канон: у каждого сценария свои признаки, выбираем по сценарию
+    context = count('context_words')
+    canon = np.select(
+        [scenario == 0, scenario == 1, scenario == 2, scenario == 3],
+        [
+            3 * has('mdzs_terms') + 2 * (count('mdzs_names') == 2) + 2 * has('lwz_traits') + 2 * has('wwx_traits'),
+            3 * has('hunt_words') + 3 * has('canon_details') + 2 * has('spn_humor') + has('heaven'),
+            4 * (count('scifi_words') >= 2) + 3 * has('scifi_future'),
+            3 * (count('drama_names') == 2) + np.select([context >= 2, context > 0], [4, 2], 0)
+        ],
+        0
+    )
+
+    # 2. Живые NPC
+    npc = (
+        _tiers(dialogs, [(lambda d: d > 5, 3), (lambda d: d > 2, 2), (lambda d: d > 0, 1)])
+        + 2 * has('inner_thoughts')
+        + _tiers(count('body_language'), [(lambda c: c >= 2, 2), (lambda c: c > 0, 1)])
+        + 2 * has('memory_words')
+    )
+
+    # 3. Атмосфера
+    atmosphere = (
+        _tiers(count('sensory_words'), [(lambda c: c >= 4, 4), (lambda c: c >= 2, 2), (lambda c: c > 0, 1)])
+        + 2 * (lengths > 800)
+        + _tiers(count('emotional_words'), [(lambda c: c >= 3, 3), (lambda c: c >= 1, 1)])
+    )
+
+    # 4. Глубина эмоций
+    emotional = np.where(count('cliche_phrases') == 0, 4, -2) + 3 * has('complex_emotions') + 2 * has('silence_words')
+
+    # 5. NSFW
+    nsfw_count = count('nsfw_indicators')
+    vulgar = count('vulgar_words')
+    nsfw = np.select(
+        [(nsfw_count > 0) & (vulgar == 0), (nsfw_count == 0) & (vulgar == 0), (nsfw_count > 0) & (vulgar > 0)],
+        [5, 3, 2],
+        0
+    )
+    nsfw = np.where(vulgar > 2, 1, nsfw)
+
+    # Тот же порядок операций, что в analyze_response, — суммы совпадают побитово
+    total = (
+        (canon / 9) * 2.5 +
+        (npc / 9) * 2.5 +
+        (atmosphere / 9) * 2.0 +
+        (emotional / 9) * 2.0 +
+        (nsfw / 5) * 1.0
+    )
+    # np.round округляет через умножение и расходится с round() на границах .x5 — округляем как Python
+    total_score = np.array([round(x, 1) for x in total.tolist()])
+
+    return ScoreTable({
+        'test_name': np.array(test_names, dtype=object),
+        'canon_understanding': canon.astype(np.int32),
+        'npc_alive': npc.astype(np.int32),
+        'atmosphere': atmosphere.astype(np.int32),
+        'emotional_depth': emotional.astype(np.int32),
+        'nsfw_quality': nsfw.astype(np.int32),
+        'total_score': total_score,
+        'length': lengths
+    })
+
+
+def load_results(paths: List[str]) -> List[Dict[str, Any]]:
+    '''Истории из отчётов run_creativity_tests.py (creativity-test-results.json)'''
+    items = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            report = json.load(f)
+        for result in report.get('results', []):
+            if result.get('success') and result.get('story'):
+                items.append({'test_name': result['analysis']['test_name'], 'story': result['story']})
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Пакетная оценка сохранённых историй')
+    parser.add_argument('reports', nargs='+', help='Файлы creativity-test-results.json')
+    parser.add_argument('--csv', help='Сохранить таблицу в CSV')
+    args = parser.parse_args()
+
+    items = load_results(args.reports)
+    if not items:
+        print('❌ В отчётах нет успешных историй')
+        sys.exit(1)
+
+    table = score_batch([i['test_name'] for i in items], [i['story'] for i in items])
+    rows = table.rows()
+
+    if args.csv:
+        with open(args.csv, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(table.columns))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"💾 Таблица сохранена в: {args.csv}")
+
+    print(f"📊 Историй: {len(table)}, средняя оценка: {table['total_score'].mean():.2f}/10")
+    for name in dict.fromkeys(r['test_name'] for r in rows):
+        scores = [r['total_score'] for r in rows if r['test_name'] == name]
+        print(f"   • {name}: {sum(scores) / len(scores):.2f} ({len(scores)} историй)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк сжатия ответов: сколько CPU стоит gzip/brotli на каждом уровне и сколько байт экономит
+на типичных телах с кириллицей — список историй (get-stories), игры с actions_log (rpg-games),
+отчёт креативности с indent=2 (run-creativity-tests) и фанфик на 5000 слов (generate-fanfic)
+Запуск: python3 bench_compression.py [--repeat 20] [--payload report.json] [--json compression.json]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+import re
+import sys
+import time
+from typing import Dict, Any, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend', 'story-ai'))
+import response
+from mock_llm_server import DEFAULT_STORY
+
+GZIP_LEVELS = (1, 4, 6, 9)
+BROTLI_QUALITIES = (1, 4, 5, 6, 9, 11)
+# measure перебирает уровни прямо в модуле — запоминаем значения по умолчанию до этого
+DEFAULT_LEVELS = (('gzip', response.GZIP_LEVEL), ('br', response.BROTLI_QUALITY))
+
+
+class Prose:
+    '''
+    «Проза» из словаря ответа мока: случайные предложения, а не повтор одного абзаца —
+    повтор gzip сжал бы почти в ноль и завысил выигрыш
+    '''
+
+    def __init__(self, seed: int = 7):
+        self.rng = random.Random(seed)
+        self.words = [w.lower() for w in re.findall(r'[А-Яа-яЁё]+', DEFAULT_STORY)]
+
+    def sentence(self) -> str:
+        words = [self.rng.choice(self.words) for _ in range(self.rng.randint(5, 16))]
+        text = ' '.join(words)
+        return text[0].upper() + text[1:] + self.rng.choice(['.', '.', '.', '!', '?', '…'])
+
+    def paragraphs(self, words: int) -> str:
+        parts, count = [], 0
+        while count < words:
+            paragraph = ' '.join(self.sentence() for _ in range(self.rng.randint(2, 5)))
+            if self.rng.random() < 0.3:
+                paragraph = '— ' + paragraph
+            parts.append(paragraph)
+            count += len(paragraph.split())
+        return '\n\n'.join(parts)
+
+
+def payloads(prose: Prose) -> Dict[str, Any]:
+    '''Тела в форме ответов наших функций'''
+    started = datetime.datetime(2025, 3, 1, 12, 0)
+    stories = {'stories': [{
+        'id': i + 1,
+        'title': prose.sentence()[:60],
+        'content': prose.paragraphs(800),
+        'prompt': prose.sentence(),
+        'character_name': 'Вэй Усянь',
+        'world_name': 'Облачные Глубины',
+        'genre': 'сянься',
+        'created_at': (started + datetime.timedelta(hours=i)).isoformat()
+    } for i in range(20)]}
+    games = [{
+        'id': i + 1,
+        'title': prose.sentence()[:50],
+        'genre': 'фэнтези',
+        'story_context': prose.paragraphs(300),
+        'actions_log': [{'action': prose.sentence(), 'result': prose.paragraphs(120)} for _ in range(40)],
+        'combat_log': [{'round': r, 'text': prose.sentence()} for r in range(30)],
+        'inventory': ['меч', 'фонарь', 'свиток'],
+        'stats': {'hp': 80, 'mana': 40},
+        'last_played': (started + datetime.timedelta(days=i)).isoformat()
+    } for i in range(10)]
+    report = {
+        'summary': {'total_tests': 7, 'successful': 7, 'failed': 0, 'average_score': 7.4, 'status': 'ХОРОШО'},
+        'results': [{
+            'test_name': f'Тест {i}',
+            'total_score': 7.5,
+            'scores': {'novelty': 8, 'coherence': 7, 'emotion': 7},
+            'story': prose.paragraphs(600)
+        } for i in range(7)],
+        'timestamp': 1740830400.0
+    }
+    fanfic = {'story_id': 42, 'title': prose.sentence()[:60], 'content': prose.paragraphs(5000)}
+    return {
+        'get-stories': (stories, False),
+        'rpg-games': (games, False),
+        'run-creativity-tests': (report, True),
+        'generate-fanfic': (fanfic, False)
+    }
+
+
+def time_call(fn, repeat: int) -> float:
+    '''Среднее время одного вызова в микросекундах (лучшее из трёх серий)'''
+    best = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        best = min(best, (time.perf_counter() - start) / repeat)
+    return best * 1e6
+
+
+def measure(raw: bytes, repeat: int) -> List[Dict[str, Any]]:
+    rows = []
+    codecs = [('gzip', level) for level in GZIP_LEVELS]
+    if response._load_brotli():
+        codecs += [('br', quality) for quality in BROTLI_QUALITIES]
+    for encoding, level in codecs:
+        response.GZIP_LEVEL = level
+        response.BROTLI_QUALITY = level
+        packed = response.compress_bytes(raw, encoding)
+        us = time_call(lambda: response.compress_bytes(raw, encoding), repeat)
+        rows.append({
+            'encoding': encoding,
+            'level': level,
+            'bytes': len(packed),
+            'ratio': round(len(raw) / len(packed), 2),
+            'us': round(us, 1),
+            # Сколько CPU стоит каждый сэкономленный килобайт
+            'us_per_kb_saved': round(us / max(1, (len(raw) - len(packed)) / 1024), 2)
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк gzip/brotli на телах ответов функций')
+    parser.add_argument('--repeat', type=int, default=20, help='Сжатий в одной серии')
+    parser.add_argument('--payload', action='append', default=[], help='Свой JSON-файл (например, сохранённый ответ); можно несколько')
+    parser.add_argument('--json', help='Сохранить результат в JSON')
+    args = parser.parse_args()
+
+    bodies = {name: response.dumps(data, indent) for name, (data, indent) in payloads(Prose()).items()}
+    for path in args.payload:
+        with open(path, encoding='utf-8') as f:
+            bodies[os.path.basename(path)] = f.read()
+
+    results = {}
+    for name, body in bodies.items():
+        raw = body.encode('utf-8')
+        results[name] = {'raw_bytes': len(raw), 'codecs': measure(raw, args.repeat)}
+        print(f"\n📦 {name}: {len(raw) / 1024:.1f} KB")
+        print(f"   {'кодек':<8} {'KB':>8} {'сжатие':>7} {'время':>10} {'µs/KB':>7}")
+        for row in results[name]['codecs']:
+            marker = ' ←' if (row['encoding'], row['level']) in DEFAULT_LEVELS else ''
+            print(f"   {row['encoding'] + ' ' + str(row['level']):<8} {row['bytes'] / 1024:>8.1f} "
+                  f"{row['ratio']:>6}× {row['us'] / 1000:>8.2f}мс {row['us_per_kb_saved']:>7}{marker}")
+
+    if not response._load_brotli():
+        print('\n⚠️  brotli не установлен — только gzip (pip install Brotli)')
+    print('\n← уровни по умолчанию в response.py (GZIP_LEVEL, BROTLI_QUALITY)')
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"💾 Отчёт сохранён в: {args.json}")
+
+
+if __name__ == '__main__':
+    main()
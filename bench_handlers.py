@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк облачных функций в одном процессе по их tests.json
+Каждый кейс из backend/*/tests.json вызывается как handler(event, context) N раз после прогрева;
+DeepSeek подменяется встроенным моком (mock_llm_server.py), база — локальный Postgres из DATABASE_URL
+С --cassettes вместо мока внешние вызовы пишутся в кассеты или воспроизводятся из них (cassette.py)
+Запуск: python3 bench_handlers.py [--runs 50] [--warmup 5] [--functions story-ai,rpg-games]
+        [--output bench.json] [--baseline bench-baseline.json --threshold 0.2] [--save-baseline]
+        [--cassettes cassettes --cassette-mode replay --cassette-timing] [--keep-caches]
+"""
+
+import argparse
+import contextlib
+import glob
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from http.server import ThreadingHTTPServer
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qsl
+
+import mock_llm_server
+from cassette import Cassette
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+
+# Функции, которые ходят в сторонние API помимо DeepSeek (картинки, OpenRouter, air.fail) — офлайн их не померить
+DEFAULT_EXCLUDE = 'generate-image,openrouter,test-air-models'
+
+# Сравниваемые с эталоном метрики кейса
+BASELINE_METRICS = ('p50_ms', 'p95_ms')
+
+# Кеши ответов в модулях функций: кейс шлёт одно и то же событие, и без очистки со второго
+# вызова мерился бы поиск в словаре, а не генерация
+RESPONSE_CACHES = ('CACHE', 'SPECULATED')
+
+
+class BenchContext:
+    def __init__(self, function_name: str):
+        self.request_id = uuid.uuid4().hex
+        self.function_name = function_name
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    '''Перцентиль с линейной интерполяцией, q от 0 до 100'''
+    if not sorted_values:
+        return 0.0
+    pos = (len(sorted_values) - 1) * q / 100
+    low = int(pos)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (pos - low)
+
+
+def load_cases(function_dir: str) -> List[Dict[str, Any]]:
+    '''
+    Кейсы из tests.json в едином виде: name, event, expected_status.
+    Поддерживает оба формата репозитория: {"tests": [{method, path, body}]} и [{request, expected}]
+    '''
+    with open(os.path.join(function_dir, 'tests.json'), encoding='utf-8') as f:
+        data = json.load(f)
+
+    cases = []
+    if isinstance(data, list):
+        for test in data:
+            event = dict(test.get('request', {}))
+            event.setdefault('httpMethod', 'GET')
+            event.setdefault('headers', {})
+            event.setdefault('queryStringParameters', {})
+            event.setdefault('body', '')
+            cases.append({'name': test['name'], 'event': event, 'expected_status': test.get('expected', {}).get('statusCode')})
+        return cases
+
+    for test in data.get('tests', []):
+        url = urlsplit(test.get('path', '/'))
+        body = test.get('body')
+        if body is None:
+            body = ''
+        elif not isinstance(body, str):
+            body = json.dumps(body, ensure_ascii=False)
+        event = {
+            'httpMethod': test.get('method', 'GET'),
+            'path': url.path or '/',
+            'headers': dict(test.get('headers', {})),
+            'queryStringParameters': dict(parse_qsl(url.query)),
+            'body': body,
+            'isBase64Encoded': False
+        }
+        cases.append({'name': test['name'], 'event': event, 'expected_status': test.get('expectedStatus')})
+    return cases
+
+
+def measure_import(function_dir: str) -> Tuple[Optional[float], Optional[str]]:
+    '''Холодный импорт index.py в отдельном интерпретаторе — без модулей, загруженных другими функциями'''
+    code = (
+        'import sys, time\n'
+        f'sys.path.insert(0, {function_dir!r})\n'
+        'started = time.perf_counter()\n'
+        'import index\n'
+        'print((time.perf_counter() - started) * 1000)\n'
+    )
+    proc = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, cwd=function_dir, env=os.environ.copy())
+    if proc.returncode != 0:
+        return None, proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'import failed'
+    return float(proc.stdout.strip().splitlines()[-1]), None
+
+
+def load_function(function_dir: str):
+    '''
+    Импортирует index.py функции. Копии общих модулей (keyword_matcher, translation, ...) лежат
+    в каждой папке под одним именем — выгружаем чужие, чтобы функция получила свои.
+    Папка функции должна быть в sys.path, пока идут её вызовы: часть импортов ленивая
+    '''
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, '__file__', None) or ''
+        if path.startswith(BACKEND_DIR + os.sep) and not path.startswith(function_dir + os.sep):
+            del sys.modules[name]
+    name = 'bench_' + os.path.basename(function_dir).replace('-', '_')
+    spec = importlib.util.spec_from_file_location(name, os.path.join(function_dir, 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    # В sys.modules — чтобы clear_caches нашёл кеши и самого index.py
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module.handler
+
+
+def clear_caches(function_dir: str) -> None:
+    '''Очищает кеши ответов (RESPONSE_CACHES) во всех модулях функции'''
+    for module in list(sys.modules.values()):
+        path = getattr(module, '__file__', None) or ''
+        if not path.startswith(function_dir + os.sep):
+            continue
+        for attr in RESPONSE_CACHES:
+            cache = getattr(module, attr, None)
+            if isinstance(cache, dict):
+                cache.clear()
+
+
+def call(handler, event: Dict[str, Any], function_name: str) -> Tuple[float, Any]:
+    '''Один вызов: миллисекунды и statusCode (или имя исключения)'''
+    started = time.perf_counter()
+    try:
+        status = handler(dict(event), BenchContext(function_name)).get('statusCode')
+    except Exception as e:
+        status = type(e).__name__
+    return (time.perf_counter() - started) * 1000, status
+
+
+def measure_allocations(handler, event: Dict[str, Any], function_name: str, reset=None) -> Dict[str, Any]:
+    '''Отдельный вызов под tracemalloc: пик памяти и число выделенных блоков'''
+    if reset:
+        reset()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        call(handler, event, function_name)
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    return {
+        'alloc_peak_kb': round(peak / 1024, 1),
+        'alloc_blocks': sum(max(s.count_diff, 0) for s in stats),
+        'alloc_retained_kb': round(sum(s.size_diff for s in stats) / 1024, 1)
+    }
+
+
+def bench_case(handler, case: Dict[str, Any], function_name: str, runs: int, warmup: int, reset=None) -> Dict[str, Any]:
+    '''
+    reset() вызывается перед каждым вызовом (очистка кешей ответов), так что прогоны меряют
+    работу функции, а не попадание в кеш. Первый вызов — отдельно: в нём ещё холодные
+    соединения и ленивые импорты
+    '''
+    def timed_call() -> Tuple[float, Any]:
+        if reset:
+            reset()
+        return call(handler, case['event'], function_name)
+
+    first_ms, status = timed_call()
+    for _ in range(warmup):
+        timed_call()
+
+    timings = []
+    statuses: Dict[str, int] = {}
+    for _ in range(runs):
+        elapsed, status = timed_call()
+        timings.append(elapsed)
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    timings.sort()
+
+    result = {
+        'first_ms': round(first_ms, 3),
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'statuses': statuses,
+        'expected_status': case['expected_status'],
+        'status_ok': statuses.get(str(case['expected_status']), 0) == runs
+    }
+    result.update(measure_allocations(handler, case['event'], function_name, reset))
+    return result
+
+
+def start_mock() -> Tuple[ThreadingHTTPServer, str]:
+    '''Мок DeepSeek на свободном порту в фоновом потоке'''
+    args = argparse.Namespace(
+        seed=42, latency='fixed:0', tokens_per_second=0, error_rate=0, error_status='',
+        hang_rate=0, hang_seconds=0, responses=None
+    )
+    mock_llm_server.MockHandler.config = mock_llm_server.MockConfig(args)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), mock_llm_server.MockHandler)
+    server.daemon_threads = True
+    server.verbose = False
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def run(functions: List[str], runs: int, warmup: int, cassettes: Optional[str] = None,
+        cassette_mode: str = 'replay', cassette_timing: bool = False, keep_caches: bool = False) -> Dict[str, Any]:
+    server = None
+    if cassettes is None:
+        server, base_url = start_mock()
+        os.environ['DEEPSEEK_BASE_URL'] = base_url
+        os.environ['STORY_AI_URL'] = base_url + '/'
+        os.environ.setdefault('DEEPSEEK_API_KEY', 'mock-key')
+    elif cassette_mode == 'replay':
+        # Ключ в кассету не пишется, но функции без него не доходят до запроса
+        os.environ.setdefault('DEEPSEEK_API_KEY', 'cassette-key')
+
+    report: Dict[str, Any] = {
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': sys.version.split()[0],
+        'runs': runs,
+        'warmup': warmup,
+        'database': bool(os.environ.get('DATABASE_URL')),
+        'upstream': f'cassettes:{cassette_mode}' if cassettes else 'mock',
+        'response_caches': 'kept' if keep_caches else 'cleared',
+        'functions': {}
+    }
+    try:
+        # story-ai первым: его handler монтируется в мок раньше, чем до него дойдут quick-test и run-creativity-tests
+        for function_name in sorted(functions, key=lambda f: f != 'story-ai'):
+            function_dir = os.path.join(BACKEND_DIR, function_name)
+            import_ms, import_error = measure_import(function_dir)
+            entry: Dict[str, Any] = {'import_ms': round(import_ms, 3) if import_ms is not None else None, 'cases': {}}
+            report['functions'][function_name] = entry
+            if import_error:
+                entry['error'] = import_error
+                print(f"⚠️  {function_name}: не импортируется — {import_error}", file=sys.stderr)
+                continue
+
+            sys.path.insert(0, function_dir)
+            if cassettes:
+                cassette = Cassette(os.path.join(cassettes, f'{function_name}.json'), cassette_mode, cassette_timing)
+            else:
+                cassette = contextlib.nullcontext()
+            try:
+                with cassette:
+                    handler = load_function(function_dir)
+                    if server and function_name == 'story-ai':
+                        # quick-test и run-creativity-tests зовут story-ai по HTTP — отвечаем им из мока
+                        mock_llm_server.MockHandler.function_handler = staticmethod(handler)
+                    reset = None if keep_caches else (lambda d=function_dir: clear_caches(d))
+                    for case in load_cases(function_dir):
+                        entry['cases'][case['name']] = bench_case(handler, case, function_name, runs, warmup, reset)
+                        print(f"   {function_name} / {case['name']}: p50 {entry['cases'][case['name']]['p50_ms']} мс", file=sys.stderr)
+            finally:
+                sys.path.remove(function_dir)
+            if cassettes:
+                entry['cassette'] = dict(cassette.stats)
+    finally:
+        if server:
+            server.shutdown()
+            server.server_close()
+    if server:
+        report['mock_llm'] = mock_llm_server.MockHandler.config.describe()['stats']
+    return report
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], threshold: float, min_delta_ms: float) -> List[str]:
+    '''Регрессии относительно эталона: рост больше threshold и больше min_delta_ms (шум таймера)'''
+    regressions = []
+    for function_name, entry in report['functions'].items():
+        base_entry = baseline.get('functions', {}).get(function_name)
+        if not base_entry:
+            continue
+        pairs = [('import_ms', entry.get('import_ms'), base_entry.get('import_ms'))]
+        for case_name, case in entry['cases'].items():
+            base_case = base_entry.get('cases', {}).get(case_name)
+            if base_case:
+                pairs.extend((f'{case_name} {m}', case[m], base_case.get(m)) for m in BASELINE_METRICS)
+        for label, value, base in pairs:
+            if value is None or not base:
+                continue
+            if value - base > min_delta_ms and value > base * (1 + threshold):
+                regressions.append(f'{function_name} / {label}: {base} → {value} мс (+{(value / base - 1) * 100:.0f}%)')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк облачных функций по tests.json')
+    parser.add_argument('--functions', help='Только эти функции, через запятую')
+    parser.add_argument('--exclude', default=DEFAULT_EXCLUDE, help='Пропустить функции, через запятую')
+    parser.add_argument('--runs', type=int, default=50, help='Измеряемых вызовов на кейс')
+    parser.add_argument('--warmup', type=int, default=5, help='Прогревочных вызовов на кейс')
+    parser.add_argument('--output', default='bench-handlers.json', help='Куда сохранить отчёт')
+    parser.add_argument('--baseline', help='Эталонный отчёт для сравнения')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Допустимый рост времени (0.2 = 20%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=0.5, help='Меньшую разницу считаем шумом')
+    parser.add_argument('--save-baseline', action='store_true', help='Записать отчёт в --baseline')
+    parser.add_argument('--cassettes', help='Папка кассет (по файлу на функцию) вместо мока DeepSeek')
+    parser.add_argument('--cassette-mode', choices=['record', 'replay', 'auto'], default='replay')
+    parser.add_argument('--cassette-timing', action='store_true', help='Воспроизводить исходную задержку ответов')
+    parser.add_argument('--keep-caches', action='store_true', help='Не очищать кеши ответов между вызовами (мерить попадания в кеш)')
+    args = parser.parse_args()
+    # Строка лога timing.py на каждый вызов утопит отчёт
+    os.environ.setdefault('TIMING_LOG', '0')
+
+    available = sorted(os.path.basename(os.path.dirname(p)) for p in glob.glob(os.path.join(BACKEND_DIR, '*', 'tests.json')))
+    excluded = set(filter(None, args.exclude.split(',')))
+    functions = [f for f in args.functions.split(',') if f in available] if args.functions else [f for f in available if f not in excluded]
+
+    report = run(functions, args.runs, args.warmup, args.cassettes, args.cassette_mode, args.cassette_timing, args.keep_caches)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 Эталон сохранён в: {args.baseline}", file=sys.stderr)
+    elif args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold, args.min_delta_ms)
+        for line in regressions:
+            print(f"❌ {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"✅ Регрессий больше {args.threshold * 100:.0f}% нет", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк эвристик креативности на сценариях из run_creativity_tests.py:
+поиск подстрок по старому лексикону основ против сравнения по основам (LemmaMatcher)
+Запуск: python3 bench_keyword_matching.py [--sizes 1000,5000,20000] [--repeat 200] [--json]
+"""
+
+import argparse
+import json
+import random
+import time
+from typing import Dict, Any, List
+
+import keyword_matcher
+from keyword_matcher import KeywordMatcher, LemmaMatcher, WORD_RE
+from run_creativity_tests import STORY_LEXICONS, NAME_LEXICONS, TESTS, analyze_response
+
+# Лексикон до перехода на основы: обрезанные вручную корни, поиск подстрокой
+SUBSTRING_LEXICONS = {
+    'mdzs_terms': ['культиватор', 'культивация', 'клан', 'гуцин', 'флейта', 'демонический'],
+    'lwz_traits': ['правил', 'запрет', 'строг', 'холод', 'безмолв'],
+    'wwx_traits': ['ирон', 'шутк', 'дерз', 'усмехн', 'весел'],
+    'hunt_words': ['охот', 'нечист', 'призрак', 'дух', 'монстр'],
+    'canon_details': ['импал', 'рок', 'виски', 'пирог'],
+    'scifi_words': ['станци', 'космос', 'эридан', 'эхо', 'орбит'],
+    'context_words': ['5 лет', 'разрыв', 'концерт', 'джаз', 'пианист', 'художник'],
+    'inner_thoughts': ['подума', 'вспомн', 'почувствова', 'понял', 'осозна', 'заметил'],
+    'body_language': ['посмотре', 'отверну', 'наклон', 'сжал', 'прикоснул', 'вздрогн', 'усмехн'],
+    'memory_words': ['помн', 'раньше', 'тогда', 'прошл', 'всегда'],
+    'sensory_words': ['запах', 'звук', 'шёпот', 'шорох', 'тишин', 'холод', 'тепл', 'свет', 'тень', 'ветер', 'аромат', 'эхо'],
+    'emotional_words': ['напряж', 'тревог', 'страх', 'радост', 'грус', 'злость', 'нежност', 'боль', 'тоск'],
+    'cliche_phrases': ['сердце билось', 'глаза загорелись', 'душа пела', 'бабочки в животе', 'сердце сжалось'],
+    'complex_emotions': ['противоречи', 'одновременно', 'с одной стороны', 'но в то же время', 'вопреки', 'несмотря'],
+    'silence_words': ['молча', 'тишин', 'пауз', 'не сказ', 'безмолв', 'замолч'],
+    'nsfw_indicators': ['поцел', 'прикосн', 'близ', 'объят', 'ласк', 'страст', 'желан'],
+    'vulgar_words': ['трах', 'еб', 'сиськ', 'хуй', 'пизд', 'член'],
+    'spn_humor': ['сарказм', 'шутк', 'усмехн', 'едк'],
+    'scifi_future': ['2187', 'будущ', 'технолог', 'автоматик'],
+    'heaven': ['ангел', 'небес']
+}
+
+SUBSTRING_MATCHER = KeywordMatcher(SUBSTRING_LEXICONS)
+LEMMA_MATCHER = LemmaMatcher(STORY_LEXICONS)
+
+
+def scenario_text(scenario: Dict[str, Any]) -> str:
+    '''Все тексты сценария: описания персонажей, сеттинг, идеи'''
+    settings = scenario['game_settings']
+    parts = [settings.get('setting', '')]
+    for character in settings.get('initialCharacters', []):
+        parts.extend(str(v) for v in character.values())
+    return ' '.join(parts)
+
+
+def make_story(scenario: Dict[str, Any], size: int, seed: int = 42) -> str:
+    '''История нужной длины из слов сценария, изредка с формами слов из лексиконов'''
+    rng = random.Random(seed)
+    words = WORD_RE.findall(scenario_text(scenario))
+    forms = []
+    for entries in STORY_LEXICONS.values():
+        for entry in entries:
+            forms.extend([entry] if isinstance(entry, str) else entry)
+    names = [w for words_ in NAME_LEXICONS.values() for w in words_]
+    parts: List[str] = []
+    length = 0
+    while length < size:
+        roll = rng.random()
+        if roll < 0.05:
+            word = rng.choice(forms)
+        elif roll < 0.07:
+            word = rng.choice(names)
+        else:
+            word = rng.choice(words)
+        if rng.random() < 0.1:
+            word += '.'
+        parts.append(word)
+        length += len(word) + 1
+    return ' '.join(parts)[:size]
+
+
+def time_call(fn, arg, repeat: int) -> float:
+    '''Среднее время одного вызова в микросекундах (лучшее из трёх серий)'''
+    best = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn(arg)
+        best = min(best, (time.perf_counter() - start) / repeat)
+    return best * 1e6
+
+
+def disagreements(text: str) -> Dict[str, Dict[str, List[str]]]:
+    '''Категории, где подстрока и основа расходятся на тексте самого сценария'''
+    old = SUBSTRING_MATCHER.scan(text)
+    new = LEMMA_MATCHER.scan(text)
+    result = {}
+    for category in STORY_LEXICONS:
+        if old.any(category) != new.any(category):
+            result[category] = {'substring': sorted(old.words(category)), 'lemma': sorted(new.words(category))}
+    return result
+
+
+def run(sizes: List[int], repeat: int) -> List[Dict[str, Any]]:
+    results = []
+    for name, scenario in TESTS.items():
+        for size in sizes:
+            story = make_story(scenario, size)
+            keyword_matcher.stem.cache_clear()
+            cold_us = time_call(LEMMA_MATCHER.scan, story, 1)
+            row = {
+                'scenario': name,
+                'size': size,
+                'substring_us': round(time_call(SUBSTRING_MATCHER.scan, story, repeat), 1),
+                'lemma_cold_us': round(cold_us, 1),
+                'lemma_us': round(time_call(LEMMA_MATCHER.scan, story, repeat), 1),
+                'analyze_response_us': round(time_call(lambda s: analyze_response(name, s), story, repeat), 1)
+            }
+            row['speedup'] = round(row['substring_us'] / row['lemma_us'], 2)
+            results.append(row)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк поиска ключевых слов в историях')
+    parser.add_argument('--sizes', default='1000,5000,20000', help='Длины историй в символах через запятую')
+    parser.add_argument('--repeat', type=int, default=200, help='Вызовов в одной серии')
+    parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    results = run(sizes, args.repeat)
+    diffs = {name: disagreements(scenario_text(scenario)) for name, scenario in TESTS.items()}
+    cache = keyword_matcher.stem.cache_info()
+
+    if args.json:
+        print(json.dumps({
+            'results': results,
+            'disagreements': diffs,
+            'stem_cache': {'hits': cache.hits, 'misses': cache.misses, 'size': cache.currsize}
+        }, ensure_ascii=False, indent=2))
+        return
+
+    print(f"{'сценарий':<42} {'символов':>8} {'подстрока':>10} {'основы':>10} {'холодный':>10} {'analyze':>10} {'x':>6}")
+    for row in results:
+        print(
+            f"{row['scenario'][:42]:<42} {row['size']:>8} {row['substring_us']:>9}µ {row['lemma_us']:>9}µ "
+            f"{row['lemma_cold_us']:>9}µ {row['analyze_response_us']:>9}µ {row['speedup']:>6}"
+        )
+    print(f"\n🗂  Кеш основ: {cache.hits} попаданий, {cache.misses} промахов, {cache.currsize} слов")
+    for name, diff in diffs.items():
+        for category, words in diff.items():
+            print(f"≠ {name[:40]} / {category}: подстрока {words['substring']} → основы {words['lemma']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк сериализации списков для ответов функций: прежний json.dumps([dict(row) ...], default=str)
+против response.dumps (orjson и запасной путь на стандартном json) на строках в формате RealDictCursor
+Запуск: python3 bench_response.py [--rows 1000] [--repeat 50] [--json]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import time
+from typing import Dict, Any, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend', 'story-ai'))
+import response
+
+try:
+    from psycopg2.extras import RealDictRow
+except ImportError:
+    class RealDictRow(dict):
+        '''Как у psycopg2: подкласс dict, поэтому orjson сериализует его без default'''
+
+
+def character_rows(count: int, seed: int = 42) -> List[RealDictRow]:
+    '''Строки как из SELECT в game-entities (characters): текст, кириллица и timestamptz'''
+    rng = random.Random(seed)
+    started = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    rows = []
+    for i in range(count):
+        rows.append(RealDictRow(
+            id=i + 1,
+            name=f'Персонаж {i}',
+            role=rng.choice(['воин', 'маг', 'вор', 'бард']),
+            avatar=f'https://cdn.poehali.dev/avatars/{i}.png',
+            stats=f'СИЛ {rng.randint(1, 20)}, ЛОВ {rng.randint(1, 20)}, ИНТ {rng.randint(1, 20)}',
+            personality='Молчаливый, упрямый, верный слову ' * rng.randint(1, 3),
+            backstory='Вырос на окраине империи, где туман не рассеивается до полудня. ' * rng.randint(2, 6),
+            character_type=rng.choice(['player', 'npc']),
+            created_at=started + datetime.timedelta(minutes=rng.randint(0, 500000), microseconds=rng.randint(0, 999999))
+        ))
+    return rows
+
+
+def legacy_dumps(rows: List[RealDictRow]) -> str:
+    '''Как было в game-entities, rpg-games и save-character до общего модуля'''
+    return json.dumps([dict(row) for row in rows], default=str)
+
+
+def orjson_dumps(rows: List[RealDictRow]) -> str:
+    response._orjson = None
+    return response.dumps(rows)
+
+
+def stdlib_dumps(rows: List[RealDictRow]) -> str:
+    response._orjson = False
+    return response.dumps(rows)
+
+
+def time_call(fn, arg, repeat: int) -> float:
+    '''Среднее время одного вызова в микросекундах (лучшее из трёх серий)'''
+    best = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn(arg)
+        best = min(best, (time.perf_counter() - start) / repeat)
+    return best * 1e6
+
+
+def run(count: int, repeat: int) -> Dict[str, Any]:
+    rows = character_rows(count)
+    results = {}
+    for name, fn in (('legacy', legacy_dumps), ('orjson', orjson_dumps), ('stdlib', stdlib_dumps)):
+        body = fn(rows)
+        results[name] = {
+            'us': round(time_call(fn, rows, repeat), 1),
+            'bytes': len(body.encode('utf-8')),
+            'rows_back': len(json.loads(body))
+        }
+    response._orjson = None
+    results['orjson_available'] = bool(response._load_orjson())
+    results['speedup_orjson'] = round(results['legacy']['us'] / results['orjson']['us'], 2)
+    results['speedup_stdlib'] = round(results['legacy']['us'] / results['stdlib']['us'], 2)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк сериализации ответов со списками строк из базы')
+    parser.add_argument('--rows', type=int, default=1000, help='Строк в списке')
+    parser.add_argument('--repeat', type=int, default=50, help='Вызовов в одной серии')
+    parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+    args = parser.parse_args()
+
+    results = run(args.rows, args.repeat)
+    if args.json:
+        print(json.dumps({'rows': args.rows, **results}, ensure_ascii=False, indent=2))
+        return
+
+    print(f"{'сериализатор':<14} {'время':>12} {'байт':>10}")
+    for name in ('legacy', 'orjson', 'stdlib'):
+        row = results[name]
+        print(f"{name:<14} {row['us']:>11}µ {row['bytes']:>10}")
+    if not results['orjson_available']:
+        print('\n⚠️  orjson не установлен — строка orjson на самом деле тоже стандартный json')
+    print(f"\n⚡ {args.rows} строк: orjson быстрее прежнего в {results['speedup_orjson']}×, запасной путь — в {results['speedup_stdlib']}×")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Кассеты внешних вызовов: запись и воспроизведение ответов DeepSeek и Pollinations
+Перехватывает исходящие HTTP-запросы на уровне транспорта (requests и httpx/openai),
+поэтому story-ai, ai-story, generate-fanfic, translate-prompt и generate-image не меняются
+    with Cassette('cassettes/story-ai.json', mode='record'):
+        handler(event, context)
+Режимы: record — ходить в сеть и сохранять, replay — отвечать только из кассеты,
+auto — из кассеты, а промахи записывать. timing=True воспроизводит исходную задержку
+Просмотр: python3 cassette.py cassettes/story-ai.json
+"""
+
+import base64
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from typing import Dict, Any, List, Optional
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+MODES = ('record', 'replay', 'auto')
+
+# Заголовки ответа, которые стоит хранить: остальное (даты, трассировки) только шумит в диффах.
+# Тело пишется уже распакованным, поэтому content-encoding не храним — иначе httpx распакует его повторно
+KEPT_HEADERS = ('content-type', 'retry-after')
+
+
+class CassetteMiss(RuntimeError):
+    '''В режиме replay запроса нет в кассете'''
+
+
+def normalize_url(url: str) -> str:
+    '''Хост в нижнем регистре, параметры запроса по алфавиту'''
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return f"{parts.scheme}://{parts.netloc.lower()}{parts.path}" + (f"?{query}" if query else '')
+
+
+def normalize_body(body: Optional[bytes]) -> str:
+    '''JSON — с отсортированными ключами, остальное как есть; заголовки (ключи API) в ключ не входят'''
+    if not body:
+        return ''
+    try:
+        return json.dumps(json.loads(body), sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    except ValueError:
+        return body.decode('utf-8', errors='replace')
+
+
+def request_key(method: str, url: str, body: Optional[bytes]) -> str:
+    raw = f"{method.upper()} {normalize_url(url)}\n{normalize_body(body)}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def encode_body(content: bytes) -> Dict[str, str]:
+    try:
+        return {'body': content.decode('utf-8'), 'encoding': 'utf-8'}
+    except UnicodeDecodeError:
+        return {'body': base64.b64encode(content).decode('ascii'), 'encoding': 'base64'}
+
+
+def decode_body(item: Dict[str, str]) -> bytes:
+    if item.get('encoding') == 'base64':
+        return base64.b64decode(item['body'])
+    return item['body'].encode('utf-8')
+
+
+class Cassette:
+    '''
+    Файл JSON со списком взаимодействий «запрос → ответ».
+    Один и тот же запрос может быть записан несколько раз — при воспроизведении ответы идут по кругу
+    '''
+
+    def __init__(self, path: str, mode: str = 'replay', timing: bool = False):
+        if mode not in MODES:
+            raise ValueError(f'Неизвестный режим кассеты: {mode}')
+        self.path = path
+        self.mode = mode
+        self.timing = timing
+        self.lock = threading.Lock()
+        self.interactions: List[Dict[str, Any]] = []
+        self.cursors: Dict[str, int] = {}
+        self.stats = {'hits': 0, 'misses': 0, 'recorded': 0}
+        self._patches: List[tuple] = []
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.interactions = json.load(f).get('interactions', [])
+
+    # --- хранение ---
+
+    def find(self, key: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            matches = [i for i in self.interactions if i['key'] == key]
+            if not matches:
+                self.stats['misses'] += 1
+                return None
+            cursor = self.cursors.get(key, 0)
+            self.cursors[key] = cursor + 1
+            self.stats['hits'] += 1
+            return matches[cursor % len(matches)]
+
+    def record(self, method: str, url: str, body: Optional[bytes], status: int,
+               headers: Dict[str, str], content: bytes, elapsed: float):
+        interaction = {
+            'key': request_key(method, url, body),
+            'request': {'method': method.upper(), 'url': normalize_url(url), 'body': normalize_body(body)},
+            'response': {
+                'status': status,
+                'headers': {k.lower(): v for k, v in headers.items() if k.lower() in KEPT_HEADERS},
+                **encode_body(content)
+            },
+            'elapsed': round(elapsed, 4)
+        }
+        with self.lock:
+            self.interactions.append(interaction)
+            self.stats['recorded'] += 1
+
+    def save(self):
+        if self.mode == 'replay' or not self.stats['recorded']:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'interactions': self.interactions}, f, ensure_ascii=False, indent=2)
+
+    def lookup(self, method: str, url: str, body: Optional[bytes]) -> Optional[Dict[str, Any]]:
+        '''Ответ из кассеты или None, если нужно идти в сеть; в replay промах — ошибка'''
+        if self.mode == 'record':
+            return None
+        interaction = self.find(request_key(method, url, body))
+        if interaction is None and self.mode == 'replay':
+            raise CassetteMiss(f'Нет записи для {method.upper()} {normalize_url(url)} в {self.path}')
+        if interaction is not None and self.timing:
+            time.sleep(interaction['elapsed'])
+        return interaction
+
+    # --- перехват транспорта ---
+
+    def _patch(self, owner, name: str, replacement):
+        self._patches.append((owner, name, getattr(owner, name)))
+        setattr(owner, name, replacement)
+
+    def _patch_requests(self):
+        try:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from requests.structures import CaseInsensitiveDict
+        except ImportError:
+            return
+        cassette = self
+        original_send = HTTPAdapter.send
+
+        def send(adapter, request, **kwargs):
+            body = request.body.encode('utf-8') if isinstance(request.body, str) else request.body
+            interaction = cassette.lookup(request.method, request.url, body)
+            if interaction is None:
+                started = time.perf_counter()
+                response = original_send(adapter, request, **kwargs)
+                content = response.content
+                cassette.record(request.method, request.url, body, response.status_code,
+                                dict(response.headers), content, time.perf_counter() - started)
+                return response
+            stored = interaction['response']
+            response = requests.Response()
+            response.status_code = stored['status']
+            response.headers = CaseInsensitiveDict(stored['headers'])
+            response._content = decode_body(stored)
+            response.encoding = 'utf-8' if stored.get('encoding') == 'utf-8' else None
+            response.url = request.url
+            response.request = request
+            response.reason = 'OK' if stored['status'] < 400 else 'Error'
+            return response
+
+        self._patch(HTTPAdapter, 'send', send)
+
+    def _patch_httpx(self):
+        '''Клиент openai (ai-story) ходит через httpx; стрим SSE сохраняется целиком'''
+        try:
+            import httpx
+        except ImportError:
+            return
+        cassette = self
+        original_send = httpx.Client.send
+
+        def send(client, request, **kwargs):
+            body = request.read()
+            interaction = cassette.lookup(request.method, str(request.url), body)
+            if interaction is None:
+                started = time.perf_counter()
+                response = original_send(client, request, **kwargs)
+                content = response.read()
+                cassette.record(request.method, str(request.url), body, response.status_code,
+                                dict(response.headers), content, time.perf_counter() - started)
+                return response
+            stored = interaction['response']
+            return httpx.Response(stored['status'], headers=stored['headers'], content=decode_body(stored), request=request)
+
+        self._patch(httpx.Client, 'send', send)
+
+    def __enter__(self):
+        self._patch_requests()
+        self._patch_httpx()
+        return self
+
+    def __exit__(self, *exc):
+        for owner, name, original in reversed(self._patches):
+            setattr(owner, name, original)
+        self._patches.clear()
+        self.save()
+        return False
+
+
+def main():
+    if len(sys.argv) < 2:
+        print('Запуск: python3 cassette.py cassettes/<function>.json [...]')
+        sys.exit(1)
+    for path in sys.argv[1:]:
+        with open(path, encoding='utf-8') as f:
+            interactions = json.load(f).get('interactions', [])
+        total = sum(i['elapsed'] for i in interactions)
+        print(f"📼 {path}: {len(interactions)} записей, {total:.1f} с исходного ожидания")
+        for i in interactions:
+            size = len(decode_body(i['response']))
+            print(f"   {i['key'][:10]} {i['request']['method']} {i['request']['url'][:70]} → {i['response']['status']}, {size} байт, {i['elapsed']} с")
+
+
+if __name__ == '__main__':
+    main()
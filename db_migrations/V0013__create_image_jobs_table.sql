@@ -0,0 +1,18 @@
+-- Очередь асинхронной генерации картинок (generate-image, режим async)
+CREATE TABLE IF NOT EXISTS image_jobs (
+  id SERIAL PRIMARY KEY,
+  image_key TEXT NOT NULL,
+  prompt TEXT NOT NULL,
+  params JSONB NOT NULL DEFAULT '{}'::jsonb,
+  status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'running', 'done', 'failed')),
+  attempts INTEGER NOT NULL DEFAULT 0,
+  result_url TEXT,
+  error TEXT,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  started_at TIMESTAMP,
+  finished_at TIMESTAMP
+);
+
+-- Воркеры выбирают pending-задачи по времени создания
+CREATE INDEX IF NOT EXISTS idx_image_jobs_pending ON image_jobs(created_at) WHERE status IN ('pending', 'running');
+CREATE INDEX IF NOT EXISTS idx_image_jobs_image_key ON image_jobs(image_key);
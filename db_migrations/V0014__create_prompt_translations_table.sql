@@ -0,0 +1,7 @@
+-- Кеш переводов промптов для генерации картинок (translate-prompt)
+CREATE TABLE IF NOT EXISTS prompt_translations (
+  source_hash TEXT PRIMARY KEY,
+  source_text TEXT NOT NULL,
+  translated TEXT NOT NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
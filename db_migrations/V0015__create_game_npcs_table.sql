@@ -0,0 +1,16 @@
+-- Реестр NPC по играм (ai-story): один персонаж — одна строка, короткие имена хранятся в aliases
+CREATE TABLE IF NOT EXISTS game_npcs (
+  id SERIAL PRIMARY KEY,
+  game_id INTEGER NOT NULL,
+  name TEXT NOT NULL,
+  normalized_name TEXT NOT NULL,
+  aliases JSONB NOT NULL DEFAULT '[]'::jsonb,
+  role TEXT,
+  description TEXT,
+  first_seen_turn INTEGER NOT NULL,
+  last_seen_turn INTEGER NOT NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_game_npcs_game_name ON game_npcs(game_id, normalized_name);
@@ -0,0 +1,18 @@
+-- Метрики функций (metrics.py): каждый экземпляр раз в минуту дописывает дельты счётчиков и гистограмм
+-- и последние значения gauge; читает функция metrics
+CREATE TABLE IF NOT EXISTS function_metrics (
+  id BIGSERIAL PRIMARY KEY,
+  recorded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  function TEXT NOT NULL,
+  instance TEXT NOT NULL,
+  name TEXT NOT NULL,
+  kind TEXT NOT NULL CHECK (kind IN ('counter', 'gauge', 'histogram')),
+  labels JSONB NOT NULL DEFAULT '{}'::jsonb,
+  value DOUBLE PRECISION NOT NULL,
+  count BIGINT,
+  buckets INTEGER[],
+  bounds DOUBLE PRECISION[]
+);
+
+-- Перцентили и частота запросов считаются по имени метрики за окно времени
+CREATE INDEX IF NOT EXISTS idx_function_metrics_name_time ON function_metrics(name, recorded_at);
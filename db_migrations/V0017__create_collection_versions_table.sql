@@ -0,0 +1,9 @@
+-- Версии коллекций для условных GET (conditional.py): запись поднимает version в той же транзакции,
+-- чтение сравнивает её с ETag клиента и отвечает 304 без запроса списка. user_id = 0 — общий счётчик коллекции
+CREATE TABLE IF NOT EXISTS collection_versions (
+  user_id INTEGER NOT NULL,
+  collection TEXT NOT NULL,
+  version BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (user_id, collection)
+);
@@ -0,0 +1,15 @@
+-- Серверные игровые сессии (game_sessions.py): история, память и персонажи игры, чтобы клиент
+-- не пересылал их на каждом ходу. engine — функция (story-ai, ai-story): у них разный формат истории
+CREATE TABLE IF NOT EXISTS game_sessions (
+  engine TEXT NOT NULL,
+  game_id TEXT NOT NULL,
+  owner TEXT,
+  settings JSONB NOT NULL DEFAULT '{}'::jsonb,
+  history JSONB NOT NULL DEFAULT '[]'::jsonb,
+  memory JSONB NOT NULL DEFAULT '{}'::jsonb,
+  characters JSONB NOT NULL DEFAULT '[]'::jsonb,
+  version INTEGER NOT NULL DEFAULT 1,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (engine, game_id)
+);
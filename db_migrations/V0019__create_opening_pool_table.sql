@@ -0,0 +1,16 @@
+-- Готовые первые сцены для популярных канонических вселенных (ai-story, opening_pool.py).
+-- Каждая сцена достаётся одной игре: take удаляет строку, refill догенерирует недостающие
+CREATE TABLE IF NOT EXISTS opening_pool (
+  id SERIAL PRIMARY KEY,
+  universe_id INTEGER NOT NULL REFERENCES universes(id) ON DELETE CASCADE,
+  genre TEXT NOT NULL DEFAULT '',
+  narrative_mode TEXT NOT NULL,
+  role TEXT NOT NULL,
+  name TEXT NOT NULL,
+  setting TEXT NOT NULL,
+  text TEXT NOT NULL,
+  characters JSONB NOT NULL DEFAULT '[]'::jsonb,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_opening_pool_combo ON opening_pool (universe_id, narrative_mode, role, created_at);
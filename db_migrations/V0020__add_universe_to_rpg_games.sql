@@ -0,0 +1,2 @@
+-- Вселенная, по пресету которой создана игра: по ней ai-story берёт первую сцену из opening_pool
+ALTER TABLE rpg_games ADD COLUMN IF NOT EXISTS universe_id INTEGER REFERENCES universes(id) ON DELETE SET NULL;
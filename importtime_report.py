@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Отчёт о холодном импорте функций по python -X importtime
+Каждая backend/*/index.py импортируется в свежем интерпретаторе; в отчёте — полное время импорта
+и самые тяжёлые прямые зависимости. Код выхода 1, если какая-то функция не уложилась в бюджет
+или не импортируется вовсе — так проверку можно ставить в CI
+Запуск: python3 importtime_report.py [--budget-ms 150] [--budget ai-story=300] [--functions ...] [--json report.json]
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, Any, List
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+
+# import time:       self [us] |  cumulative | imported package
+IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)')
+
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    '''Строки -X importtime по порядку вывода: дети идут раньше родителя, вложенность — отступом по 2 пробела'''
+    entries = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            entries.append({
+                'module': match.group(4),
+                'self_us': int(match.group(1)),
+                'cumulative_us': int(match.group(2)),
+                'level': len(match.group(3)) // 2
+            })
+    return entries
+
+
+def index_subtree(entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    '''Всё, что импортировал index (без модулей, загруженных самим интерпретатором при старте)'''
+    position = next((i for i, e in enumerate(entries) if e['module'] == 'index' and e['level'] == 0), None)
+    if position is None:
+        return []
+    subtree = []
+    for entry in reversed(entries[:position]):
+        if entry['level'] == 0:
+            break
+        subtree.append(entry)
+    return subtree
+
+
+def heaviest_children(subtree: List[Dict[str, Any]], top: int) -> List[Dict[str, Any]]:
+    '''Прямые зависимости index по суммарному времени'''
+    children = sorted((e for e in subtree if e['level'] == 1), key=lambda e: e['cumulative_us'], reverse=True)
+    return [{'module': e['module'], 'ms': round(e['cumulative_us'] / 1000, 2)} for e in children[:top]]
+
+
+def measure(function_dir: str, top: int) -> Dict[str, Any]:
+    code = f'import sys; sys.path.insert(0, {function_dir!r}); import index'
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True, text=True, cwd=function_dir, env=os.environ.copy()
+    )
+    entries = parse_importtime(proc.stderr)
+    if proc.returncode != 0:
+        errors = [l for l in proc.stderr.splitlines() if not l.startswith('import time:')]
+        return {'error': errors[-1] if errors else 'import failed'}
+    index = next((e for e in entries if e['module'] == 'index' and e['level'] == 0), None)
+    if index is None:
+        return {'error': 'index не найден в выводе -X importtime'}
+    subtree = index_subtree(entries)
+    return {
+        'import_ms': round(index['cumulative_us'] / 1000, 2),
+        'modules': len(subtree) + 1,
+        'heaviest': heaviest_children(subtree, top)
+    }
+
+
+def parse_budgets(items: List[str]) -> Dict[str, float]:
+    budgets = {}
+    for item in items:
+        name, _, value = item.partition('=')
+        budgets[name] = float(value)
+    return budgets
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Время холодного импорта функций (-X importtime)')
+    parser.add_argument('--functions', help='Только эти функции, через запятую')
+    parser.add_argument('--budget-ms', type=float, default=150, help='Бюджет импорта по умолчанию, мс')
+    parser.add_argument('--budget', action='append', default=[], help='Свой бюджет функции: имя=мс (можно несколько)')
+    parser.add_argument('--repeat', type=int, default=3, help='Замеров на функцию, берётся лучший')
+    parser.add_argument('--top', type=int, default=5, help='Сколько тяжёлых зависимостей показывать')
+    parser.add_argument('--json', help='Сохранить отчёт в JSON')
+    args = parser.parse_args()
+
+    available = sorted(os.path.basename(os.path.dirname(p)) for p in glob.glob(os.path.join(BACKEND_DIR, '*', 'index.py')))
+    functions = [f for f in args.functions.split(',') if f in available] if args.functions else available
+    budgets = parse_budgets(args.budget)
+
+    report: Dict[str, Any] = {}
+    failures = []
+    for name in functions:
+        function_dir = os.path.join(BACKEND_DIR, name)
+        # Лучший из нескольких замеров: первый запуск платит ещё и за прогрев файлового кеша
+        runs = [measure(function_dir, args.top) for _ in range(args.repeat)]
+        ok = [r for r in runs if r.get('import_ms') is not None]
+        result: Dict[str, Any] = min(ok, key=lambda r: r['import_ms']) if ok else runs[0]
+        result['budget_ms'] = budgets.get(name, args.budget_ms)
+        report[name] = result
+
+        if 'error' in result:
+            failures.append(name)
+            print(f"❌ {name:<24} не импортируется: {result['error']}")
+            continue
+        over = result['import_ms'] > result['budget_ms']
+        if over:
+            failures.append(name)
+        heaviest = ', '.join(f"{h['module']} {h['ms']}" for h in result['heaviest'])
+        print(f"{'❌' if over else '✅'} {name:<24} {result['import_ms']:>8.1f} мс / {result['budget_ms']:.0f}  {heaviest}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Отчёт сохранён в: {args.json}")
+
+    if failures:
+        print(f"\n❌ Вне бюджета или с ошибкой импорта: {', '.join(failures)}")
+        sys.exit(1)
+    print(f"\n✅ Все {len(functions)} функций импортируются в пределах бюджета")
+
+
+if __name__ == '__main__':
+    main()
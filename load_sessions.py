@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест: виртуальные игроки проходят многоходовые сессии
+Сценарии — TESTS из run_creativity_tests.py и TEST_SCENARIO из quick-test. Каждый игрок создаёт
+историю (save-story) и игру (rpg-games POST), затем на каждом ходу шлёт растущую history в story-ai
+(с --server-sessions — только game_id и действие, история хранится на сервере; с --speculate игрок
+с вероятностью --pick-suggestion выбирает вариант из «🎯 Варианты», заранее сгенерированный в фоне),
+сохраняет игру (rpg-games PUT) и дописывает прогресс (update-story-progress)
+По умолчанию функции работают в этом же процессе, DeepSeek — встроенный мок; --base-url — против
+поднятых функций по HTTP ({base-url}/{функция})
+Запуск: python3 load_sessions.py [--players 200] [--ramp 30] [--turns 8] [--think 1.0] [--server-sessions] [--speculate --pick-suggestion 0.6] [--json load.json]
+Нужны DATABASE_URL и JWT_SECRET (токены игроков подписываются им же)
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+from bench_handlers import BACKEND_DIR, BenchContext, load_function, percentile, start_mock
+from run_creativity_tests import TESTS
+
+SESSION_FUNCTIONS = ['save-story', 'rpg-games', 'story-ai', 'update-story-progress']
+
+ACTIONS = [
+    'Осматриваюсь по сторонам',
+    'Подхожу ближе и молча жду',
+    'Спрашиваю, что здесь произошло',
+    'Беру его за руку',
+    'Отступаю в тень и наблюдаю',
+    'Говорю правду, хоть это и больно',
+    'Усмехаюсь и перевожу всё в шутку',
+    'Ухожу, не оглядываясь',
+    'Достаю оружие',
+    'Вспоминаю нашу последнюю встречу'
+]
+
+
+def load_scenarios() -> Dict[str, Dict[str, Any]]:
+    '''TESTS + TEST_SCENARIO из quick-test (модуль грузится по пути: папка функции — не пакет)'''
+    scenarios = dict(TESTS)
+    function_dir = os.path.join(BACKEND_DIR, 'quick-test')
+    spec = importlib.util.spec_from_file_location('quick_test_index', os.path.join(function_dir, 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    # index.py импортирует свои копии response и timing; load_function потом выгрузит их для других функций
+    sys.path.insert(0, function_dir)
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(function_dir)
+    scenarios['Quick test (романтическая драма)'] = module.TEST_SCENARIO
+    return scenarios
+
+
+def make_token(user_id: int) -> Optional[str]:
+    secret = os.environ.get('JWT_SECRET')
+    if not secret:
+        return None
+    import jwt
+    return jwt.encode({'user_id': user_id, 'username': f'load-{user_id}'}, secret, algorithm='HS256')
+
+
+class InProcessTransport:
+    '''Функции вызываются напрямую, как их вызывает платформа; psycopg2.connect считается'''
+
+    def __init__(self):
+        self.server, base_url = start_mock()
+        os.environ['DEEPSEEK_BASE_URL'] = base_url
+        os.environ.setdefault('DEEPSEEK_API_KEY', 'mock-key')
+        self.handlers = {}
+        for function_name in SESSION_FUNCTIONS:
+            function_dir = os.path.join(BACKEND_DIR, function_name)
+            sys.path.insert(0, function_dir)
+            try:
+                self.handlers[function_name] = load_function(function_dir)
+            except ImportError as e:
+                print(f"⚠️  {function_name}: не импортируется — {e}", file=sys.stderr)
+            finally:
+                sys.path.remove(function_dir)
+
+        self.lock = threading.Lock()
+        self.connects = None
+        try:
+            import psycopg2
+        except ImportError:
+            return
+        self.connects = 0
+        original_connect = psycopg2.connect
+
+        def counting_connect(*args, **kwargs):
+            with self.lock:
+                self.connects += 1
+            return original_connect(*args, **kwargs)
+
+        psycopg2.connect = counting_connect
+
+    def call(self, function_name: str, method: str, body: Optional[Dict[str, Any]] = None,
+             query: Optional[Dict[str, str]] = None, token: Optional[str] = None,
+             headers: Optional[Dict[str, str]] = None) -> Tuple[int, str, Dict[str, str]]:
+        event = {
+            'httpMethod': method,
+            'headers': {'Content-Type': 'application/json', **({'X-Auth-Token': token} if token else {}), **(headers or {})},
+            'queryStringParameters': query or {},
+            'body': json.dumps(body, ensure_ascii=False) if body is not None else '',
+            'isBase64Encoded': False
+        }
+        if function_name not in self.handlers:
+            raise RuntimeError(f'{function_name} не загружена')
+        response = self.handlers[function_name](event, BenchContext(function_name))
+        return response.get('statusCode', 200), response.get('body', ''), response.get('headers', {})
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class HttpTransport:
+    '''Функции за HTTP: локальный шлюз или мок с --handler'''
+
+    def __init__(self, base_url: str):
+        import requests
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+        self.connects = None
+
+    def call(self, function_name: str, method: str, body: Optional[Dict[str, Any]] = None,
+             query: Optional[Dict[str, str]] = None, token: Optional[str] = None,
+             headers: Optional[Dict[str, str]] = None) -> Tuple[int, str, Dict[str, str]]:
+        response = self.session.request(
+            method,
+            f'{self.base_url}/{function_name}',
+            params=query,
+            data=json.dumps(body, ensure_ascii=False).encode('utf-8') if body is not None else None,
+            headers={'Content-Type': 'application/json', **({'X-Auth-Token': token} if token else {}), **(headers or {})},
+            timeout=120
+        )
+        return response.status_code, response.text, dict(response.headers)
+
+    def close(self):
+        self.session.close()
+
+
+class LoadStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints: Dict[str, Dict[str, Any]] = {}
+        self.turns: Dict[int, Dict[str, List[int]]] = {}
+        self.sessions = {'started': 0, 'completed': 0, 'failed': 0}
+        # Ходы с вариантом из подсказок и сколько из них пришло из кеша (X-Cache: HIT)
+        self.suggestions = {'picked': 0, 'hits': 0}
+
+    def add(self, endpoint: str, elapsed_ms: float, status: int, request_bytes: int, response_bytes: int, cache_hit: bool):
+        with self.lock:
+            entry = self.endpoints.setdefault(endpoint, {'timings': [], 'statuses': {}, 'request_bytes': 0, 'response_bytes': 0, 'cache_hits': 0})
+            entry['timings'].append(elapsed_ms)
+            entry['statuses'][str(status)] = entry['statuses'].get(str(status), 0) + 1
+            entry['request_bytes'] += request_bytes
+            entry['response_bytes'] += response_bytes
+            entry['cache_hits'] += cache_hit
+
+    def add_turn(self, turn: int, request_bytes: int, response_bytes: int):
+        with self.lock:
+            entry = self.turns.setdefault(turn, {'request_bytes': [], 'response_bytes': []})
+            entry['request_bytes'].append(request_bytes)
+            entry['response_bytes'].append(response_bytes)
+
+    def count(self, key: str):
+        with self.lock:
+            self.sessions[key] += 1
+
+    def count_suggestion(self, hit: bool):
+        with self.lock:
+            self.suggestions['picked'] += 1
+            self.suggestions['hits'] += hit
+
+
+def timed_call(transport, stats: LoadStats, endpoint: str, function_name: str, method: str, **kwargs) -> Tuple[int, Any, int, bool]:
+    '''Вызов с замером; возвращает статус, разобранное тело, размер запроса и попадание в кеш'''
+    request_bytes = len(json.dumps(kwargs['body'], ensure_ascii=False).encode('utf-8')) if kwargs.get('body') is not None else 0
+    started = time.perf_counter()
+    try:
+        status, body, headers = transport.call(function_name, method, **kwargs)
+    except Exception as e:
+        stats.add(endpoint, (time.perf_counter() - started) * 1000, type(e).__name__, request_bytes, 0, False)
+        return 0, None, request_bytes, False
+    elapsed = (time.perf_counter() - started) * 1000
+    cache_hit = any(k.lower() == 'x-cache' and v == 'HIT' for k, v in headers.items())
+    stats.add(endpoint, elapsed, status, request_bytes, len(body.encode('utf-8')) if isinstance(body, str) else 0, cache_hit)
+    try:
+        data = json.loads(body) if body else None
+    except ValueError:
+        data = None
+    return status, data, request_bytes, cache_hit
+
+
+def play_session(player: int, scenario_name: str, scenario: Dict[str, Any], transport, stats: LoadStats,
+                 turns: int, think: float, user_ids: int, seed: int, server_sessions: bool = False,
+                 speculate: bool = False, pick_suggestion: float = 0.0):
+    '''Одна сессия игрока: создание истории и игры, затем ходы'''
+    rng = random.Random(seed + player)
+    stats.count('started')
+    user_id = player % user_ids + 1
+    token = make_token(user_id)
+    settings = scenario['game_settings']
+    setting = scenario.get('setting', '')
+
+    story_id = game_id = None
+    if token:
+        status, data, _, _ = timed_call(transport, stats, 'save-story POST', 'save-story', 'POST', token=token, body={
+            'title': f'Нагрузка {player}', 'content': setting or scenario_name, 'prompt': scenario_name, 'genre': settings.get('genre', '')
+        })
+        story_id = data.get('id') if status == 200 and isinstance(data, dict) else None
+        status, data, _, _ = timed_call(transport, stats, 'rpg-games POST', 'rpg-games', 'POST', token=token, body={
+            'title': f'Нагрузка {player}: {scenario_name}', 'genre': settings.get('genre', ''), 'setting': setting
+        })
+        game_id = data.get('id') if status == 201 and isinstance(data, dict) else None
+
+    history: List[Dict[str, str]] = []
+    actions_log: List[Dict[str, str]] = []
+    # Без rpg-games (нет JWT_SECRET) у сессии всё равно должен быть свой id
+    session_id = game_id or f'load-{seed}-{player}'
+    session_version = None
+    suggestions: List[str] = []
+    ok = True
+    for turn in range(turns):
+        picked = bool(suggestions) and rng.random() < pick_suggestion
+        if picked:
+            action = rng.choice(suggestions)
+        else:
+            action = scenario.get('user_action') if turn == 0 and scenario.get('user_action') else rng.choice(ACTIONS)
+        if server_sessions and session_version is not None:
+            body = {'game_id': session_id, 'user_action': action, 'session_version': session_version}
+        elif server_sessions:
+            body = {'game_id': session_id, 'game_settings': settings, 'setting': setting, 'user_action': action, 'history': history}
+        else:
+            body = {'game_settings': settings, 'setting': setting, 'user_action': action, 'history': history}
+        if speculate:
+            # Бюджет спекуляций считается на пользователя — без токена (JWT_SECRET) story-ai их не запускает
+            body['speculate'] = True
+        status, data, request_bytes, cache_hit = timed_call(
+            transport, stats, 'story-ai POST', 'story-ai', 'POST', body=body, token=token,
+            headers={'X-User-Id': str(user_id)} if speculate else None
+        )
+        story = data.get('story', '') if status == 200 and isinstance(data, dict) else ''
+        if isinstance(data, dict):
+            session_version = data.get('session_version', session_version)
+            suggestions = data.get('suggestions') or []
+        if picked:
+            stats.count_suggestion(cache_hit)
+        stats.add_turn(turn + 1, request_bytes, len(story.encode('utf-8')))
+        if not story:
+            ok = False
+            break
+        history.append({'user': action, 'ai': story})
+        actions_log.append({'action': action, 'result': story[:200]})
+
+        if game_id:
+            timed_call(transport, stats, 'rpg-games PUT', 'rpg-games', 'PUT', token=token, query={'id': str(game_id)}, body={
+                'story_context': story, 'actions_log': actions_log, 'current_chapter': f'Ход {turn + 1}'
+            })
+        if story_id:
+            timed_call(transport, stats, 'update-story-progress PUT', 'update-story-progress', 'PUT', body={
+                'story_id': story_id, 'story_context': story, 'new_action': actions_log[-1]
+            })
+        if think > 0:
+            time.sleep(rng.uniform(0.5, 1.5) * think)
+    stats.count('completed' if ok else 'failed')
+
+
+def sample_db_connections(dsn: str, stop: threading.Event, samples: List[int], interval: float = 0.5):
+    '''Сколько соединений открыто к базе прямо сейчас (pg_stat_activity), раз в interval секунд'''
+    import psycopg2
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    try:
+        cur = conn.cursor()
+        while not stop.is_set():
+            cur.execute('SELECT count(*) FROM pg_stat_activity WHERE datname = current_database()')
+            samples.append(cur.fetchone()[0] - 1)
+            stop.wait(interval)
+    finally:
+        conn.close()
+
+
+def build_report(stats: LoadStats, elapsed: float, connects: Optional[int], db_samples: List[int], args) -> Dict[str, Any]:
+    endpoints = {}
+    total_requests = 0
+    for name, entry in stats.endpoints.items():
+        timings = sorted(entry['timings'])
+        total_requests += len(timings)
+        endpoints[name] = {
+            'requests': len(timings),
+            'rps': round(len(timings) / elapsed, 2),
+            'p50_ms': round(percentile(timings, 50), 1),
+            'p95_ms': round(percentile(timings, 95), 1),
+            'p99_ms': round(percentile(timings, 99), 1),
+            'max_ms': round(timings[-1], 1),
+            'statuses': entry['statuses'],
+            'avg_request_bytes': round(entry['request_bytes'] / len(timings)),
+            'avg_response_bytes': round(entry['response_bytes'] / len(timings)),
+            'cache_hits': entry['cache_hits']
+        }
+    turns = {
+        turn: {
+            'sessions': len(entry['request_bytes']),
+            'avg_request_bytes': round(sum(entry['request_bytes']) / len(entry['request_bytes'])),
+            'avg_story_bytes': round(sum(entry['response_bytes']) / len(entry['response_bytes']))
+        }
+        for turn, entry in sorted(stats.turns.items())
+    }
+    return {
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'config': {'players': args.players, 'ramp': args.ramp, 'turns': args.turns, 'think': args.think, 'target': args.base_url or 'in-process', 'server_sessions': args.server_sessions,
+                   'speculate': args.speculate, 'pick_suggestion': args.pick_suggestion},
+        'elapsed_seconds': round(elapsed, 2),
+        'throughput_rps': round(total_requests / elapsed, 2),
+        'turns_per_second': round(sum(t['sessions'] for t in turns.values()) / elapsed, 2),
+        'sessions': stats.sessions,
+        'suggestions': stats.suggestions,
+        'endpoints': endpoints,
+        'turns': turns,
+        'db': {
+            'connects': connects,
+            'peak_connections': max(db_samples) if db_samples else None,
+            'avg_connections': round(sum(db_samples) / len(db_samples), 1) if db_samples else None
+        }
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"\n📈 {report['config']['players']} игроков × {report['config']['turns']} ходов за {report['elapsed_seconds']} с: "
+          f"{report['throughput_rps']} запр/с, {report['turns_per_second']} ходов/с")
+    print(f"   Сессии: {report['sessions']}")
+    picked = report['suggestions']['picked']
+    if picked:
+        print(f"   Выбрано вариантов из подсказок: {picked}, из них из кеша: {report['suggestions']['hits']} "
+              f"({report['suggestions']['hits'] / picked:.0%})")
+    print(f"\n{'эндпоинт':<28} {'запросов':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'запрос':>9} {'ответ':>9}  статусы")
+    for name, e in report['endpoints'].items():
+        print(f"{name:<28} {e['requests']:>8} {e['p50_ms']:>7}м {e['p95_ms']:>7}м {e['p99_ms']:>7}м "
+              f"{e['avg_request_bytes']:>8}б {e['avg_response_bytes']:>8}б  {e['statuses']}")
+    print(f"\n{'ход':>4} {'сессий':>7} {'запрос story-ai':>16} {'история':>9}")
+    for turn, t in report['turns'].items():
+        print(f"{turn:>4} {t['sessions']:>7} {t['avg_request_bytes']:>15}б {t['avg_story_bytes']:>8}б")
+    db = report['db']
+    print(f"\n🗄  Соединений открыто: {db['connects']}, одновременно в пике: {db['peak_connections']}, в среднем: {db['avg_connections']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест многоходовых сессий')
+    parser.add_argument('--players', type=int, default=20, help='Виртуальных игроков')
+    parser.add_argument('--ramp', type=float, default=10, help='За сколько секунд подключаются все игроки')
+    parser.add_argument('--turns', type=int, default=8, help='Ходов в сессии')
+    parser.add_argument('--think', type=float, default=1.0, help='Среднее время «раздумья» игрока между ходами, с')
+    parser.add_argument('--users', type=int, default=10, help='Сколько разных user_id в токенах')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--server-sessions', action='store_true', help='Ходы story-ai по game_id: история хранится на сервере, а не в запросе')
+    parser.add_argument('--speculate', action='store_true', help='Просить story-ai заранее генерировать продолжения для «🎯 Варианты»')
+    parser.add_argument('--pick-suggestion', type=float, default=0.0, help='Вероятность, что игрок выберет вариант из подсказок дословно')
+    parser.add_argument('--base-url', help='Функции по HTTP: {base-url}/{функция}; по умолчанию — в этом процессе')
+    parser.add_argument('--json', help='Сохранить отчёт в JSON')
+    args = parser.parse_args()
+    # Строка лога timing.py на каждый вызов утопит отчёт
+    os.environ.setdefault('TIMING_LOG', '0')
+
+    scenarios = load_scenarios()
+    names = list(scenarios)
+    transport = HttpTransport(args.base_url) if args.base_url else InProcessTransport()
+    if not os.environ.get('JWT_SECRET'):
+        print('⚠️  JWT_SECRET не задан: save-story и rpg-games пропускаются, идут только ходы story-ai', file=sys.stderr)
+
+    stats = LoadStats()
+    stop = threading.Event()
+    db_samples: List[int] = []
+    sampler = None
+    dsn = os.environ.get('DATABASE_URL')
+    if dsn:
+        sampler = threading.Thread(target=sample_db_connections, args=(dsn, stop, db_samples), daemon=True)
+        sampler.start()
+
+    def player(i: int):
+        time.sleep(args.ramp * i / max(args.players, 1))
+        name = names[i % len(names)]
+        play_session(i, name, scenarios[name], transport, stats, args.turns, args.think, args.users, args.seed,
+                     args.server_sessions, args.speculate, args.pick_suggestion)
+
+    started = time.time()
+    try:
+        with ThreadPoolExecutor(max_workers=args.players) as pool:
+            list(pool.map(player, range(args.players)))
+    finally:
+        elapsed = time.time() - started
+        stop.set()
+        if sampler:
+            sampler.join()
+        transport.close()
+
+    report = build_report(stats, elapsed, transport.connects, db_samples, args)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Отчёт сохранён в: {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Локальный шлюз: все функции из backend/ в одном процессе
+Каждый backend/*/index.py импортируется один раз, запрос /<функция>?... превращается в событие
+платформы (httpMethod, headers, body, queryStringParameters) и уходит в handler(event, context).
+Запросы обслуживает пул потоков — вся платформа профилируется и нагружается на одной машине
+Запуск: python3 local_gateway.py [--port 8080] [--workers 32] [--functions story-ai,rpg-games] [--mock-llm]
+GET /func2url.json отдаёт карту функций на локальные адреса — в формате backend/func2url.json
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Dict, Any, Callable
+from urllib.parse import urlsplit, parse_qsl
+
+from bench_handlers import BACKEND_DIR, BenchContext, load_function, start_mock
+
+
+def discover_functions() -> list:
+    '''Функции из func2url.json и ещё не задеплоенные — папки backend с index.py, которых в карте пока нет'''
+    with open(os.path.join(BACKEND_DIR, 'func2url.json'), encoding='utf-8') as f:
+        names = set(json.load(f))
+    for name in os.listdir(BACKEND_DIR):
+        if os.path.isfile(os.path.join(BACKEND_DIR, name, 'index.py')):
+            names.add(name)
+    return sorted(names)
+
+
+def load_all(names: list) -> Dict[str, Callable]:
+    '''
+    Импортирует handler каждой функции. Вендорные копии модулей (translation, keyword_matcher, ...)
+    у каждой функции свои — load_function выгружает чужие перед импортом
+    '''
+    handlers = {}
+    for name in names:
+        function_dir = os.path.join(BACKEND_DIR, name)
+        sys.path.insert(0, function_dir)
+        started = time.perf_counter()
+        try:
+            handlers[name] = load_function(function_dir)
+            print(f"   ✅ {name} ({(time.perf_counter() - started) * 1000:.0f} мс)")
+        except Exception as e:
+            print(f"   ⚠️  {name}: не импортируется — {type(e).__name__}: {e}", file=sys.stderr)
+        finally:
+            sys.path.remove(function_dir)
+    return handlers
+
+
+class PooledHTTPServer(HTTPServer):
+    '''HTTPServer, который отдаёт соединения фиксированному пулу потоков, а не потоку на запрос'''
+
+    def __init__(self, address, handler_class, workers: int):
+        super().__init__(address, handler_class)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='gateway')
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class GatewayHandler(BaseHTTPRequestHandler):
+    handlers: Dict[str, Callable] = {}
+    base_url = ''
+    verbose = False
+    protocol_version = 'HTTP/1.1'
+    # Заголовки и тело уходят разными write: без TCP_NODELAY keep-alive ждёт delayed ACK ~40 мс
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status: int, headers: Dict[str, Any], payload: bytes):
+        self.send_response(status)
+        for name, value in headers.items():
+            if name.lower() != 'content-length':
+                self.send_header(name, str(value))
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(payload)
+
+    def _route(self):
+        url = urlsplit(self.path)
+        name = url.path.strip('/').split('/', 1)[0]
+        if name in ('', 'func2url.json'):
+            mapping = {n: f'{self.base_url}/{n}' for n in self.handlers}
+            self._send(200, {'Content-Type': 'application/json'}, json.dumps(mapping, indent=2).encode('utf-8'))
+            return
+        handler = self.handlers.get(name)
+        if handler is None:
+            self._send(404, {'Content-Type': 'application/json'}, json.dumps({'error': f'Unknown function: {name}'}).encode('utf-8'))
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        try:
+            body, is_base64 = raw.decode('utf-8'), False
+        except UnicodeDecodeError:
+            body, is_base64 = base64.b64encode(raw).decode('ascii'), True
+        event = {
+            'httpMethod': self.command,
+            'headers': dict(self.headers.items()),
+            'queryStringParameters': dict(parse_qsl(url.query, keep_blank_values=True)),
+            'body': body,
+            'isBase64Encoded': is_base64
+        }
+
+        try:
+            response = handler(event, BenchContext(name))
+        except Exception as e:
+            # Платформа отдала бы 502 — повторяем, чтобы клиенты видели то же, что в проде
+            print(f"❌ {name}: {type(e).__name__}: {e}", file=sys.stderr)
+            self._send(502, {'Content-Type': 'application/json'}, json.dumps({'error': f'{type(e).__name__}: {e}'}).encode('utf-8'))
+            return
+
+        payload = response.get('body', '')
+        if response.get('isBase64Encoded'):
+            payload = base64.b64decode(payload)
+        elif isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        else:
+            payload = json.dumps(payload).encode('utf-8')
+        self._send(response.get('statusCode', 200), response.get('headers', {}), payload)
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_PATCH = do_OPTIONS = do_HEAD = _route
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Локальный шлюз для всех облачных функций')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=32, help='Потоков в пуле')
+    parser.add_argument('--functions', help='Только эти функции, через запятую (по умолчанию — все из func2url.json и backend)')
+    parser.add_argument('--mock-llm', action='store_true', help='Поднять мок DeepSeek (mock_llm_server.py) и направить функции в него')
+    parser.add_argument('--verbose', action='store_true', help='Логировать каждый запрос')
+    args = parser.parse_args()
+    # Строки лога timing.py (фазы каждого запроса) — вместе с --verbose
+    os.environ.setdefault('TIMING_LOG', '1' if args.verbose else '0')
+
+    base_url = f'http://{args.host}:{args.port}'
+    # Функции, которые зовут другие функции по адресу, должны ходить через шлюз — до импорта index.py
+    os.environ.setdefault('STORY_AI_URL', f'{base_url}/story-ai')
+    mock = None
+    if args.mock_llm:
+        mock, mock_url = start_mock()
+        os.environ['DEEPSEEK_BASE_URL'] = mock_url
+        os.environ.setdefault('DEEPSEEK_API_KEY', 'mock-key')
+        print(f"🧪 Мок DeepSeek: {mock_url}")
+
+    names = args.functions.split(',') if args.functions else discover_functions()
+    print(f"📦 Импорт функций ({len(names)}):")
+    GatewayHandler.handlers = load_all(names)
+    GatewayHandler.base_url = base_url
+    GatewayHandler.verbose = args.verbose
+
+    server = PooledHTTPServer((args.host, args.port), GatewayHandler, args.workers)
+    print(f"🚪 Шлюз слушает {base_url}/<функция> ({len(GatewayHandler.handlers)} функций, {args.workers} потоков)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if mock:
+            mock.shutdown()
+            mock.server_close()
+
+
+if __name__ == '__main__':
+    main()
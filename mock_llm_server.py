@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+Локальный мок DeepSeek/OpenAI API для офлайн-замеров производительности
+Отвечает на /v1/chat/completions (и /chat/completions для клиента openai) с заданной
+задержкой, скоростью токенов, стримингом, ошибками и заготовленными ответами
+Запуск: python3 mock_llm_server.py [--port 8089] [--latency lognormal:-0.7,0.4] [--tokens-per-second 60]
+        [--error-rate 0.05] [--responses canned.json] [--handler backend/story-ai]
+Функции смотрят на мок через DEEPSEEK_BASE_URL=http://127.0.0.1:8089,
+тестовые скрипты — через STORY_AI_URL
+"""
+
+import argparse
+import base64
+import importlib.util
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional
+from urllib.parse import urlsplit, parse_qsl
+
+COMPLETION_PATHS = ('/v1/chat/completions', '/chat/completions')
+MODELS_PATHS = ('/v1/models', '/models')
+
+# «Токен» мока — слово с пробелами после него: для замеров скорости этого достаточно
+TOKEN_RE = re.compile(r'\S+\s*|\s+')
+
+DEFAULT_STORY = (
+    "📊 СТАТУС ИСТОРИИ\n"
+    "📍 Локация: Облачные Глубины, библиотека\n"
+    "⏰ Время: 21:40, поздняя осень, моросит дождь\n"
+    "🎬 События: ночной разговор у закрытых свитков\n"
+    "👥 NPC: Лань Ванцзи(настороженно): стоит у стеллажа\n"
+    "===\n\n"
+    "[NPC: Лань Ванцзи | Роль: Второй молодой мастер клана | Внешность: белые одежды, лобная лента]\n\n"
+    "Запах сандала и мокрой бумаги стоял в тишине библиотеки. Свет фонаря дрожал на полках, "
+    "тени от свитков ложились на пол длинными полосами. Где-то за окном шуршал ветер.\n\n"
+    "Лань Ванцзи отвернулся к окну, но пальцы его сжали край рукава.\n\n"
+    "— Ты опять нарушил правила, — сказал Лань Ванцзи. Голос был ровным, и всё же в нём "
+    "слышалось что-то похожее на тревогу.\n\n"
+    "Вэй Усянь усмехнулся, вспомнил, как много лет назад они сидели здесь же, переписывая "
+    "правила клана, — тогда он тоже не умел молчать. Он почувствовал одновременно вину и "
+    "странное тепло: несмотря ни на что, его ждали.\n\n"
+    "Пауза затянулась. Никто не решался сказать главное.\n\n"
+    "🎯 Варианты: подойти ближе и коснуться его руки; отшутиться и уйти; спросить, почему он ждал"
+)
+
+DEFAULT_TRANSLATION = (
+    "A lone cultivator in white robes standing in an ancient library at night, soft lantern light, "
+    "drifting incense smoke, rain on paper windows, dark fantasy, cinematic composition, "
+    "highly detailed, volumetric lighting, masterpiece, best quality"
+)
+
+
+class LatencyModel:
+    '''
+    Распределение задержки до первого токена, задаётся строкой:
+    fixed:0.5 | uniform:0.2,1.0 | normal:0.8,0.2 | lognormal:-0.7,0.4 | exp:0.5 (среднее), секунды
+    '''
+
+    KINDS = ('fixed', 'uniform', 'normal', 'lognormal', 'exp')
+
+    def __init__(self, spec: str, rng: random.Random):
+        kind, _, args = spec.partition(':')
+        if kind not in self.KINDS:
+            raise ValueError(f'Неизвестное распределение задержки: {kind}')
+        self.spec = spec
+        self.kind = kind
+        self.args = [float(a) for a in args.split(',') if a.strip()]
+        self.rng = rng
+
+    def sample(self) -> float:
+        a = self.args
+        if self.kind == 'fixed':
+            value = a[0] if a else 0.0
+        elif self.kind == 'uniform':
+            value = self.rng.uniform(a[0], a[1])
+        elif self.kind == 'normal':
+            value = self.rng.gauss(a[0], a[1])
+        elif self.kind == 'lognormal':
+            value = self.rng.lognormvariate(a[0], a[1])
+        else:
+            value = self.rng.expovariate(1 / a[0]) if a[0] > 0 else 0.0
+        return max(0.0, value)
+
+
+class MockConfig:
+    '''Настройки мока; меняются на лету через POST /mock/config'''
+
+    def __init__(self, args: argparse.Namespace):
+        self.lock = threading.Lock()
+        self.rng = random.Random(args.seed)
+        self.latency = LatencyModel(args.latency, self.rng)
+        self.tokens_per_second = args.tokens_per_second
+        self.error_rate = args.error_rate
+        self.error_statuses = [int(s) for s in args.error_status.split(',') if s.strip()]
+        self.hang_rate = args.hang_rate
+        self.hang_seconds = args.hang_seconds
+        self.canned = load_canned(args.responses) if args.responses else []
+        self.stats = {'requests': 0, 'streamed': 0, 'errors': 0, 'hangs': 0, 'completion_tokens': 0}
+
+    def update(self, data: Dict[str, Any]):
+        with self.lock:
+            if 'latency' in data:
+                self.latency = LatencyModel(data['latency'], self.rng)
+            if 'tokens_per_second' in data:
+                self.tokens_per_second = float(data['tokens_per_second'])
+            if 'error_rate' in data:
+                self.error_rate = float(data['error_rate'])
+            if 'error_status' in data:
+                self.error_statuses = [int(s) for s in data['error_status']]
+            if 'hang_rate' in data:
+                self.hang_rate = float(data['hang_rate'])
+            if 'responses' in data:
+                self.canned = data['responses']
+
+    def roll(self) -> Dict[str, Any]:
+        '''Исход одного запроса: задержка и, возможно, ошибка или зависание'''
+        with self.lock:
+            self.stats['requests'] += 1
+            plan = {'latency': self.latency.sample(), 'status': 200, 'hang': False}
+            r = self.rng.random()
+            if r < self.hang_rate:
+                plan['hang'] = True
+                self.stats['hangs'] += 1
+            elif r < self.hang_rate + self.error_rate and self.error_statuses:
+                plan['status'] = self.rng.choice(self.error_statuses)
+                self.stats['errors'] += 1
+            return plan
+
+    def count(self, key: str, value: int = 1):
+        with self.lock:
+            self.stats[key] += value
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            'latency': self.latency.spec,
+            'tokens_per_second': self.tokens_per_second,
+            'error_rate': self.error_rate,
+            'error_status': self.error_statuses,
+            'hang_rate': self.hang_rate,
+            'responses': len(self.canned),
+            'stats': dict(self.stats)
+        }
+
+
+def load_canned(path: str) -> List[Dict[str, str]]:
+    '''Заготовки: [{"match": "подстрока в сообщениях", "content": "ответ"}, ...]; первая подходящая побеждает'''
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def pick_content(messages: List[Dict[str, Any]], canned: List[Dict[str, str]]) -> str:
+    text = '\n'.join(str(m.get('content', '')) for m in messages)
+    for item in canned:
+        if item.get('match', '') in text:
+            return item['content']
+    system = next((str(m.get('content', '')) for m in messages if m.get('role') == 'system'), '')
+    if 'translat' in system.lower():
+        return DEFAULT_TRANSLATION
+    return DEFAULT_STORY
+
+
+def estimate_tokens(text: str) -> int:
+    return len(TOKEN_RE.findall(text))
+
+
+def error_body(status: int) -> Dict[str, Any]:
+    kinds = {429: 'rate_limit_exceeded', 500: 'server_error', 502: 'bad_gateway', 503: 'service_unavailable'}
+    return {'error': {'message': f'Mock injected error {status}', 'type': kinds.get(status, 'api_error'), 'code': status}}
+
+
+def load_handler(function_dir: str):
+    '''Импортирует handler облачной функции, как это делает платформа: index.py рядом со своими модулями'''
+    function_dir = os.path.abspath(function_dir)
+    sys.path.insert(0, function_dir)
+    spec = importlib.util.spec_from_file_location('mock_function_index', os.path.join(function_dir, 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.handler
+
+
+class MockContext:
+    def __init__(self):
+        self.request_id = uuid.uuid4().hex
+        self.function_name = 'mock'
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    config: MockConfig = None
+    function_handler = None
+    protocol_version = 'HTTP/1.1'
+    # Заголовки и тело уходят разными write: без TCP_NODELAY keep-alive ждёт delayed ACK ~40 мс
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, data: Any, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/mock/config':
+            self._send_json(200, self.config.describe())
+        elif path in MODELS_PATHS:
+            self._send_json(200, {'object': 'list', 'data': [{'id': 'deepseek-chat', 'object': 'model', 'owned_by': 'mock'}]})
+        else:
+            self._invoke_function('GET', b'')
+
+    def do_OPTIONS(self):
+        self._invoke_function('OPTIONS', b'')
+
+    def do_PUT(self):
+        self._invoke_function('PUT', self._read_body())
+
+    def do_DELETE(self):
+        self._invoke_function('DELETE', self._read_body())
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        body = self._read_body()
+        if path in COMPLETION_PATHS:
+            self._chat_completion(json.loads(body or b'{}'))
+        elif path == '/mock/config':
+            self.config.update(json.loads(body or b'{}'))
+            self._send_json(200, self.config.describe())
+        else:
+            self._invoke_function('POST', body)
+
+    def _chat_completion(self, request: Dict[str, Any]):
+        plan = self.config.roll()
+        if plan['hang']:
+            # Зависший апстрим: проверяем таймауты клиента
+            time.sleep(self.config.hang_seconds)
+            self.close_connection = True
+            return
+        time.sleep(plan['latency'])
+        if plan['status'] != 200:
+            self._send_json(plan['status'], error_body(plan['status']), {'Retry-After': '1'} if plan['status'] == 429 else None)
+            return
+
+        content = pick_content(request.get('messages', []), self.config.canned)
+        tokens = TOKEN_RE.findall(content)
+        finish_reason = 'stop'
+        max_tokens = request.get('max_tokens')
+        if max_tokens and len(tokens) > max_tokens:
+            tokens = tokens[:max_tokens]
+            finish_reason = 'length'
+        prompt_tokens = sum(estimate_tokens(str(m.get('content', ''))) for m in request.get('messages', []))
+        completion_id = f'chatcmpl-mock-{uuid.uuid4().hex[:12]}'
+        model = request.get('model', 'deepseek-chat')
+        rate = self.config.tokens_per_second
+        self.config.count('completion_tokens', len(tokens))
+
+        if request.get('stream'):
+            self.config.count('streamed')
+            usage = None
+            if (request.get('stream_options') or {}).get('include_usage'):
+                usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': len(tokens), 'total_tokens': prompt_tokens + len(tokens)}
+            self._stream(completion_id, model, tokens, finish_reason, rate, usage)
+            return
+
+        if rate > 0:
+            time.sleep(len(tokens) / rate)
+        self._send_json(200, {
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': ''.join(tokens)},
+                'finish_reason': finish_reason
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': len(tokens),
+                'total_tokens': prompt_tokens + len(tokens)
+            }
+        })
+
+    def _stream(self, completion_id: str, model: str, tokens: List[str], finish_reason: str, rate: float,
+                usage: Optional[Dict[str, int]] = None):
+        '''
+        Server-Sent Events в формате OpenAI: по чанку на токен, затем data: [DONE].
+        С stream_options.include_usage перед [DONE] идёт чанк с usage и пустым choices
+        '''
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def send(data: str):
+            payload = f'data: {data}\n\n'.encode('utf-8')
+            self.wfile.write(f'{len(payload):x}\r\n'.encode('ascii') + payload + b'\r\n')
+            self.wfile.flush()
+
+        def chunk(delta: Dict[str, Any], finish: Optional[str] = None) -> str:
+            return json.dumps({
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish}]
+            }, ensure_ascii=False)
+
+        send(chunk({'role': 'assistant', 'content': ''}))
+        for token in tokens:
+            if rate > 0:
+                time.sleep(1 / rate)
+            send(chunk({'content': token}))
+        send(chunk({}, finish_reason))
+        if usage:
+            send(json.dumps({
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [],
+                'usage': usage
+            }))
+        send('[DONE]')
+        self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+    def _invoke_function(self, method: str, body: bytes):
+        '''Если смонтирована облачная функция (--handler) — вызываем её handler с событием платформы'''
+        if self.function_handler is None:
+            self._send_json(404, {'error': f'Mock has no route {self.path}'})
+            return
+        url = urlsplit(self.path)
+        event = {
+            'httpMethod': method,
+            'headers': dict(self.headers.items()),
+            'queryStringParameters': dict(parse_qsl(url.query)),
+            'body': body.decode('utf-8'),
+            'isBase64Encoded': False
+        }
+        response = type(self).function_handler(event, MockContext())
+        payload = response.get('body', '')
+        if response.get('isBase64Encoded'):
+            # Как платформа: сжатое (Content-Encoding) или бинарное тело приходит в base64
+            payload = base64.b64decode(payload)
+        elif isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        else:
+            payload = json.dumps(payload).encode('utf-8')
+        self.send_response(response.get('statusCode', 200))
+        for name, value in response.get('headers', {}).items():
+            if name.lower() != 'content-length':
+                self.send_header(name, str(value))
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Локальный мок DeepSeek/OpenAI API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', default='fixed:0', help='Задержка до первого токена: fixed:0.5, uniform:a,b, normal:mu,sd, lognormal:mu,sigma, exp:mean')
+    parser.add_argument('--tokens-per-second', type=float, default=0, help='Скорость генерации; 0 — мгновенно')
+    parser.add_argument('--error-rate', type=float, default=0, help='Доля запросов с HTTP-ошибкой')
+    parser.add_argument('--error-status', default='429,500,503', help='Какие коды ошибок отдавать')
+    parser.add_argument('--hang-rate', type=float, default=0, help='Доля запросов, которые зависают (проверка таймаутов)')
+    parser.add_argument('--hang-seconds', type=float, default=120)
+    parser.add_argument('--responses', help='JSON с заготовленными ответами [{"match", "content"}]')
+    parser.add_argument('--seed', type=int, default=42, help='Зерно генератора: одинаковые прогоны при одинаковом зерне')
+    parser.add_argument('--handler', help='Папка облачной функции, которую смонтировать на все остальные пути')
+    parser.add_argument('--verbose', action='store_true', help='Логировать каждый запрос')
+    args = parser.parse_args()
+
+    base_url = f'http://{args.host}:{args.port}'
+    MockHandler.config = MockConfig(args)
+    if args.handler:
+        # Функция должна ходить в этот же мок — переменная нужна до импорта index.py
+        os.environ['DEEPSEEK_BASE_URL'] = base_url
+        os.environ.setdefault('DEEPSEEK_API_KEY', 'mock-key')
+        MockHandler.function_handler = staticmethod(load_handler(args.handler))
+
+    server = ThreadingHTTPServer((args.host, args.port), MockHandler)
+    server.daemon_threads = True
+    server.verbose = args.verbose
+    print(f"🧪 Мок DeepSeek слушает {base_url} ({MockHandler.config.latency.spec}, {args.tokens_per_second} ток/с)")
+    print(f"   DEEPSEEK_BASE_URL={base_url}")
+    if args.handler:
+        print(f"   STORY_AI_URL={base_url}/  → {args.handler}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,8 @@
 // Скрипт для тестирования креативности ИИ
 // Запуск: node run-creativity-tests.js
 
-const API_URL = 'https://functions.poehali.dev/9ea67dc2-c306-4906-bf0f-da435600b92c';
+// STORY_AI_URL — чтобы гонять тесты против локального мока (mock_llm_server.py)
+const API_URL = process.env.STORY_AI_URL || 'https://functions.poehali.dev/9ea67dc2-c306-4906-bf0f-da435600b92c';
 
 const tests = {
   'Mo Dao Zu Shi (канон китайского фэнтези)': {
@@ -1,7 +1,8 @@
 // Локальный запуск тестов креативности ИИ
 // Использует fetch API из Node.js 18+
 
-const API_URL = 'https://functions.poehali.dev/9ea67dc2-c306-4906-bf0f-da435600b92c';
+// STORY_AI_URL — чтобы гонять тесты против локального мока (mock_llm_server.py)
+const API_URL = process.env.STORY_AI_URL || 'https://functions.poehali.dev/9ea67dc2-c306-4906-bf0f-da435600b92c';
 
 const tests = {
   'Mo Dao Zu Shi (канон китайского фэнтези)': {
@@ -1,15 +1,22 @@
 #!/usr/bin/env python3
 """
 Скрипт для глубокого тестирования креативности ИИ ролевой игры
-Запуск: python3 run_creativity_tests.py
+Запуск: python3 run_creativity_tests.py [--concurrency 4] [--timeout 60] [--repeats 1]
 """
 
+import argparse
 import json
+import os
+import statistics
 import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
 from typing import Dict, Any, List
+from keyword_matcher import LemmaMatcher
 
-API_URL = 'https://functions.poehali.dev/9ea67dc2-c306-4906-bf0f-da435600b92c'
+# story-ai; STORY_AI_URL — чтобы гонять тесты против локального мока
+API_URL = os.environ.get('STORY_AI_URL', 'https://functions.poehali.dev/9ea67dc2-c306-4906-bf0f-da435600b92c')
+DEFAULT_TIMEOUT = 60
 
 TESTS = {
     'Mo Dao Zu Shi (канон китайского фэнтези)': {
@@ -112,6 +119,40 @@ TESTS = {
 }
 
 
+# Лексиконы критериев: слова сравниваются по основе, так что одна форма покрывает склонения;
+# кортеж — формы одного слова, которые стеммер разводит по разным основам
+STORY_LEXICONS = {
+    'mdzs_terms': ['культиватор', 'культивация', 'клан', 'гуцин', 'флейта', 'демонический'],
+    'lwz_traits': [('правила', 'правило'), 'запрет', ('строгий', 'строгость'), ('холод', 'холодный'), ('безмолвие', 'безмолвный')],
+    'wwx_traits': [('ирония', 'ироничный'), ('шутка', 'шутить', 'шутил', 'пошутить'), ('дерзкий', 'дерзость'), ('усмехнулся', 'усмешка'), 'весёлый'],
+    'hunt_words': [('охота', 'охотник'), 'нечисть', 'призрак', 'дух', 'монстр'],
+    'canon_details': [('импала', 'импалы'), 'рок', 'виски', 'пирог'],
+    'scifi_words': ['станция', ('космос', 'космический'), 'эридан', ('эхо', 'эха', 'эхом'), 'орбита'],
+    'context_words': ['5 лет', ('разрыв', 'разрыва'), 'концерт', 'джаз', 'пианист', 'художник'],
+    'inner_thoughts': ['подумать', ('вспомнить', 'вспоминать'), 'почувствовать', 'понять', 'осознать', 'заметить'],
+    'body_language': ['посмотрел', 'отвернулся', 'наклонился', 'сжал', 'прикоснулся', 'вздрогнул', 'усмехнулся'],
+    'memory_words': ['помнить', 'раньше', 'тогда', 'прошлое', 'всегда'],
+    'sensory_words': [('запах', 'запаха'), 'звук', 'шёпот', 'шорох', 'тишина', ('холод', 'холодный'), 'тепло', 'свет', ('тень', 'тени', 'тенью'), ('ветер', 'ветра'), 'аромат', ('эхо', 'эха', 'эхом')],
+    'emotional_words': ['напряжение', ('тревога', 'тревожный'), 'страх', 'радость', ('грусть', 'грустный'), 'злость', 'нежность', ('боль', 'боли', 'болью'), 'тоска'],
+    'cliche_phrases': ['сердце билось', 'глаза загорелись', 'душа пела', 'бабочки в животе', 'сердце сжалось'],
+    'complex_emotions': ['противоречие', 'одновременно', 'с одной стороны', 'но в то же время', 'вопреки', 'несмотря'],
+    'silence_words': ['молча', 'тишина', 'пауза', 'не сказ', ('безмолвие', 'безмолвный'), 'замолчать'],
+    'nsfw_indicators': [('поцелуй', 'поцелуи', 'поцеловать'), 'прикосновение', ('близость', 'близко'), 'объятия', ('ласка', 'ласковый'), ('страсть', 'страстный'), 'желание'],
+    'vulgar_words': [('трахать', 'трахнул'), ('ебать', 'ебаный'), 'сиськи', ('хуй', 'хуя'), 'пизда', 'член'],
+    'spn_humor': ['сарказм', ('шутка', 'шутить', 'шутил', 'пошутить'), ('усмехнулся', 'усмешка'), ('едкий', 'едко')],
+    'scifi_future': ['2187', 'будущее', 'технология', 'автоматика'],
+    'heaven': ['ангел', ('небеса', 'небесный')]
+}
+
+# Имена персонажей проверяются подстрокой с учётом регистра
+NAME_LEXICONS = {
+    'mdzs_names': ['Лань Ванцзи', 'Вэй Усянь'],
+    'drama_names': ['Алекс', 'Дэниэл']
+}
+
+STORY_MATCHER = LemmaMatcher(STORY_LEXICONS)
+NAME_MATCHER = LemmaMatcher(NAME_LEXICONS, case_sensitive=True)
+
 def analyze_response(test_name: str, story: str) -> Dict[str, Any]:
     """Глубокий анализ ответа ИИ по всем критериям"""
     
@@ -128,26 +169,24 @@ def analyze_response(test_name: str, story: str) -> Dict[str, Any]:
         'story_fragments': []
     }
     
-    story_lower = story.lower()
+    hits = STORY_MATCHER.scan(story)
+    names = NAME_MATCHER.scan(story)
     
     # 1. ПОНИМАНИЕ КАНОНА/СЕТТИНГА (макс 9 баллов)
     if 'Mo Dao Zu Shi' in test_name:
-        keywords = ['культиватор', 'культивация', 'клан', 'гуцин', 'флейта', 'демонический']
-        if any(kw in story_lower for kw in keywords):
+        if hits.any('mdzs_terms'):
             analysis['canon_understanding'] += 3
             analysis['quotes'].append('✓ Использует терминологию сянься')
         
-        if 'Лань Ванцзи' in story and 'Вэй Усянь' in story:
+        if names.count('mdzs_names') == 2:
             analysis['canon_understanding'] += 2
             analysis['quotes'].append('✓ Сохраняет имена персонажей')
         
-        lwz_traits = ['правил', 'запрет', 'строг', 'холод', 'безмолв']
-        if any(t in story_lower for t in lwz_traits):
+        if hits.any('lwz_traits'):
             analysis['canon_understanding'] += 2
             analysis['quotes'].append('✓ Передает характер Лань Ванцзи (строгость)')
         
-        wwx_traits = ['ирон', 'шутк', 'дерз', 'усмехн', 'весел']
-        if any(t in story_lower for t in wwx_traits):
+        if hits.any('wwx_traits'):
             analysis['canon_understanding'] += 2
             analysis['quotes'].append('✓ Передает характер Вэй Усяня (дерзость)')
         
@@ -156,31 +195,28 @@ def analyze_response(test_name: str, story: str) -> Dict[str, Any]:
             analysis['recommendations'].append('Добавить в промпт: детали мира культивации, правила клана Лань, особенности сянься')
     
     elif 'Сверхестественное' in test_name:
-        hunt_words = ['охот', 'нечист', 'призрак', 'дух', 'монстр']
-        if any(w in story_lower for w in hunt_words):
+        if hits.any('hunt_words'):
             analysis['canon_understanding'] += 3
             analysis['quotes'].append('✓ Передает атмосферу охоты на нечисть')
         
-        canon_details = ['импал', 'рок', 'виски', 'пирог']
-        if any(d in story_lower for d in canon_details):
+        if hits.any('canon_details'):
             analysis['canon_understanding'] += 3
             analysis['quotes'].append('✓ Использует иконические детали (Импала/рок/виски)')
         
-        if any(w in story_lower for w in ['сарказм', 'шутк', 'усмехн', 'едк']):
+        if hits.any('spn_humor'):
             analysis['canon_understanding'] += 2
             analysis['quotes'].append('✓ Передает стиль Дина (сарказм)')
         
-        if 'ангел' in story_lower or 'небес' in story_lower:
+        if hits.any('heaven'):
             analysis['canon_understanding'] += 1
     
     elif 'Оригинальный мир' in test_name:
-        scifi_words = ['станци', 'космос', 'эридан', 'эхо', 'орбит']
-        scifi_count = sum(1 for w in scifi_words if w in story_lower)
+        scifi_count = hits.count('scifi_words')
         if scifi_count >= 2:
             analysis['canon_understanding'] += 4
             analysis['quotes'].append(f'✓ Использует элементы сеттинга ({scifi_count} упоминаний)')
         
-        if any(w in story_lower for w in ['2187', 'будущ', 'технолог', 'автоматик']):
+        if hits.any('scifi_future'):
             analysis['canon_understanding'] += 3
             analysis['quotes'].append('✓ Передает футуристическую атмосферу')
         
@@ -191,12 +227,11 @@ def analyze_response(test_name: str, story: str) -> Dict[str, Any]:
             analysis['recommendations'].append('Больше деталей уникального мира: технологии, атмосфера космоса, характер ИИ')
     
     elif 'Эмоциональная глубина' in test_name:
-        if 'Алекс' in story and 'Дэниэл' in story:
+        if names.count('drama_names') == 2:
             analysis['canon_understanding'] += 3
             analysis['quotes'].append('✓ Сохраняет имена персонажей')
         
-        context_words = ['5 лет', 'разрыв', 'концерт', 'джаз', 'пианист', 'художник']
-        context_count = sum(1 for w in context_words if w in story_lower)
+        context_count = hits.count('context_words')
         if context_count >= 2:
             analysis['canon_understanding'] += 4
             analysis['quotes'].append(f'✓ Учел контекст прошлых отношений ({context_count} деталей)')
@@ -215,21 +250,18 @@ def analyze_response(test_name: str, story: str) -> Dict[str, Any]:
     else:
         analysis['issues'].append('❌ Нет диалогов - NPC не говорят')
     
-    inner_thoughts = ['подума', 'вспомн', 'почувствова', 'понял', 'осозна', 'заметил']
-    if any(w in story_lower for w in inner_thoughts):
+    if hits.any('inner_thoughts'):
         analysis['npc_alive'] += 2
         analysis['quotes'].append('✓ NPC показывают внутренние переживания')
     
-    body_language = ['посмотре', 'отверну', 'наклон', 'сжал', 'прикоснул', 'вздрогн', 'усмехн']
-    body_count = sum(1 for w in body_language if w in story_lower)
+    body_count = hits.count('body_language')
     if body_count >= 2:
         analysis['npc_alive'] += 2
         analysis['quotes'].append(f'✓ NPC используют язык тела ({body_count} жестов)')
     elif body_count > 0:
         analysis['npc_alive'] += 1
     
-    memory_words = ['помн', 'раньше', 'тогда', 'прошл', 'всегда']
-    if any(w in story_lower for w in memory_words):
+    if hits.any('memory_words'):
         analysis['npc_alive'] += 2
         analysis['quotes'].append('✓ NPC помнят прошлое')
     
@@ -238,8 +270,7 @@ def analyze_response(test_name: str, story: str) -> Dict[str, Any]:
         analysis['recommendations'].append('Усилить: больше диалогов, внутренних мыслей NPC, языка тела, реакций на действия')
     
     # 3. АТМОСФЕРА (макс 9 баллов)
-    sensory_words = ['запах', 'звук', 'шёпот', 'шорох', 'тишин', 'холод', 'тепл', 'свет', 'тень', 'ветер', 'аромат', 'эхо']
-    sensory_count = sum(1 for w in sensory_words if w in story_lower)
+    sensory_count = hits.count('sensory_words')
     if sensory_count >= 4:
         analysis['atmosphere'] += 4
         analysis['quotes'].append(f'✓ Богатые сенсорные детали ({sensory_count} упоминаний)')
@@ -255,8 +286,7 @@ def analyze_response(test_name: str, story: str) -> Dict[str, Any]:
     elif len(story) < 400:
         analysis['issues'].append('⚠️ Слишком короткий ответ для атмосферы')
     
-    emotional_words = ['напряж', 'тревог', 'страх', 'радост', 'грус', 'злость', 'нежност', 'боль', 'тоск']
-    emotional_count = sum(1 for w in emotional_words if w in story_lower)
+    emotional_count = hits.count('emotional_words')
     if emotional_count >= 3:
         analysis['atmosphere'] += 3
         analysis['quotes'].append(f'✓ Эмоциональная насыщенность ({emotional_count} эмоций)')
@@ -268,8 +298,7 @@ def analyze_response(test_name: str, story: str) -> Dict[str, Any]:
         analysis['recommendations'].append('Добавить: запахи, звуки, тактильные ощущения, визуальные детали')
     
     # 4. ГЛУБИНА ЭМОЦИЙ (макс 9 баллов)
-    cliche_phrases = ['сердце билось', 'глаза загорелись', 'душа пела', 'бабочки в животе', 'сердце сжалось']
-    cliche_count = sum(1 for p in cliche_phrases if p in story_lower)
+    cliche_count = hits.count('cliche_phrases')
     
     if cliche_count == 0:
         analysis['emotional_depth'] += 4
@@ -279,13 +308,11 @@ def analyze_response(test_name: str, story: str) -> Dict[str, Any]:
         analysis['issues'].append(f'❌ Найдено {cliche_count} эмоциональных штампов')
         analysis['recommendations'].append('Избегать штампов. Показывать эмоции через действия, а не называть их напрямую')
     
-    complex_emotions = ['противоречи', 'одновременно', 'с одной стороны', 'но в то же время', 'вопреки', 'несмотря']
-    if any(p in story_lower for p in complex_emotions):
+    if hits.any('complex_emotions'):
         analysis['emotional_depth'] += 3
         analysis['quotes'].append('✓ Показаны сложные/противоречивые эмоции')
     
-    silence_words = ['молча', 'тишин', 'пауз', 'не сказ', 'безмолв', 'замолч']
-    if any(w in story_lower for w in silence_words):
+    if hits.any('silence_words'):
         analysis['emotional_depth'] += 2
         analysis['quotes'].append('✓ Использует молчание/паузы для передачи эмоций')
     
@@ -294,11 +321,9 @@ def analyze_response(test_name: str, story: str) -> Dict[str, Any]:
         analysis['recommendations'].append('Показывать через: поступки, жесты, паузы, противоречия в поведении')
     
     # 5. NSFW КАЧЕСТВО (макс 5 баллов)
-    nsfw_indicators = ['поцел', 'прикосн', 'близ', 'объят', 'ласк', 'страст', 'желан']
-    nsfw_count = sum(1 for w in nsfw_indicators if w in story_lower)
+    nsfw_count = hits.count('nsfw_indicators')
     
-    vulgar_words = ['трах', 'еб', 'сиськ', 'хуй', 'пизд', 'член']
-    vulgar_count = sum(1 for w in vulgar_words if w in story_lower)
+    vulgar_count = hits.count('vulgar_words')
     
     if nsfw_count > 0 and vulgar_count == 0:
         analysis['nsfw_quality'] += 5
@@ -338,18 +363,17 @@ def analyze_response(test_name: str, story: str) -> Dict[str, Any]:
     return analysis
 
 
-def run_test(test_name: str, test_data: Dict) -> Dict[str, Any]:
-    """Запустить один тест"""
-    print(f"\n{'='*80}")
-    print(f"🧪 ТЕСТ: {test_name}")
-    print(f"{'='*80}\n")
+def run_test(test_name: str, test_data: Dict, timeout: float = DEFAULT_TIMEOUT) -> Dict[str, Any]:
+    """Запустить один тест; вывод печатается одним блоком, чтобы параллельные тесты не перемешивались"""
+    lines = [f"\n{'='*80}", f"🧪 ТЕСТ: {test_name}", f"{'='*80}\n"]
+    started_at = time.time()
     
     try:
         response = requests.post(
             API_URL,
             json=test_data,
             headers={'Content-Type': 'application/json'},
-            timeout=60
+            timeout=timeout
         )
         
         if response.ok:
@@ -358,16 +382,18 @@ def run_test(test_name: str, test_data: Dict) -> Dict[str, Any]:
             
             if story:
                 analysis = analyze_response(test_name, story)
-                print(f"✅ Тест выполнен успешно")
-                print(f"📊 Оценка: {analysis['total_score']}/10")
-                print(f"   • Канон: {analysis['canon_understanding']}/9")
-                print(f"   • NPC: {analysis['npc_alive']}/9")
-                print(f"   • Атмосфера: {analysis['atmosphere']}/9")
-                print(f"   • Эмоции: {analysis['emotional_depth']}/9")
-                print(f"   • NSFW: {analysis['nsfw_quality']}/5")
+                lines.append(f"✅ Тест выполнен успешно за {time.time() - started_at:.1f} с")
+                lines.append(f"📊 Оценка: {analysis['total_score']}/10")
+                lines.append(f"   • Канон: {analysis['canon_understanding']}/9")
+                lines.append(f"   • NPC: {analysis['npc_alive']}/9")
+                lines.append(f"   • Атмосфера: {analysis['atmosphere']}/9")
+                lines.append(f"   • Эмоции: {analysis['emotional_depth']}/9")
+                lines.append(f"   • NSFW: {analysis['nsfw_quality']}/5")
+                print('\n'.join(lines))
                 return {'success': True, 'analysis': analysis, 'story': story}
             else:
-                print("❌ Пустой ответ от API")
+                lines.append("❌ Пустой ответ от API")
+                print('\n'.join(lines))
                 return {'success': False, 'error': 'Пустой ответ'}
         else:
             error_msg = f"HTTP {response.status_code}"
@@ -376,14 +402,52 @@ def run_test(test_name: str, test_data: Dict) -> Dict[str, Any]:
                 error_msg = error_data.get('error', error_msg)
             except:
                 pass
-            print(f"❌ Ошибка: {error_msg}")
+            lines.append(f"❌ Ошибка: {error_msg}")
+            print('\n'.join(lines))
             return {'success': False, 'error': error_msg}
     
     except Exception as e:
-        print(f"❌ Исключение: {str(e)}")
+        lines.append(f"❌ Исключение: {str(e)}")
+        print('\n'.join(lines))
         return {'success': False, 'error': str(e)}
 
 
+def run_suite(concurrency: int, timeout: float, repeats: int) -> List[Dict[str, Any]]:
+    """
+    Запускает все тесты параллельно (вместо очереди с паузой 2 секунды).
+    Результаты идут в порядке TESTS, повторы сценария — подряд.
+    """
+    jobs = [(test_name, test_data, repeat) for test_name, test_data in TESTS.items() for repeat in range(repeats)]
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(run_test, test_name, test_data, timeout) for test_name, test_data, _ in jobs]
+        results = []
+        for (test_name, _, repeat), future in zip(jobs, futures):
+            result = future.result()
+            result['test_name'] = test_name
+            if repeats > 1:
+                result['repeat'] = repeat + 1
+            results.append(result)
+    return results
+
+
+def scenario_stats(results: List[Dict]) -> Dict[str, Any]:
+    """Разброс оценок по повторам каждого сценария"""
+    stats = {}
+    for test_name in TESTS:
+        runs = [r for r in results if r['test_name'] == test_name]
+        scores = [r['analysis']['total_score'] for r in runs if r['success']]
+        stats[test_name] = {
+            'runs': len(runs),
+            'successful': len(scores),
+            'mean': round(statistics.mean(scores), 2) if scores else 0,
+            'stdev': round(statistics.stdev(scores), 2) if len(scores) > 1 else 0,
+            'min': min(scores) if scores else 0,
+            'max': max(scores) if scores else 0
+        }
+    return stats
+
+
 def print_detailed_report(results: List[Dict]):
     """Вывести подробный отчет"""
     print("\n" + "="*80)
@@ -412,9 +476,10 @@ def print_detailed_report(results: List[Dict]):
     
     # Детальный анализ каждого теста
     for i, result in enumerate(results):
-        test_name = list(TESTS.keys())[i]
+        test_name = result['test_name']
+        repeat = f" (повтор {result['repeat']})" if 'repeat' in result else ''
         print(f"\n{'─'*80}")
-        print(f"\n🎯 ТЕСТ {i+1}: {test_name}")
+        print(f"\n🎯 ТЕСТ {i+1}: {test_name}{repeat}")
         print(f"{'─'*40}")
         
         if not result['success']:
@@ -476,6 +541,12 @@ def print_detailed_report(results: List[Dict]):
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Глубокие тесты креативности ИИ')
+    parser.add_argument('--concurrency', type=int, default=len(TESTS), help='Сколько тестов выполнять одновременно')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help='Таймаут одного запроса, секунд')
+    parser.add_argument('--repeats', type=int, default=1, help='Повторов каждого сценария (для устойчивой статистики)')
+    args = parser.parse_args()
+    
     print("\n🚀 ЗАПУСК ГЛУБОКИХ ТЕСТОВ КРЕАТИВНОСТИ ИИ")
     print("="*80)
     print("\nПроверяем:")
@@ -486,31 +557,31 @@ def main():
     print("\nAPI: " + API_URL)
     print("="*80)
     
-    results = []
-    
-    for test_name, test_data in TESTS.items():
-        result = run_test(test_name, test_data)
-        results.append(result)
-        
-        # Пауза между запросами
-        if test_name != list(TESTS.keys())[-1]:  # Не делать паузу после последнего теста
-            print("\n⏳ Пауза 2 секунды...")
-            time.sleep(2)
+    started_at = time.time()
+    results = run_suite(args.concurrency, args.timeout, args.repeats)
+    elapsed = time.time() - started_at
     
     # Подробный отчет
     print_detailed_report(results)
+    print(f"\n⏱  Время прогона: {elapsed:.1f} с (параллельно: {args.concurrency})")
     
     # Сохранить в файл
     report_data = {
         'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
         'summary': {
-            'total_tests': len(TESTS),
+            'total_tests': len(results),
+            'elapsed_seconds': round(elapsed, 1),
             'successful': len([r for r in results if r['success']]),
             'failed': len([r for r in results if not r['success']]),
             'average_score': round(sum(r['analysis']['total_score'] for r in results if r['success']) / len([r for r in results if r['success']]), 1) if any(r['success'] for r in results) else 0
         },
         'results': results
     }
+    if args.repeats > 1:
+        report_data['scenarios'] = scenario_stats(results)
+        print(f"\n📐 РАЗБРОС ПО ПОВТОРАМ:")
+        for test_name, stats in report_data['scenarios'].items():
+            print(f"   • {test_name}: {stats['mean']} ± {stats['stdev']} (мин {stats['min']}, макс {stats['max']}, успешно {stats['successful']}/{stats['runs']})")
     
     with open('creativity-test-results.json', 'w', encoding='utf-8') as f:
         json.dump(report_data, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,72 @@
+import { useState, useEffect } from 'react';
+import { Label } from '@/components/ui/label';
+import Icon from '@/components/ui/icon';
+import func2url from '../../../backend/func2url.json';
+
+const UNIVERSES_URL = func2url['save-universe'];
+
+export interface CanonUniverse {
+  id: number;
+  name: string;
+  description?: string;
+  canon_source?: string;
+  genre?: string;
+}
+
+// Должно совпадать с opening_pool.preset_setting в ai-story: с этим сеттингом готовятся первые сцены
+export const presetSetting = (universe: CanonUniverse) => {
+  const title = universe.canon_source ? `${universe.name} (${universe.canon_source})` : universe.name;
+  const description = (universe.description || '').trim();
+  return description ? `${title}. ${description}` : title;
+};
+
+interface UniversePresetSelectorProps {
+  universeId: number | null;
+  onSelect: (universe: CanonUniverse | null) => void;
+}
+
+export const UniversePresetSelector = ({ universeId, onSelect }: UniversePresetSelectorProps) => {
+  const [universes, setUniverses] = useState<CanonUniverse[]>([]);
+
+  useEffect(() => {
+    fetch(UNIVERSES_URL)
+      .then(response => (response.ok ? response.json() : { universes: [] }))
+      .then(data => setUniverses((data.universes || []).filter((u: any) => u.source_type === 'canon')))
+      .catch(() => setUniverses([]));
+  }, []);
+
+  if (universes.length === 0) return null;
+
+  return (
+    <div className="relative p-6 rounded-xl bg-gradient-to-br from-purple-900/40 via-pink-900/30 to-purple-900/40 border border-purple-500/40 backdrop-blur-md">
+      <Label className="text-purple-100 text-base mb-2 block">
+        Каноническая вселенная
+      </Label>
+      <p className="text-xs text-purple-300/60 mb-4">
+        Заполнит название, сеттинг и жанр. Если их не менять, первая сцена будет готова сразу
+      </p>
+      <div className="grid grid-cols-2 gap-3">
+        {universes.map(universe => (
+          <button
+            key={universe.id}
+            onClick={() => onSelect(universeId === universe.id ? null : universe)}
+            className={`
+              p-3 rounded-lg border-2 transition-all text-left
+              ${
+                universeId === universe.id
+                  ? 'border-purple-400 bg-purple-500/30'
+                  : 'border-purple-500/30 bg-black/20 hover:border-purple-400/50'
+              }
+            `}
+          >
+            <Icon name="BookOpen" size={18} className="text-purple-300 mb-2" />
+            <span className="text-sm font-semibold text-purple-100 block">{universe.name}</span>
+            {universe.canon_source && (
+              <p className="text-xs text-purple-200/60 mt-1">{universe.canon_source}</p>
+            )}
+          </button>
+        ))}
+      </div>
+    </div>
+  );
+};
@@ -29,6 +29,7 @@ export interface GameSettings {
   aiModel?: 'deepseek';
   aiInstructions?: string;
   initialCharacters?: Character[];
+  universeId?: number;
   storyMemory?: {
     keyMoments: Array<{
       turn: number;
@@ -3,6 +3,7 @@ import { useNavigate, useLocation } from 'react-router-dom';
 import { useToast } from '@/hooks/use-toast';
 import { Character, Message, GameSettings, AI_STORY_URL, IMAGE_GEN_URL, SAVE_STORY_URL } from './types';
 import { useRpgGames } from '@/hooks/useRpgGames';
+import { useAuthenticatedFetch } from '@/hooks/useAuthenticatedFetch';
 
 export const useGameLogic = () => {
   const [messages, setMessages] = useState<Message[]>([]);
@@ -25,6 +26,8 @@ export const useGameLogic = () => {
   const storyInitializedRef = useRef(false);
   const timerIntervalRef = useRef<number | null>(null);
   const initializedGameIdRef = useRef<number | null>(null);
+  // Версия серверной сессии ai-story: пока она есть, на ходу уходят только gameId и действие
+  const sessionVersionRef = useRef<number | null>(null);
   
   const scrollRef = useRef<HTMLDivElement>(null);
   const inputRef = useRef<HTMLTextAreaElement>(null);
@@ -32,6 +35,8 @@ export const useGameLogic = () => {
   const location = useLocation();
   const { toast } = useToast();
   const { getGame, updateGame } = useRpgGames();
+  // Серверная сессия ai-story принадлежит пользователю: X-User-Id и X-Auth-Token на каждом ходу
+  const { fetchWithAuth } = useAuthenticatedFetch();
 
   useEffect(() => {
     const loadGameFromDB = async () => {
@@ -76,7 +81,8 @@ export const useGameLogic = () => {
           narrativeMode: settings.narrativeMode || 'third',
           playerCount: settings.playerCount || 1,
           aiInstructions: settings.aiInstructions || '',
-          initialCharacters: settings.initialCharacters || []
+          initialCharacters: settings.initialCharacters || [],
+          universeId: game.universe_id
         });
 
         if (settings.initialCharacters && settings.initialCharacters.length > 0) {
@@ -255,27 +261,37 @@ export const useGameLogic = () => {
       const controller = new AbortController();
       const timeoutId = setTimeout(() => controller.abort(), 90000);
       
-      const response = await fetch(AI_STORY_URL, {
+      const postTurn = (body: object) => fetchWithAuth(AI_STORY_URL, {
         method: 'POST',
-        headers: {
-          'Content-Type': 'application/json'
-        },
-        body: JSON.stringify({
-          action: userAction + agentPrompt,
-          settings: {
-            ...gameSettings,
-            storyMemory: currentStoryMemory
-          },
-          history: messages.map(m => ({ type: m.type, content: m.content }))
-        }),
+        body: JSON.stringify(body),
         signal: controller.signal
       });
+      const fullState = {
+        action: userAction + agentPrompt,
+        settings: {
+          ...gameSettings,
+          storyMemory: currentStoryMemory
+        },
+        history: messages.map(m => ({ type: m.type, content: m.content })),
+        gameId: currentGameId
+      };
+      
+      // История, память и персонажи уже на сервере — шлём только ход.
+      // 409 session_required: сервер сессию не нашёл, повторяем с полным состоянием
+      const compact = currentGameId !== null && sessionVersionRef.current !== null;
+      let response = await postTurn(compact
+        ? { action: userAction, agentPrompt, gameId: currentGameId, sessionVersion: sessionVersionRef.current }
+        : fullState);
+      if (compact && response.status === 409) {
+        response = await postTurn(fullState);
+      }
       
       clearTimeout(timeoutId);
 
       if (!response.ok) throw new Error('AI request failed');
 
       const data = await response.json();
+      sessionVersionRef.current = data.sessionVersion ?? null;
       
       const decisionAnalysis = data.decisionAnalysis || {};
       
@@ -338,14 +354,22 @@ export const useGameLogic = () => {
 
       if (data.characters && data.characters.length > 0) {
         setCharacters(prev => {
-          const existingNames = prev.map(c => c.name);
-          const newChars = data.characters.filter(
-            (c: Character) => !existingNames.includes(c.name)
-          );
-          return [...prev, ...newChars];
+          // Сервер присылает дельту: новых NPC и обновлённых (в т.ч. переименованных, см. previousName)
+          const merged = [...prev];
+          data.characters.forEach((c: Character & { previousName?: string }) => {
+            const idx = merged.findIndex(p => p.name === c.name || (c.previousName && p.name === c.previousName));
+            if (idx === -1) {
+              merged.push(c);
+            } else {
+              merged[idx] = { ...merged[idx], name: c.name, role: c.role, description: c.description };
+            }
+          });
+          return merged;
         });
       }
     } catch (error) {
+      // Ход мог записаться на сервере, но не дойти до клиента — следующий ход синхронизирует полное состояние
+      sessionVersionRef.current = null;
       if (error instanceof Error && error.name === 'AbortError') {
         toast({
           title: 'Время ожидания истекло',
@@ -530,15 +554,15 @@ export const useGameLogic = () => {
           ? `Начни историю в сеттинге: ${gameSettings.setting}`
           : 'Начни захватывающую историю';
 
-        const response = await fetch(AI_STORY_URL, {
+        const response = await fetchWithAuth(AI_STORY_URL, {
           method: 'POST',
-          headers: {
-            'Content-Type': 'application/json'
-          },
           body: JSON.stringify({
             action: startAction,
             settings: gameSettings,
-            history: []
+            history: [],
+            gameId: currentGameId,
+            // Игра по пресету канонической вселенной (rpg_games.universe_id): первая сцена может прийти из готового пула
+            universeId: gameSettings.universeId
           }),
           signal: abortController.signal
         });
@@ -548,6 +572,10 @@ export const useGameLogic = () => {
         if (!response.ok) throw new Error(`AI request failed: ${response.status}`);
 
         const data = await response.json();
+        sessionVersionRef.current = data.sessionVersion ?? null;
+        if (data.presetSetting) {
+          setGameSettings(prev => prev ? { ...prev, setting: data.presetSetting } : prev);
+        }
         
         const aiMessage: Message = {
           type: 'ai',
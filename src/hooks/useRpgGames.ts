@@ -17,6 +17,7 @@ export interface RpgGame {
   stats?: Record<string, any>;
   combat_log?: any[];
   player_character_id?: number;
+  universe_id?: number;
   is_favorite?: boolean;
   created_at: string;
   updated_at: string;
@@ -9,6 +9,7 @@ import { RoleSelector } from '@/components/create-game/RoleSelector';
 import { NarrativeSelector } from '@/components/create-game/NarrativeSelector';
 import { GameSettings } from '@/components/create-game/GameSettings';
 import { CharacterSelector } from '@/components/create-game/CharacterSelector';
+import { UniversePresetSelector, CanonUniverse, presetSetting } from '@/components/create-game/UniversePresetSelector';
 import { useRpgGames } from '@/hooks/useRpgGames';
 import { useAuth } from '@/contexts/AuthContext';
 
@@ -29,6 +30,7 @@ const CreateGame = () => {
   const [genres, setGenres] = useState<string[]>(['Фэнтези']);
   const [rating, setRating] = useState('18+');
   const [aiModel] = useState<'deepseek'>('deepseek');
+  const [universeId, setUniverseId] = useState<number | null>(null);
 
   const [availableCharacters, setAvailableCharacters] = useState<any[]>([]);
   const [selectedCharacterIds, setSelectedCharacterIds] = useState<number[]>([]);
@@ -68,6 +70,16 @@ const CreateGame = () => {
     setGameName(names[Math.floor(Math.random() * names.length)]);
   };
 
+  const selectUniverse = (universe: CanonUniverse | null) => {
+    setUniverseId(universe ? universe.id : null);
+    if (!universe) return;
+    setGameName(universe.name);
+    setSetting(presetSetting(universe));
+    if (universe.genre) {
+      setGenres([universe.genre]);
+    }
+  };
+
   const handleStart = async () => {
     if (!user) {
       toast({
@@ -133,7 +145,8 @@ const CreateGame = () => {
         genre: genres.join(', '),
         setting: setting,
         difficulty: rating,
-        story_context: JSON.stringify(gameSettings)
+        story_context: JSON.stringify(gameSettings),
+        universe_id: universeId ?? undefined
       });
 
       if (newGame) {
@@ -198,6 +211,11 @@ const CreateGame = () => {
         </div>
 
         <div className="space-y-6">
+          <UniversePresetSelector
+            universeId={universeId}
+            onSelect={selectUniverse}
+          />
+
           <GameNameInput 
             gameName={gameName}
             setGameName={setGameName}